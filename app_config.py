@@ -0,0 +1,27 @@
+import functools
+import os
+
+import streamlit as st
+
+# --- Static app configuration ---
+# Streamlit executes the whole script on every interaction, but imported modules run once per process.
+# Values that cannot change while the server runs are therefore resolved here, once, instead of in the scripts.
+
+API_KEY_MISSING_MESSAGE = "API Key not found. Please set GEMINI_API_KEY in .streamlit/secrets.toml or as an environment variable."
+
+
+@functools.cache
+def resolve_api_key():
+    """
+    Returns the Gemini API key from Streamlit secrets, then the GEMINI_API_KEY environment variable, or "".
+
+    Resolved once per process: the chat engine is created once with the key, so a changed secret
+    needs a server restart either way.
+    """
+    try:
+        if "GEMINI_API_KEY" in st.secrets:
+            return st.secrets["GEMINI_API_KEY"]
+    except FileNotFoundError:
+        pass  # no secrets.toml at all; fall back to the environment
+    return os.getenv("GEMINI_API_KEY", "")
+
@@ -0,0 +1,186 @@
+"""
+Measures what background turns (BackgroundLoop.start_turn) save when users do not wait for an answer.
+
+Against the mock API (see mock_gemini.py), --sessions users each send a question and, --correction-after
+seconds later while the answer is still being generated, a corrected one. Without cancellation both
+answers are generated to the end, as when a blocked script run was simply abandoned; with background
+turns the correction cancels the first answer. A second scenario starts turns that nobody follows, as
+when the page is closed, and checks that they are cancelled after TURN_ABANDON_SECONDS.
+
+Reports the answers the API generated to the end (billed), the requests aborted mid-answer, the turn
+outcomes and whether every history ends with exactly the corrected question and its answer. Prints JSON.
+
+Usage:
+    python benchmarks/cancellation.py [--sessions 50] [--correction-after 0.3] [--abandon-after 1.0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import BackgroundLoop, ChatEngine, CollectingErrorReporter, TurnTrace, runner  # noqa: E402
+from chat_engine.conversation import MODEL_ROLE, USER_ROLE  # noqa: E402
+from chat_engine.rate_limit import RateLimiter  # noqa: E402
+from chat_engine.response_cache import ResponseCache  # noqa: E402
+from chat_engine.semantic_cache import SemanticCache  # noqa: E402
+
+from common import UNLIMITED  # noqa: E402
+from mock_gemini import start_mock_server  # noqa: E402
+
+GREETING = "Hello! How can I help you today?"
+QUESTION = "Session {i}: what helps against a headache?"
+CORRECTION = "Session {i}: sorry, I meant a migraine."
+
+
+def make_engine(base_url):
+    return ChatEngine("benchmark", base_url=base_url, limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED),
+                      response_cache=ResponseCache(max_entries=0, db_path=None),
+                      semantic_cache=SemanticCache(threshold=float("inf"), directory=None))
+
+
+def history_ok(session, i):
+    """Whether the history is the greeting followed by the corrected question and its answer, and nothing else."""
+    roles = [turn.role for turn in session.messages]
+    return roles == [MODEL_ROLE, USER_ROLE, MODEL_ROLE] and session.messages[1].text == CORRECTION.format(i=i)
+
+
+def count_outcomes(traces):
+    outcomes = {}
+    for trace in traces:
+        outcomes[trace.outcome] = outcomes.get(trace.outcome, 0) + 1
+    return outcomes
+
+
+def corrections_without_cancelling(engine, loop, sessions, correction_after):
+    """Both answers of every session are consumed to the end, concurrently."""
+    traces = []
+
+    async def answer(session, text):
+        trace = TurnTrace()
+        traces.append(trace)
+        async for _ in engine.stream(session, text, trace):
+            pass
+
+    async def user(i, session):
+        first = asyncio.ensure_future(answer(session, QUESTION.format(i=i)))
+        await asyncio.sleep(correction_after)
+        await asyncio.gather(first, answer(session, CORRECTION.format(i=i)))
+
+    async def everyone():
+        await asyncio.gather(*(user(i, session) for i, session in enumerate(sessions)))
+
+    loop.run(everyone())
+    return traces
+
+
+def corrections_with_background_turns(engine, loop, sessions, correction_after):
+    """Every session starts a background turn, then a newer one that supersedes it, and follows both like a page would."""
+    traces = []
+    finished = threading.Semaphore(0)
+
+    def start(session, text):
+        trace = TurnTrace()
+        traces.append(trace)
+        return loop.start_turn(session, text, engine.stream(session, text, trace), trace, on_done=lambda turn: finished.release())
+
+    for i, session in enumerate(sessions):
+        start(session, QUESTION.format(i=i))
+    time.sleep(correction_after)
+    for i, session in enumerate(sessions):
+        start(session, CORRECTION.format(i=i))
+    # One thread per page, as Streamlit runs each session's script on its own thread
+    followers = [threading.Thread(target=session.pending_turn.wait) for session in sessions]
+    for follower in followers:
+        follower.start()
+    for follower in followers:
+        follower.join()
+    for _ in traces:
+        finished.acquire()
+    return traces
+
+
+def run_corrections(args, cancel):
+    server = start_mock_server(latency=args.latency, chunk_delay=args.chunk_delay, chunks=args.chunks)
+    loop = BackgroundLoop()
+    engine = make_engine(server.base_url)
+    try:
+        sessions = [engine.new_session("You are a medical assistant.", greeting=GREETING, reporter=CollectingErrorReporter())
+                    for _ in range(args.sessions)]
+        run = corrections_with_background_turns if cancel else corrections_without_cancelling
+        started = time.perf_counter()
+        traces = run(engine, loop, sessions, args.correction_after)
+        seconds = time.perf_counter() - started
+        time.sleep(0.2)  # let the mock notice the last closed connections
+    finally:
+        loop.run(engine.aclose())
+        server.shutdown()
+    return {
+        "seconds": round(seconds, 2),
+        "api_requests": server.stats["stream"],
+        "answers_generated_to_the_end": server.stats["stream"] - server.stats["abandoned"],
+        "aborted_mid_answer": server.stats["abandoned"],
+        "turn_outcomes": count_outcomes(traces),
+        "histories_ok": sum(history_ok(session, i) for i, session in enumerate(sessions)),
+    }
+
+
+def run_abandoned(args):
+    """Starts turns that are never followed; they should be cancelled after `--abandon-after` seconds."""
+    runner.TURN_ABANDON_SECONDS = args.abandon_after
+    server = start_mock_server(latency=args.abandon_after * 4, chunks=args.chunks)
+    loop = BackgroundLoop()
+    engine = make_engine(server.base_url)
+    try:
+        sessions = [engine.new_session("You are a medical assistant.", greeting=GREETING) for _ in range(args.sessions)]
+        turns = []
+        for i, session in enumerate(sessions):
+            trace = TurnTrace()
+            text = QUESTION.format(i=i)
+            turns.append(loop.start_turn(session, text, engine.stream(session, text, trace), trace))
+        started = time.perf_counter()
+        for turn in turns:
+            while not turn.done:
+                time.sleep(0.05)
+        seconds = time.perf_counter() - started
+    finally:
+        loop.run(engine.aclose())
+        server.shutdown()
+    return {
+        "abandon_after_s": args.abandon_after,
+        "api_latency_s": args.abandon_after * 4,
+        "cancelled": sum(turn.cancelled for turn in turns),
+        "seconds_until_all_done": round(seconds, 2),
+        "histories_unchanged": sum(len(session.messages) == 1 for session in sessions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50, help="users correcting themselves at the same time")
+    parser.add_argument("--correction-after", type=float, default=0.3, help="seconds until the correction is sent")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock API latency in seconds")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    parser.add_argument("--chunks", type=int, default=20, help="chunks per streamed answer")
+    parser.add_argument("--abandon-after", type=float, default=1.0, help="TURN_ABANDON_SECONDS for the second scenario")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "cancellation",
+        "sessions": args.sessions,
+        "corrections": {
+            "without_cancelling": run_corrections(args, cancel=False),
+            "background_turns": run_corrections(args, cancel=True),
+        },
+        "abandoned_pages": run_abandoned(args),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
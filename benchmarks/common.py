@@ -0,0 +1,42 @@
+"""
+Helpers shared by the benchmark scripts: timing and summary statistics.
+
+Not a benchmark itself. The scripts import it as `common`, which works because Python puts the
+directory of the script being run (benchmarks/) on sys.path.
+"""
+import statistics
+import time
+
+# A rate limit no benchmark reaches, for RateLimiter arguments that should not limit
+UNLIMITED = 10 ** 9
+
+
+def percentile(values, fraction):
+    """Returns the `fraction` percentile of `values` (e.g. 0.99), by rank; `values` must not be empty."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples, number):
+    """Turns per-sample totals (seconds for `number` calls) into per-call microsecond statistics."""
+    per_call = [sample / number * 1e6 for sample in samples]
+    return {"median_us": round(statistics.median(per_call), 2), "min_us": round(min(per_call), 2), "samples": len(per_call), "number": number}
+
+
+def measure(func, repeat, min_time=0.05):
+    """Times `func()`; the call count per sample is grown until a sample takes at least `min_time` seconds."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - started >= min_time or number >= 1 << 20:
+            break
+        number *= 4
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, number)
@@ -0,0 +1,115 @@
+"""
+Compares the session history as a list of Gemini-style dicts with the slotted Conversation store.
+
+For each history length, reports the memory one session's history takes on top of its message texts
+(traced with tracemalloc) and the time to build a request body for the next turn: the dict version
+estimates every message's tokens and serializes the whole payload with json.dumps, as the engine
+did before; the Conversation version uses its running token total and joins the cached JSON of the
+turns. The Conversation is also measured after a request, when the turns inside the context window
+hold their encoded JSON. Prints JSON.
+
+Usage:
+    python benchmarks/conversation_memory.py [--lengths 10 100 1000] [--repeat 7]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import Conversation, Turn  # noqa: E402
+from chat_engine.context_window import ContextWindow  # noqa: E402
+from chat_engine.conversation import request_body  # noqa: E402
+from chat_engine.prompt_cache import inline_system_instruction  # noqa: E402
+from chat_engine.prompts import get_system_prompt  # noqa: E402
+from chat_engine.tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens  # noqa: E402
+
+from common import measure  # noqa: E402
+from hot_path import instant_summarizer  # noqa: E402
+
+QUESTION = "What should I eat when I have a fever?"
+
+
+def message_texts(length):
+    """Distinct texts for an alternating model/user history with answer-sized model turns."""
+    answer = "As a General Medical Assistant, here is some advice about message {0}. " * 20
+    return [("model", answer.format(i)) if i % 2 == 0 else ("user", f"Question number {i}?") for i in range(length)]
+
+
+def traced_size(build):
+    """Returns (object, bytes allocated while building it)."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def dict_request(history, pinned, sent, fields):
+    """
+    The previous request path: token estimates for every message of the history, then json.dumps of
+    the same window the Conversation sends (`pinned` plus the last `sent` messages and the question).
+    """
+    history = history + [{"role": "user", "parts": [{"text": QUESTION}]}]
+    sum(MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message["parts"][0]["text"]) for message in history)
+    return json.dumps({"contents": pinned + history[len(history) - sent:], **fields})
+
+
+def bench(lengths, repeat):
+    fields = inline_system_instruction(get_system_prompt("English"))
+    results = []
+
+    async def run():
+        for length in lengths:
+            texts = message_texts(length)
+            dicts, dict_bytes = traced_size(lambda: [{"role": role, "parts": [{"text": text}]} for role, text in texts])
+            conversation, conversation_bytes = traced_size(lambda: Conversation(Turn(role, text) for role, text in texts))
+
+            window = ContextWindow(instant_summarizer)
+            window.build([], conversation, Turn("user", QUESTION))
+            await asyncio.sleep(0)  # let the background summary finish, as it would between turns
+
+            def conversation_request():
+                return request_body(window.build([], conversation, Turn("user", QUESTION)), fields)
+
+            _, encoded_bytes = traced_size(conversation_request)
+            contents = window.build([], conversation, Turn("user", QUESTION))
+            pinned = [contents[0].to_dict()] if window.summary else []
+            sent = len(contents) - len(pinned)
+            results.append({
+                "history_length": length,
+                "memory_bytes": {
+                    "dicts": dict_bytes,
+                    "conversation": conversation_bytes,
+                    "conversation_after_request": conversation_bytes + encoded_bytes,
+                },
+                "request_build_us": {
+                    "dicts": measure(lambda: dict_request(dicts, pinned, sent, fields), repeat)["median_us"],
+                    "conversation": measure(conversation_request, repeat)["median_us"],
+                },
+                "request_bytes": {
+                    "dicts": len(dict_request(dicts, pinned, sent, fields)),
+                    "conversation": len(conversation_request()),
+                },
+            })
+
+    asyncio.run(run())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000], help="history lengths (messages)")
+    parser.add_argument("--repeat", type=int, default=7, help="samples per measurement")
+    args = parser.parse_args()
+    print(json.dumps({"benchmark": "conversation_memory", "results": bench(args.lengths, args.repeat)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
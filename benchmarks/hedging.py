@@ -0,0 +1,118 @@
+"""
+Compares a single model endpoint with a hedged, failing-over chain of two (see chat_engine/routing.py).
+
+Two mock APIs (see mock_gemini.py) stand in for the primary and the fallback model. In the "tail"
+scenario the primary is fast but delays a fraction of its answers by a lot; in the "errors"
+scenario it answers a fraction of requests with 503. Each scenario streams --turns answers with
+--concurrency sessions at a time, once against the primary alone and once against the chain, and
+reports the time to the first chunk, the answering models, the extra requests sent and the turns
+that ended in an error. Prints JSON.
+
+Usage:
+    python benchmarks/hedging.py [--turns 200] [--concurrency 8] [--latency 0.05] [--tail-rate 0.1]
+                                 [--tail-latency 1.5] [--fallback-latency 0.08] [--error-rate 0.3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import ChatEngine, CollectingErrorReporter, TurnTrace  # noqa: E402
+from chat_engine.rate_limit import RateLimiter  # noqa: E402
+from chat_engine.response_cache import ResponseCache  # noqa: E402
+from chat_engine.semantic_cache import SemanticCache  # noqa: E402
+
+from common import UNLIMITED, percentile  # noqa: E402
+from mock_gemini import start_mock_server  # noqa: E402
+
+PRIMARY_MODEL = "gemini-2.0-flash"
+FALLBACK_MODEL = "gemini-2.0-flash-lite"
+
+
+async def run_turns(models, turns, concurrency):
+    """Streams `turns` answers; returns per-turn (seconds to first chunk, trace, failed)."""
+    engine = ChatEngine("benchmark", models=models, limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED),
+                        response_cache=ResponseCache(max_entries=0, db_path=None),
+                        semantic_cache=SemanticCache(threshold=float("inf"), directory=None))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            session = engine.new_session("You are a medical assistant.", reporter=CollectingErrorReporter())
+            trace = TurnTrace()
+            started = time.perf_counter()
+            first_chunk = None
+            async for _ in engine.stream(session, f"Question {i}: how much water should I drink?", trace):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+            return first_chunk, trace, trace.outcome != "answered"
+
+    try:
+        return await asyncio.gather(*(one(i) for i in range(turns)))
+    finally:
+        await engine.aclose()
+
+
+def summarize(results, servers):
+    first_chunks = [first_chunk for first_chunk, _, _ in results]
+    models = {}
+    for _, trace, _ in results:
+        models[trace.model] = models.get(trace.model, 0) + 1
+    requests = sum(server.stats["stream"] + server.stats["errors"] for server in servers)
+    return {
+        "first_chunk_p50_s": round(percentile(first_chunks, 0.50), 3),
+        "first_chunk_p95_s": round(percentile(first_chunks, 0.95), 3),
+        "first_chunk_p99_s": round(percentile(first_chunks, 0.99), 3),
+        "first_chunk_max_s": round(max(first_chunks), 3),
+        "answered_by": models,
+        "hedged_turns": sum(1 for _, trace, _ in results if trace.hedges),
+        "extra_requests_pct": round(100 * (requests - len(results)) / len(results), 1),
+        "failed_turns": sum(failed for _, _, failed in results),
+    }
+
+
+def run_scenario(name, primary_settings, args):
+    results = {"scenario": name}
+    for setup in ("primary_only", "chain"):
+        primary = start_mock_server(chunks=5, **primary_settings)
+        fallback = start_mock_server(chunks=5, latency=args.fallback_latency)
+        models = [(PRIMARY_MODEL, primary.base_url)]
+        if setup == "chain":
+            models.append((FALLBACK_MODEL, fallback.base_url))
+        try:
+            turns = asyncio.run(run_turns(models, args.turns, args.concurrency))
+        finally:
+            primary.shutdown()
+            fallback.shutdown()
+        results[setup] = summarize(turns, [primary, fallback])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200, help="answers streamed per setup")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions streaming at the same time")
+    parser.add_argument("--latency", type=float, default=0.05, help="primary latency in seconds")
+    parser.add_argument("--tail-rate", type=float, default=0.1, help="fraction of slow primary answers")
+    parser.add_argument("--tail-latency", type=float, default=1.5, help="latency of those, in seconds")
+    parser.add_argument("--fallback-latency", type=float, default=0.08, help="fallback latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.3, help="fraction of 503s in the errors scenario")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "hedging",
+        "results": [
+            run_scenario("tail", {"latency": args.latency, "tail_rate": args.tail_rate, "tail_latency": args.tail_latency}, args),
+            run_scenario("errors", {"latency": args.latency, "error_rate": args.error_rate}, args),
+        ],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
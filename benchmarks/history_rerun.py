@@ -0,0 +1,80 @@
+"""
+Measures how long one rerun of a bot script takes as the chat history grows.
+
+Each history length is timed twice: with every message drawn on each rerun (the old behaviour) and
+with the paged history view. Runs the script headless through Streamlit's AppTest, no server or API key needed.
+
+Usage:
+    python benchmarks/history_rerun.py [--script medical_chat_bot_ui.py] [--lengths 10 100 1000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import history_view  # noqa: E402
+from chat_engine import session_store  # noqa: E402
+
+# The scripts look conversations up in the session store by the id in the URL; the histories are put there
+STORE_PATH = os.path.join(tempfile.mkdtemp(prefix="history-rerun-"), "sessions.db")
+session_store.SESSION_STORE_URL = f"sqlite:///{STORE_PATH}"
+
+
+def make_history(length):
+    """Builds an alternating model/user history of `length` messages with answer-sized model turns."""
+    answer = "As a General Medical Assistant, here is some advice. " * 20
+    return [
+        {"role": "model" if i % 2 == 0 else "user", "parts": [{"text": answer if i % 2 == 0 else f"Question number {i}?"}]}
+        for i in range(length)
+    ]
+
+
+def time_rerun(script, length, page_size, repeat):
+    history_view.HISTORY_PAGE_SIZE = page_size
+    app = AppTest.from_file(os.path.join(ROOT, script), default_timeout=120)
+    app.secrets["GEMINI_API_KEY"] = "benchmark"
+    turns = [(message["role"], message["parts"][0]["text"]) for message in make_history(length)]
+    session_id = session_store.new_session_id()
+    session_store.SQLiteSessionStore(STORE_PATH).save(session_id, {"selected_language": "English"}, 0, turns)
+    app.query_params["session"] = session_id
+    app.run()  # first run: imports and caches are warmed up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, len(app.chat_message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--script", default="medical_chat_bot_ui.py")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    default_page_size = history_view.HISTORY_PAGE_SIZE
+    results = []
+    for length in args.lengths:
+        before_ms, before_drawn = time_rerun(args.script, length, 10 ** 9, args.repeat)
+        after_ms, after_drawn = time_rerun(args.script, length, default_page_size, args.repeat)
+        results.append({
+            "history_length": length,
+            "all_messages_ms": round(before_ms, 2),
+            "all_messages_drawn": before_drawn,
+            "paged_ms": round(after_ms, 2),
+            "paged_drawn": after_drawn,
+        })
+    print(json.dumps({"benchmark": "history_rerun", "script": args.script, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Micro-benchmarks for the request/response hot path of a chat turn.
+
+Covers building the request contents from the history, serializing the payload, parsing whole and
+streamed responses, system prompt generation, a full engine turn against the local mock API
+(see mock_gemini.py), and a rerun of the chat script at several history lengths. Prints one JSON
+document; pass an earlier result to --compare to get the change per benchmark.
+
+Usage:
+    python benchmarks/hot_path.py [--lengths 10 100 1000] [--repeat 7] [--skip-render]
+                                  [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import ChatEngine, Conversation, Turn  # noqa: E402
+from chat_engine.context_window import ContextWindow  # noqa: E402
+from chat_engine.conversation import request_body  # noqa: E402
+from chat_engine.http import aiter_stream_text, extract_text  # noqa: E402
+from chat_engine.prompt_cache import inline_system_instruction  # noqa: E402
+from chat_engine.prompts import get_system_prompt  # noqa: E402
+from chat_engine.response_cache import ResponseCache  # noqa: E402
+from chat_engine.semantic_cache import SemanticCache  # noqa: E402
+
+from common import measure, summarize  # noqa: E402
+from history_rerun import make_history  # noqa: E402
+from mock_gemini import make_answer, start_mock_server  # noqa: E402
+
+LANGUAGES = ("English", "Hindi", "Bengali")
+RESPONSE_SIZES = (500, 5000, 50000)
+
+
+# --- Timing ---
+
+async def ameasure(make_coro, repeat, number):
+    """Times `await make_coro()` `number` times per sample."""
+    await make_coro()  # warm up connections and caches
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            await make_coro()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, number)
+
+
+# --- Fixtures ---
+
+async def instant_summarizer(previous_summary, messages):
+    return "The user asked several general health questions and received general advice."
+
+
+class FakeStreamResponse:
+    """Replays a prepared SSE body in network-sized chunks, like a streamed httpx.Response."""
+
+    def __init__(self, body, chunk_size=4096):
+        self.chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def aiter_bytes(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def sse_body(answer, chunks=10):
+    size = -(-len(answer) // chunks)
+    events = [{"candidates": [{"content": {"parts": [{"text": answer[i:i + size]}], "role": "model"}}]}
+              for i in range(0, len(answer), size)]
+    return "".join(f"data: {json.dumps(event)}\r\n\r\n" for event in events).encode("utf-8")
+
+
+def uncached_engine(base_url):
+    """An engine whose response caches never hit, so every turn reaches the (mock) API."""
+    return ChatEngine("benchmark", base_url=base_url, response_cache=ResponseCache(max_entries=0, db_path=None),
+                      semantic_cache=SemanticCache(threshold=float("inf"), directory=None))
+
+
+# --- Benchmarks ---
+
+def bench_payload(lengths, repeat):
+    """
+    Context window selection and JSON serialization of the request for growing histories.
+
+    Every call gets a new user turn, as a real turn would; the earlier turns have been encoded by previous requests.
+    """
+    results = []
+
+    def new_turn():
+        return Turn("user", "What should I eat when I have a fever?")
+
+    async def run():
+        system_fields = inline_system_instruction(get_system_prompt("English"))
+        for length in lengths:
+            history = Conversation.from_dicts(make_history(length))
+            window = ContextWindow(instant_summarizer)
+            window.build([], history, new_turn())
+            await asyncio.sleep(0)  # let the background summary finish, as it would between turns
+            contents = window.build([], history, new_turn())
+            request_body(contents, system_fields)
+            results.append({"name": "payload_build", "params": {"history_length": length},
+                            **measure(lambda: window.build([], history, new_turn()), repeat)})
+
+            def serialize():
+                return request_body(contents[:-1] + [new_turn()], system_fields)
+
+            results.append({"name": "payload_serialize", "params": {"history_length": length, "bytes": len(serialize())},
+                            **measure(serialize, repeat)})
+
+    asyncio.run(run())
+    return results
+
+
+def bench_parse(repeat):
+    """Decoding whole `generateContent` responses and streamed SSE responses of several sizes."""
+    results = []
+    for chars in RESPONSE_SIZES:
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": make_answer(chars)}], "role": "model"}}]}).encode("utf-8")
+        results.append({"name": "response_parse", "params": {"response_chars": chars},
+                        **measure(lambda: extract_text(json.loads(body)), repeat)})
+
+        stream_body = sse_body(make_answer(chars))
+
+        async def parse_stream():
+            return [text async for text in aiter_stream_text(FakeStreamResponse(stream_body))]
+
+        loop = asyncio.new_event_loop()
+        try:
+            results.append({"name": "stream_parse", "params": {"response_chars": chars},
+                            **measure(lambda: loop.run_until_complete(parse_stream()), repeat)})
+        finally:
+            loop.close()
+    return results
+
+
+def bench_system_prompt(repeat):
+    return [{"name": "system_prompt", "params": {"language": language}, **measure(lambda: get_system_prompt(language), repeat)}
+            for language in LANGUAGES]
+
+
+def bench_engine(lengths, repeat, number=20):
+    """A whole turn (not recorded in the history) through the engine against the mock API with no added latency."""
+    server = start_mock_server(latency=0.0, chunk_delay=0.0, chunks=10, response_chars=1500)
+    results = []
+
+    async def run():
+        engine = uncached_engine(server.base_url)
+        try:
+            for length in lengths:
+                session = engine.new_session(get_system_prompt("English"))
+                session.messages = Conversation.from_dicts(make_history(length))
+                contents = engine._contents_for(session, Turn("user", "Is this serious?"))
+
+                async def stream_turn():
+                    return [chunk async for chunk in engine.generate_stream(session, contents)]
+
+                results.append({"name": "engine_generate", "params": {"history_length": length},
+                                **await ameasure(lambda: engine.generate(session, contents), repeat, number)})
+                results.append({"name": "engine_stream", "params": {"history_length": length},
+                                **await ameasure(stream_turn, repeat, number)})
+        finally:
+            await engine.aclose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+    return results
+
+
+def bench_render(lengths, repeat):
+    """One rerun of the chat script, drawing every message versus the paged history view."""
+    from history_rerun import time_rerun
+    import history_view
+
+    page_size = history_view.HISTORY_PAGE_SIZE
+    results = []
+    for length in lengths:
+        for mode, size in (("all_messages", 10 ** 9), ("paged", page_size)):
+            median_ms, drawn = time_rerun("medical_chat_bot_ui.py", length, size, repeat)
+            results.append({"name": "history_render", "params": {"history_length": length, "mode": mode, "drawn": drawn},
+                            "median_us": round(median_ms * 1000, 2), "samples": repeat, "number": 1})
+    history_view.HISTORY_PAGE_SIZE = page_size
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Adds the baseline median and the relative change to every result that also appears in the baseline."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    for result in results:
+        before = baseline.get((result["name"], json.dumps(result["params"], sort_keys=True)))
+        if before and before.get("median_us"):
+            result["baseline_median_us"] = before["median_us"]
+            result["change"] = round(result["median_us"] / before["median_us"] - 1, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000], help="history lengths (messages)")
+    parser.add_argument("--repeat", type=int, default=7, help="samples per benchmark")
+    parser.add_argument("--skip-render", action="store_true", help="skip the (slow) script rerun benchmark")
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--compare", help="an earlier result file to compare against")
+    args = parser.parse_args()
+
+    results = bench_payload(args.lengths, args.repeat)
+    results += bench_parse(args.repeat)
+    results += bench_system_prompt(args.repeat)
+    results += bench_engine(args.lengths, args.repeat)
+    if not args.skip_render:
+        results += bench_render(args.lengths, min(args.repeat, 5))
+    if args.compare:
+        compare(results, args.compare)
+
+    report = {
+        "benchmark": "hot_path",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Load-tests a bot script with many concurrent sessions and reports its saturation curve.
+
+For each level of --sessions, a fresh `streamlit run` worker serves the script against a local mock API
+(see mock_gemini.py), and that many simulated browsers connect to it over Streamlit's websocket protocol
+at once. (AppTest cannot stand in for the browsers: it swaps the process-wide Streamlit runtime on every
+run, so its sessions cannot run concurrently.) Every session picks its language (English, Hindi and
+Bengali in turn for the multilingual script) and sends --turns medical questions from
+triage_dataset.jsonl through the chat input, each as soon as the previous answer is complete plus
+--think-time, the way the browser does: as a rerun of the chat_turn fragment.
+
+Per level it reports the turns completed per second, the p50/p99 end-to-end turn latency (from sending
+the question to the end of the script run that shows the whole answer), the failed turns, the API
+requests (first turns can be answered from the response caches) and the resident memory of the worker
+per connected session. The saturation point is the last level before throughput stops growing by
+--min-gain or the p99 latency exceeds --max-p99-ratio times that of one session. Prints JSON; keep the
+output of each release to compare the curves.
+
+Needs the websockets package, which the app itself does not: pip install -r benchmarks/requirements.txt
+
+Usage:
+    python benchmarks/load_test.py [--scripts medical_chat_bot_ui.py medical_chat_bot_ui_multilingual.py]
+                                   [--sessions 1 2 4 8 16 32] [--turns 4] [--think-time 0] [--latency 0.5]
+                                   [--chunks 10] [--chunk-delay 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import percentile  # noqa: E402
+from mock_gemini import start_mock_server  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "triage_dataset.jsonl")
+LANGUAGES = ("English", "Hindi", "Bengali")
+WARM_UP_QUESTION = "How many hours of sleep does an adult need?"
+# ForwardMsg.script_finished values that end a run the client waits for
+RUN_FINISHED = (0, 3)  # FINISHED_SUCCESSFULLY, FINISHED_FRAGMENT_RUN_SUCCESSFULLY
+
+
+def load_questions():
+    """The medical questions of the triage dataset, by language."""
+    questions = {}
+    with open(DATASET, encoding="utf-8") as f:
+        for line in f:
+            example = json.loads(line)
+            if example["label"] == "medical":
+                questions.setdefault(example["language"], []).append(example["text"])
+    return questions
+
+
+class StreamlitWorker:
+    """A `streamlit run` server process for one script, pointed at the mock API."""
+
+    def __init__(self, script, api_url):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        env = dict(os.environ, GEMINI_API_URL=api_url, GEMINI_API_KEY="benchmark")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", script, "--server.headless", "true",
+             "--server.address", "127.0.0.1", "--server.port", str(self.port), "--server.fileWatcherType", "none",
+             "--browser.gatherUsageStats", "false"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"http://127.0.0.1:{self.port}/_stcore/health").status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"streamlit did not start serving {script}")
+
+    @property
+    def stream_url(self):
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def resident_kb(self):
+        with open(f"/proc/{self.process.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+        raise RuntimeError("VmRSS not found")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class SimulatedUser:
+    """One browser session following a scripted conversation over the websocket protocol."""
+
+    def __init__(self, worker, language, questions, timeout):
+        self.worker = worker
+        self.language = language
+        self.questions = questions
+        self.timeout = timeout
+        self.latencies = []
+        self.failures = 0
+        self._websocket = None
+        self._chat_input = None  # (widget id, fragment id) of the chat input drawn last
+
+    async def _run(self, client_state):
+        """Sends a rerun and reads the page until the run ends; returns the elements drawn."""
+        message = BackMsg()
+        message.rerun_script.CopyFrom(client_state)
+        await self._websocket.send(message.SerializeToString())
+        elements = []
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self._websocket.recv())
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                elements.append(element)
+                if element.WhichOneof("type") == "chat_input":
+                    self._chat_input = (element.chat_input.id, forward.delta.fragment_id)
+            elif kind == "script_finished" and forward.script_finished in RUN_FINISHED:
+                return elements
+
+    async def open(self):
+        self._websocket = await websockets.connect(self.worker.stream_url, subprotocols=["streamlit"], max_size=None)
+        elements = await self._run(ClientState())
+        radios = [element.radio for element in elements if element.WhichOneof("type") == "radio"]
+        buttons = [element.button for element in elements if element.WhichOneof("type") == "button"]
+        if radios and buttons:  # the multilingual language picker
+            state = ClientState()
+            radio = state.widget_states.widgets.add()
+            radio.id = radios[0].id
+            radio.string_value = self.language
+            button = state.widget_states.widgets.add()
+            button.id = buttons[0].id
+            button.trigger_value = True
+            await self._run(state)
+
+    async def ask(self, question):
+        """Sends one question through the chat input; returns whether the answer was drawn without an error."""
+        widget_id, fragment_id = self._chat_input
+        state = ClientState(fragment_id=fragment_id)
+        widget = state.widget_states.widgets.add()
+        widget.id = widget_id
+        widget.chat_input_value.data = question
+        started = time.perf_counter()
+        elements = await asyncio.wait_for(self._run(state), self.timeout)
+        self.latencies.append(time.perf_counter() - started)
+        kinds = [element.WhichOneof("type") for element in elements]
+        return "exception" not in kinds and kinds.count("markdown") >= 2 and not any(
+            element.alert.format == Alert.ERROR for element in elements if element.WhichOneof("type") == "alert")
+
+    async def converse(self, think_time):
+        for question in self.questions:
+            try:
+                if not await self.ask(question):
+                    self.failures += 1
+            except (asyncio.TimeoutError, OSError, websockets.WebSocketException):
+                self.failures += len(self.questions) - len(self.latencies)
+                return
+            await asyncio.sleep(think_time)
+
+    async def close(self):
+        if self._websocket is not None:
+            await self._websocket.close()
+
+
+async def run_level(worker, script, sessions, args):
+    """Connects `sessions` users to the worker and lets them talk at once; returns the level's measurements."""
+    questions = load_questions()
+    languages = LANGUAGES if "multilingual" in script else LANGUAGES[:1]
+    # One warm-up conversation, so that imports and process-wide resources are not counted as session memory
+    warm_up = SimulatedUser(worker, languages[0], [WARM_UP_QUESTION], args.timeout)
+    await warm_up.open()
+    await warm_up.converse(0)
+    await warm_up.close()
+    await asyncio.sleep(0.5)
+    baseline_kb = worker.resident_kb()
+
+    users = []
+    for i in range(sessions):
+        language = languages[i % len(languages)]
+        pool = questions[language]
+        users.append(SimulatedUser(worker, language, [pool[(i + turn) % len(pool)] for turn in range(args.turns)], args.timeout))
+    try:
+        await asyncio.gather(*(user.open() for user in users))  # every page is drawn; only the turns are timed
+        started = time.perf_counter()
+        await asyncio.gather(*(user.converse(args.think_time) for user in users))
+        seconds = time.perf_counter() - started
+        resident_kb = worker.resident_kb()
+    finally:
+        await asyncio.gather(*(user.close() for user in users))
+
+    latencies = [latency for user in users for latency in user.latencies]
+    failed = sum(user.failures for user in users)
+    turns = sessions * args.turns
+    return {
+        "sessions": sessions,
+        "turns": turns,
+        "failed_turns": failed,
+        "seconds": round(seconds, 2),
+        "turns_per_s": round((turns - failed) / seconds, 2),
+        "turn_latency_p50_s": round(percentile(latencies, 0.50), 3),
+        "turn_latency_p99_s": round(percentile(latencies, 0.99), 3),
+        "resident_kb_per_session": round((resident_kb - baseline_kb) / sessions),
+    }
+
+
+def measure_level(script, sessions, args):
+    """Runs one level against a fresh worker and a fresh mock API."""
+    server = start_mock_server(latency=args.latency, chunks=args.chunks, chunk_delay=args.chunk_delay)
+    worker = StreamlitWorker(script, server.base_url)
+    try:
+        result = asyncio.run(run_level(worker, script, sessions, args))
+    finally:
+        worker.stop()
+        server.shutdown()
+    # The warm-up turn is not part of the level
+    result["api_requests"] = server.stats["generate"] + server.stats["stream"] - 1
+    return result
+
+
+def saturation_point(levels, min_gain, max_p99_ratio):
+    """The session count of the last level before throughput stops growing or latency degrades."""
+    best = levels[0]
+    for previous, level in zip(levels, levels[1:]):
+        if (level["turns_per_s"] < previous["turns_per_s"] * (1 + min_gain)
+                or level["turn_latency_p99_s"] > levels[0]["turn_latency_p99_s"] * max_p99_ratio):
+            return best["sessions"]
+        best = level
+    return None  # not saturated at the highest level measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scripts", nargs="+", default=["medical_chat_bot_ui.py", "medical_chat_bot_ui_multilingual.py"])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="concurrency levels")
+    parser.add_argument("--turns", type=int, default=4, help="questions per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between an answer and the next question")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock API latency in seconds")
+    parser.add_argument("--chunks", type=int, default=10, help="chunks per streamed answer")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds a turn may take before it counts as failed")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="throughput growth below which a level saturates")
+    parser.add_argument("--max-p99-ratio", type=float, default=3.0, help="p99 latency growth at which a level saturates")
+    args = parser.parse_args()
+
+    results = []
+    for script in args.scripts:
+        levels = [measure_level(script, sessions, args) for sessions in args.sessions]
+        results.append({
+            "script": script,
+            "levels": levels,
+            "saturation_sessions": saturation_point(levels, args.min_gain, args.max_p99_ratio),
+        })
+    report = {
+        "benchmark": "load_test",
+        "turns_per_session": args.turns,
+        "think_time_s": args.think_time,
+        "mock_api": {"latency_s": args.latency, "chunks": args.chunks, "chunk_delay_s": args.chunk_delay},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Shows that startup time and memory of the multilingual bot stay flat as languages are added.
+
+For each language count, a directory of synthetic catalogs (copies of the English one with distinct
+strings) is generated, and fresh Python processes measure what the first page of a session costs:
+importing locale_catalog, listing the languages and loading the catalog of the selected one. The
+same is measured for loading every catalog up front, as the bot did with its in-code LANGUAGE_MAP.
+The import is reported separately; catalog memory is what tracemalloc sees retained after the
+import. Prints JSON.
+
+Usage:
+    python benchmarks/locale_startup.py [--languages 3 15 50 200] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from locale_catalog import LOCALES_DIR, REFERENCE_LANGUAGE, read_catalog  # noqa: E402
+
+# Runs in a fresh process with LOCALES_DIR pointing at the generated catalogs
+PROBE = """
+import json, sys, time, tracemalloc
+tracemalloc.start()
+started = time.perf_counter()
+import locale_catalog
+imported = time.perf_counter()
+base = tracemalloc.get_traced_memory()[0]
+languages = locale_catalog.available_languages()
+if sys.argv[1] == "lazy":
+    catalogs = [locale_catalog.load_catalog(languages[-1])]
+else:
+    catalogs = {language: locale_catalog.read_catalog(language) for language in languages}
+loaded = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "catalogs_ms": (loaded - imported) * 1000,
+                  "catalog_bytes": tracemalloc.get_traced_memory()[0] - base}))
+"""
+
+
+def make_catalogs(directory, count):
+    """Writes the reference catalog and `count - 1` synthetic ones to `directory`."""
+    reference = read_catalog(REFERENCE_LANGUAGE, LOCALES_DIR)
+    for i in range(count):
+        language = REFERENCE_LANGUAGE if i == 0 else f"Language{i:03d}"
+        catalog = reference if i == 0 else {key: f"{text} ({language})" for key, text in reference.items()}
+        with open(os.path.join(directory, language + ".json"), "w", encoding="utf-8") as f:
+            json.dump(catalog, f, ensure_ascii=False)
+
+
+def probe(directory, mode, repeat):
+    samples = []
+    env = {**os.environ, "LOCALES_DIR": directory, "PYTHONPATH": ROOT}
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", PROBE, mode], env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(output.stdout))
+    return {
+        "import_ms": round(statistics.median(sample["import_ms"] for sample in samples), 2),
+        "catalogs_ms": round(statistics.median(sample["catalogs_ms"] for sample in samples), 3),
+        "catalog_bytes": samples[-1]["catalog_bytes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--languages", type=int, nargs="+", default=[3, 15, 50, 200], help="numbers of catalogs")
+    parser.add_argument("--repeat", type=int, default=5, help="processes started per measurement")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.languages:
+        with tempfile.TemporaryDirectory(prefix="locales-") as directory:
+            make_catalogs(directory, count)
+            results.append({
+                "languages": count,
+                "lazy": probe(directory, "lazy", args.repeat),
+                "eager": probe(directory, "eager", args.repeat),
+            })
+    print(json.dumps({"benchmark": "locale_startup", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+A local stand-in for the Gemini REST API, for benchmarks and offline runs.
+
+Serves `generateContent`, `streamGenerateContent?alt=sse` and `cachedContents` with a configurable
+delay and answer size. The answers are filler text; request bodies are read and counted but not interpreted.
+Optionally enforces a request quota per window, answering 429 RESOURCE_EXHAUSTED beyond it like the real API,
+and delays a fraction of the answers much longer (a latency tail) for hedging and failover experiments.
+Gzipped request bodies are accepted (or refused with 415), and whole answers are gzipped for clients that
+accept it if --compress-responses is given.
+
+Usage:
+    python benchmarks/mock_gemini.py [--port 8765] [--latency 0.2] [--chunk-delay 0.02] [--chunks 10]
+                                     [--response-chars 1500] [--error-rate 0] [--quota 60 --quota-window 60]
+                                     [--tail-rate 0.05 --tail-latency 3] [--refuse-gzip] [--compress-responses]
+
+    GEMINI_API_URL=http://127.0.0.1:8765/v1beta streamlit run medical_chat_bot_ui.py
+
+From Python:
+    server = start_mock_server(latency=0.05)
+    engine = ChatEngine("key", base_url=server.base_url)
+    ...
+    server.shutdown()
+"""
+import argparse
+import collections
+import gzip
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = "Drink water regularly through the day, and more when it is hot or you are exercising. "
+DISCLAIMER = "\n\nI am an AI and cannot provide a medical diagnosis. Please consult a qualified healthcare professional."
+
+
+def make_answer(chars):
+    """Returns an answer of about `chars` characters, ending with the disclaimer like a real one."""
+    body_chars = max(0, chars - len(DISCLAIMER))
+    return (FILLER * (body_chars // len(FILLER) + 1))[:body_chars] + DISCLAIMER
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    """
+    The mock API server. Every setting can be changed while it runs.
+
+    Args:
+        address (tuple): `(host, port)` to listen on; port 0 picks a free one.
+        latency (float): Seconds before the first byte of every answer.
+        chunk_delay (float): Seconds between streamed chunks.
+        chunks (int): Number of chunks a streamed answer is split into.
+        response_chars (int): Length of every answer.
+        error_rate (float): Fraction of generate requests answered with 503 instead.
+        quota (int): Generate requests allowed per `quota_window` seconds; 0 means unlimited.
+        quota_window (float): The length of the quota window in seconds.
+        tail_rate (float): Fraction of generate requests that wait `tail_latency` instead of `latency`.
+        tail_latency (float): Seconds before the first byte of those answers.
+        accept_gzip (bool): Whether gzipped request bodies are accepted; otherwise they are answered with 415.
+        compress_responses (bool): Whether JSON answers are gzipped for clients that send Accept-Encoding: gzip.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, chunk_delay=0.0, chunks=10, response_chars=1500, error_rate=0.0,
+                 quota=0, quota_window=60.0, tail_rate=0.0, tail_latency=0.0, accept_gzip=True, compress_responses=False):
+        super().__init__(address, MockGeminiHandler)
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.response_chars = response_chars
+        self.error_rate = error_rate
+        self.quota = quota
+        self.quota_window = quota_window
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.accept_gzip = accept_gzip
+        self.compress_responses = compress_responses
+        # request_bytes and response_bytes are counted as sent over the wire, request_body_bytes after decompression
+        self.stats = {"generate": 0, "stream": 0, "cache_create": 0, "cache_extend": 0, "errors": 0, "throttled": 0,
+                      "request_bytes": 0, "request_body_bytes": 0, "response_bytes": 0, "gzip_requests": 0,
+                      "refused_gzip": 0, "tail": 0, "abandoned": 0}
+        self._recent_requests = collections.deque()
+        self._stats_lock = threading.Lock()
+        self._cache_ids = itertools.count(1)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def over_quota(self):
+        """Records a generate request; returns True if it exceeds the quota of the current window."""
+        if not self.quota:
+            return False
+        now = time.monotonic()
+        with self._stats_lock:
+            while self._recent_requests and self._recent_requests[0] <= now - self.quota_window:
+                self._recent_requests.popleft()
+            if len(self._recent_requests) >= self.quota:
+                self.stats["throttled"] += 1
+                return True
+            self._recent_requests.append(now)
+            return False
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # otherwise small writes wait ~40 ms for the client's delayed ACK
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body, status=200, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        if self.server.compress_responses and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data, mtime=0)
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.count("response_bytes", len(data))
+
+    def _write(self, data):
+        self.wfile.write(data)
+        self.server.count("response_bytes", len(data))
+
+    def _read_body(self):
+        """Returns the request body, or None after answering 415 to a compressed one that is refused."""
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.count("request_bytes", len(data))
+        if self.headers.get("Content-Encoding") == "gzip":
+            if not self.server.accept_gzip:
+                self.server.count("refused_gzip")
+                self._send_json({"error": {"code": 415, "message": "Unsupported Content-Encoding.", "status": "INVALID_ARGUMENT"}},
+                                415, {"Accept-Encoding": "identity"})
+                return None
+            self.server.count("gzip_requests")
+            data = gzip.decompress(data)
+        self.server.count("request_body_bytes", len(data))
+        return data
+
+    def do_PATCH(self):
+        if self._read_body() is None:
+            return
+        self.server.count("cache_extend")
+        self._send_json({"name": self.path.split("?")[0].split("/v1beta/", 1)[-1]})
+
+    def do_POST(self):
+        try:
+            self._answer()
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count("abandoned")  # the client gave up, e.g. a hedged request that lost
+            self.close_connection = True
+
+    def _answer(self):
+        if self._read_body() is None:
+            return
+        path = self.path.split("?")[0]
+        server = self.server
+        if path.endswith("/cachedContents"):
+            server.count("cache_create")
+            self._send_json({"name": f"cachedContents/mock-{next(server._cache_ids)}"})
+            return
+
+        if server.over_quota():
+            self._send_json({"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                                       "status": "RESOURCE_EXHAUSTED"}}, 429)
+            return
+        if random.random() < server.tail_rate:
+            server.count("tail")
+            time.sleep(server.tail_latency)
+        else:
+            time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            server.count("errors")
+            self._send_json({"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}}, 503)
+            return
+
+        answer = make_answer(server.response_chars)
+        usage = {"promptTokenCount": 100, "candidatesTokenCount": len(answer) // 4, "totalTokenCount": 100 + len(answer) // 4}
+        if path.endswith(":streamGenerateContent"):
+            server.count("stream")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            size = -(-len(answer) // max(1, server.chunks))
+            pieces = [answer[i:i + size] for i in range(0, len(answer), size)]
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(server.chunk_delay)
+                event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+                if i == len(pieces) - 1:
+                    event["usageMetadata"] = usage
+                data = f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8")
+                self._write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self._write(b"0\r\n\r\n")
+        elif path.endswith(":generateContent"):
+            server.count("generate")
+            time.sleep(server.chunk_delay * max(0, server.chunks - 1))  # the same total time as a streamed answer
+            self._send_json({
+                "candidates": [{"content": {"parts": [{"text": answer}], "role": "model"}, "finishReason": "STOP"}],
+                "usageMetadata": usage,
+            })
+        else:
+            self._send_json({"error": {"code": 404, "message": f"Unknown path {path}"}}, 404)
+
+
+def start_mock_server(host="127.0.0.1", port=0, **settings):
+    """
+    Starts a MockGeminiServer on a daemon thread.
+
+    Args:
+        host (str): The interface to listen on.
+        port (int): The port; 0 picks a free one.
+        **settings: MockGeminiServer settings (latency, chunk_delay, chunks, response_chars, error_rate,
+                    quota, quota_window, tail_rate, tail_latency).
+
+    Returns:
+        MockGeminiServer: The running server; its `base_url` is the API base URL to use.
+    """
+    server = MockGeminiServer((host, port), **settings)
+    threading.Thread(target=server.serve_forever, name="mock-gemini", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the Gemini API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first byte (default: 0.2)")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="seconds between streamed chunks (default: 0.02)")
+    parser.add_argument("--chunks", type=int, default=10, help="chunks per streamed answer (default: 10)")
+    parser.add_argument("--response-chars", type=int, default=1500, help="answer length (default: 1500)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--quota", type=int, default=0, help="requests allowed per quota window (default: unlimited)")
+    parser.add_argument("--quota-window", type=float, default=60.0, help="quota window in seconds (default: 60)")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of requests delayed by --tail-latency")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="seconds before the first byte of those")
+    parser.add_argument("--refuse-gzip", action="store_true", help="answer gzipped request bodies with 415")
+    parser.add_argument("--compress-responses", action="store_true", help="gzip JSON answers for clients that accept it")
+    args = parser.parse_args()
+
+    server = MockGeminiServer((args.host, args.port), args.latency, args.chunk_delay, args.chunks,
+                              args.response_chars, args.error_rate, args.quota, args.quota_window,
+                              args.tail_rate, args.tail_latency, not args.refuse_gzip, args.compress_responses)
+    print(f"Mock Gemini API listening on {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+A local stand-in for Redis, speaking enough of its protocol (RESP2 and RESP3) for the Redis session store.
+
+Supports strings, lists and key expiry through HELLO, PING, SELECT, CLIENT, GET, SET [EX], DEL, EXISTS,
+EXPIRE, TTL, RPUSH, LRANGE, LTRIM, LLEN, DBSIZE, FLUSHALL and MULTI/EXEC/DISCARD with WATCH/UNWATCH.
+Everything is kept in memory; there is a single database.
+
+Usage:
+    python benchmarks/mock_redis.py [--port 6380]
+
+    SESSION_STORE_URL=redis://127.0.0.1:6380/0 streamlit run medical_chat_bot_ui.py
+
+From Python:
+    server = start_mock_redis()
+    store = RedisSessionStore.from_url(server.url)
+    ...
+    server.shutdown()
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+# Commands that modify their key(s), and so abort the transactions WATCHing them
+WRITE_COMMANDS = ("SET", "DEL", "EXPIRE", "RPUSH", "LTRIM")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class MockRedisServer(socketserver.ThreadingTCPServer):
+    """
+    The mock Redis server.
+
+    Args:
+        address (tuple): `(host, port)` to listen on; port 0 picks a free one.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, MockRedisHandler)
+        self.data = {}     # key -> bytes or list of bytes
+        self.expires = {}  # key -> monotonic deadline
+        self.versions = {}  # key -> number of writes, for WATCH
+        self.lock = threading.Lock()
+        self.stats = {"commands": 0, "transactions": 0}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _live(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+        return key in self.data
+
+    def _list(self, key):
+        if not self._live(key):
+            return []
+        value = self.data[key]
+        if not isinstance(value, list):
+            raise ProtocolError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def execute(self, command, args):
+        """Runs one command under the server lock; returns the reply value."""
+        self.stats["commands"] += 1
+        if command in WRITE_COMMANDS:
+            for key in args if command == "DEL" else args[:1]:
+                self.versions[key] = self.versions.get(key, 0) + 1
+        if command == "PING":
+            return "+PONG"
+        if command in ("SELECT", "CLIENT"):
+            return "+OK"
+        if command == "GET":
+            if not self._live(args[0]):
+                return None
+            if isinstance(self.data[args[0]], list):
+                raise ProtocolError("WRONGTYPE Operation against a key holding the wrong kind of value")
+            return self.data[args[0]]
+        if command == "SET":
+            self.data[args[0]] = args[1]
+            self.expires.pop(args[0], None)
+            options = [arg.upper() for arg in args[2:]]
+            if b"EX" in options:
+                self.expires[args[0]] = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+            return "+OK"
+        if command == "DEL":
+            removed = 0
+            for key in args:
+                if self._live(key):
+                    del self.data[key]
+                    self.expires.pop(key, None)
+                    removed += 1
+            return removed
+        if command == "EXISTS":
+            return sum(1 for key in args if self._live(key))
+        if command == "EXPIRE":
+            if not self._live(args[0]):
+                return 0
+            self.expires[args[0]] = time.monotonic() + int(args[1])
+            return 1
+        if command == "TTL":
+            if not self._live(args[0]):
+                return -2
+            deadline = self.expires.get(args[0])
+            return -1 if deadline is None else int(deadline - time.monotonic())
+        if command == "RPUSH":
+            values = self._list(args[0])
+            values.extend(args[1:])
+            self.data[args[0]] = values
+            return len(values)
+        if command == "LRANGE":
+            values = self._list(args[0])
+            start, stop = int(args[1]), int(args[2])
+            stop = len(values) if stop == -1 else stop + 1
+            return values[start:stop]
+        if command == "LTRIM":
+            values = self._list(args[0])
+            start, stop = int(args[1]), int(args[2])
+            if values:
+                self.data[args[0]] = values[start:len(values) if stop == -1 else stop + 1]
+            return "+OK"
+        if command == "LLEN":
+            return len(self._list(args[0]))
+        if command == "DBSIZE":
+            return sum(1 for key in list(self.data) if self._live(key))
+        if command == "FLUSHALL":
+            for key in self.versions:
+                self.versions[key] += 1
+            self.data.clear()
+            self.expires.clear()
+            return "+OK"
+        raise ProtocolError(f"ERR unknown command '{command}'")
+
+
+def encode(value, resp3=False):
+    """Encodes a reply; strings starting with '+' are simple strings, exceptions are errors."""
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, ProtocolError):
+        return f"-{value}\r\n".encode("utf-8")
+    if isinstance(value, str):
+        return f"{value}\r\n".encode("utf-8")
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, dict):
+        items = [item for pair in value.items() for item in pair]
+        if resp3:
+            return b"%%%d\r\n" % len(value) + b"".join(encode(item, resp3) for item in items)
+        value = items
+    return b"*%d\r\n" % len(value) + b"".join(encode(item, resp3) for item in value)
+
+
+class MockRedisHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command, e.g. from telnet
+        parts = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def handle(self):
+        server = self.server
+        queued = None  # commands collected between MULTI and EXEC
+        watched = {}   # key -> its version when WATCHed; EXEC aborts if any changed
+        protocol = 2
+        while True:
+            parts = self.read_command()
+            if not parts:
+                return
+            command, args = parts[0].decode("utf-8").upper(), parts[1:]
+            if command == "HELLO":
+                requested = int(args[0]) if args else protocol
+                if requested in (2, 3):
+                    protocol = requested
+                    reply = {b"server": b"redis", b"version": b"7.2.0", b"proto": protocol, b"mode": b"standalone",
+                             b"role": b"master", b"modules": []}
+                else:
+                    reply = ProtocolError("NOPROTO unsupported protocol version")
+            elif command == "MULTI":
+                queued = []
+                reply = "+OK"
+            elif command == "WATCH" and queued is None:
+                with server.lock:
+                    watched.update((key, server.versions.get(key, 0)) for key in args)
+                reply = "+OK"
+            elif command == "DISCARD":
+                queued = None
+                watched = {}
+                reply = "+OK"
+            elif command == "UNWATCH":
+                watched = {}
+                reply = "+OK"
+            elif command == "EXEC":
+                with server.lock:
+                    server.stats["transactions"] += 1
+                    if any(server.versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = None  # aborted: a watched key was modified
+                    else:
+                        reply = []
+                        for queued_command, queued_args in queued or []:
+                            try:
+                                reply.append(server.execute(queued_command, queued_args))
+                            except ProtocolError as e:
+                                reply.append(e)
+                queued = None
+                watched = {}
+            elif queued is not None:
+                queued.append((command, args))
+                reply = "+QUEUED"
+            else:
+                try:
+                    with server.lock:
+                        reply = server.execute(command, args)
+                except ProtocolError as e:
+                    reply = e
+            self.wfile.write(encode(reply, protocol == 3))
+            self.wfile.flush()
+
+
+def start_mock_redis(host="127.0.0.1", port=0):
+    """
+    Starts a MockRedisServer on a daemon thread.
+
+    Returns:
+        MockRedisServer: The running server; its `url` is the Redis URL to use.
+    """
+    server = MockRedisServer((host, port))
+    threading.Thread(target=server.serve_forever, name="mock-redis", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for Redis.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+
+    server = MockRedisServer((args.host, args.port))
+    print(f"Mock Redis listening on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
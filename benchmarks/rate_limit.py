@@ -0,0 +1,89 @@
+"""
+Checks that the process-wide rate limiter turns a traffic spike into queueing instead of quota errors.
+
+Starts the mock API with a request quota (see mock_gemini.py) and sends one first-turn question from
+each of --sessions concurrent sessions: without effective limits, with the limiter set to the quota,
+and with the limiter set too high so that 429s have to shrink it. The quota window is shortened from
+a minute to --window seconds to keep the run short. Prints JSON and exits with status 1 if any user
+got an error with the limiter set to the quota.
+
+Usage:
+    python benchmarks/rate_limit.py [--quota 20] [--window 5] [--sessions 60] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import ChatEngine, CollectingErrorReporter  # noqa: E402
+from chat_engine.rate_limit import RateLimiter  # noqa: E402
+from chat_engine.response_cache import ResponseCache  # noqa: E402
+from chat_engine.semantic_cache import SemanticCache  # noqa: E402
+
+from common import UNLIMITED, percentile  # noqa: E402
+from mock_gemini import start_mock_server  # noqa: E402
+
+
+async def spike(base_url, limiter, sessions):
+    """Sends one question per session, all at once; returns (latencies, failed session count)."""
+    engine = ChatEngine("benchmark", base_url=base_url, limiter=limiter,
+                        response_cache=ResponseCache(max_entries=0, db_path=None),
+                        semantic_cache=SemanticCache(threshold=float("inf"), directory=None))
+
+    async def one(i):
+        session = engine.new_session("You are a medical assistant.", reporter=CollectingErrorReporter())
+        started = time.perf_counter()
+        await engine.reply(session, f"Question {i}: how much water should I drink?")
+        return time.perf_counter() - started, bool(session.reporter.drain())
+
+    try:
+        results = await asyncio.gather(*(one(i) for i in range(sessions)))
+    finally:
+        await engine.aclose()
+    return [latency for latency, _ in results], sum(failed for _, failed in results)
+
+
+def run_scenario(name, limiter, args):
+    server = start_mock_server(latency=args.latency, quota=args.quota, quota_window=args.window)
+    try:
+        latencies, failed = asyncio.run(spike(server.base_url, limiter, args.sessions))
+    finally:
+        server.shutdown()
+    return {
+        "scenario": name,
+        "sessions": args.sessions,
+        "failed": failed,
+        "upstream_429s": server.stats["throttled"],
+        "latency_p50_s": round(percentile(latencies, 0.50), 2),
+        "latency_p95_s": round(percentile(latencies, 0.95), 2),
+        "latency_max_s": round(max(latencies), 2),
+        "limiter": {key: round(value, 2) for key, value in limiter.stats.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quota", type=int, default=20, help="mock API requests per window")
+    parser.add_argument("--window", type=float, default=5, help="quota window in seconds")
+    parser.add_argument("--sessions", type=int, default=60, help="concurrent sessions in the spike")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock API latency in seconds")
+    args = parser.parse_args()
+
+    results = [
+        run_scenario("no_limit", RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, args.window), args),
+        run_scenario("rate_limited", RateLimiter(args.quota, UNLIMITED, 16, args.window), args),
+        # Configured above the real quota: the 429s have to shrink the rate adaptively
+        run_scenario("limit_too_high", RateLimiter(args.quota * 3, UNLIMITED, 16, args.window), args),
+    ]
+    report = {"benchmark": "rate_limit", "quota": args.quota, "window_s": args.window, "results": results}
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if results[1]["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
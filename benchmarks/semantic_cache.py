@@ -0,0 +1,117 @@
+"""
+Checks that the semantic cache (chat_engine/semantic_cache.py) never answers a near miss, and measures it.
+
+Near misses are prompt pairs one or two characters apart whose answers differ: another dose (500, 5000
+and 50 mg of paracetamol), another age (a 2-, 12- and 20-year-old) or a negation. Each pair is stored
+and looked up with the similarity threshold at 0, so that only the guard on numbers, units, ages and
+negations (see `guard_terms`) stands between the prompt and a wrong answer. Paraphrases are looked up
+at the configured threshold and report the hit rate. Latency is the median lookup and insert time
+with the index at --capacity entries. Prints JSON and exits with status 1 if a near miss was answered.
+
+Usage:
+    python benchmarks/semantic_cache.py [--capacity 1000] [--repeat 7]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine.semantic_cache import SEMANTIC_CACHE_THRESHOLD, SemanticCache  # noqa: E402
+
+from common import measure  # noqa: E402
+
+# (language, stored prompt, looked-up prompt): the stored answer must never be served
+NEAR_MISSES = [
+    ("English", "Is 500 mg of paracetamol safe?", "Is 5000 mg of paracetamol safe?"),
+    ("English", "Is 500 mg of paracetamol safe?", "Is 50 mg of paracetamol safe?"),
+    ("English", "Is 5000 mg of paracetamol safe?", "Is 50 mg of paracetamol safe?"),
+    ("English", "Is 500 mg of paracetamol safe?", "Is 500 mcg of paracetamol safe?"),
+    ("English", "Is 500mg of paracetamol safe?", "Is 500 ml of paracetamol safe?"),
+    ("English", "How much paracetamol for a 2-year-old?", "How much paracetamol for a 12-year-old?"),
+    ("English", "How much paracetamol for a 2-year-old?", "How much paracetamol for a 20-year-old?"),
+    ("English", "How much paracetamol for a 12-year-old?", "How much paracetamol for a 20-year-old?"),
+    ("English", "How much paracetamol for a 2 month old?", "How much paracetamol for a 2 year old?"),
+    ("English", "How much paracetamol for a baby?", "How much paracetamol for an adult?"),
+    ("English", "Can I take ibuprofen with food?", "Can I take ibuprofen without food?"),
+    ("English", "Should I take aspirin during a heart attack?", "Should I not take aspirin during a heart attack?"),
+    ("English", "Can I give my child honey?", "Can't I give my child honey?"),
+    ("English", "Can I give my child honey?", "Can I never give my child honey?"),
+    ("English", "Take one tablet twice a day?", "Take two tablets twice a day?"),
+    ("Hindi", "क्या 500 mg पैरासिटामोल सुरक्षित है?", "क्या 5000 mg पैरासिटामोल सुरक्षित है?"),
+    ("Hindi", "क्या 500 mg पैरासिटामोल सुरक्षित है?", "क्या ५० mg पैरासिटामोल सुरक्षित है?"),
+    ("Hindi", "2 साल के बच्चे को कितना पैरासिटामोल दें?", "12 साल के बच्चे को कितना पैरासिटामोल दें?"),
+    ("Hindi", "क्या खाने के साथ दवा लें?", "क्या खाने के बिना दवा लें?"),
+    ("Hindi", "क्या बच्चे को शहद दे सकते हैं?", "क्या बच्चे को शहद नहीं दे सकते हैं?"),
+    ("Bengali", "৫০০ mg প্যারাসিটামল কি নিরাপদ?", "৫০০০ mg প্যারাসিটামল কি নিরাপদ?"),
+    ("Bengali", "২ বছরের শিশুকে কত প্যারাসিটামল দেব?", "২০ বছরের শিশুকে কত প্যারাসিটামল দেব?"),
+    ("Bengali", "শিশুকে মধু দেওয়া যায়?", "শিশুকে মধু দেওয়া যায় না?"),
+]
+# (language, stored prompt, looked-up prompt): the same question, reworded
+PARAPHRASES = [
+    ("English", "What are the symptoms of dengue fever?", "what are the symptoms of dengue fever"),
+    ("English", "What are the symptoms of dengue fever?", "What are the symptoms of dengue?"),
+    ("English", "What are the symptoms of dengue fever?", "Symptoms of dengue fever?"),
+    ("English", "What are the symptoms of dengue fever?", "What are the sympotms of dengue fever?"),
+    ("English", "How can I lower my blood pressure?", "How do I lower my blood pressure?"),
+    ("English", "How can I lower my blood pressure?", "Ways to reduce high blood pressure?"),
+    ("English", "Is 500 mg of paracetamol safe?", "Is 500mg of paracetamol safe?"),
+    ("English", "How much paracetamol for a 2-year-old?", "How much paracetamol for a 2 year old?"),
+    ("Hindi", "डेंगू बुखार के लक्षण क्या हैं?", "डेंगू बुखार के लक्षण क्या है"),
+    ("Bengali", "ডেঙ্গু জ্বরের লক্ষণ কী?", "ডেঙ্গু জ্বরের লক্ষণ কি?"),
+]
+
+
+def served(stored, query, language, threshold):
+    """Stores an answer for `stored` in an empty cache; returns whether `query` gets it."""
+    cache = SemanticCache(enabled=True, threshold=threshold, directory=None)
+    cache.put(language, stored, "answer")
+    return cache.get(language, query) is not None
+
+
+def measure_latency(capacity, repeat):
+    """Median lookup and insert times, in milliseconds, with the index full."""
+    cache = SemanticCache(enabled=True, capacity=capacity, directory=None)
+    for i in range(capacity):
+        cache.put("English", f"Question {i} about symptom {i * 7919 % 104729} and medicine {i * 31}", "answer")
+    count = iter(range(capacity, 1 << 30))
+
+    def insert():
+        i = next(count)
+        cache.put("English", f"Question {i} about symptom {i * 7919 % 104729} and medicine {i * 31}", "answer")
+
+    return {
+        "lookup_ms": round(measure(lambda: cache.get("English", "What are the symptoms of dengue fever?"), repeat)["median_us"] / 1000, 3),
+        "insert_ms": round(measure(insert, repeat)["median_us"] / 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--capacity", type=int, default=1000, help="entries in the index for the latency measurement")
+    parser.add_argument("--repeat", type=int, default=7, help="samples per latency measurement")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    answered = [{"language": language, "stored": stored, "query": query}
+                for language, stored, query in NEAR_MISSES if served(stored, query, language, threshold=0.0)]
+    hits = [served(stored, query, language, SEMANTIC_CACHE_THRESHOLD) for language, stored, query in PARAPHRASES]
+    report = {
+        "benchmark": "semantic_cache",
+        "near_misses": len(NEAR_MISSES),
+        "near_misses_answered": answered,
+        "paraphrase_hit_rate": round(sum(hits) / len(hits), 2),
+        "paraphrases_missed": [query for (_, _, query), hit in zip(PARAPHRASES, hits) if not hit],
+        "threshold": SEMANTIC_CACHE_THRESHOLD,
+        "latency_at_capacity": {"entries": args.capacity, **measure_latency(args.capacity, args.repeat)},
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if answered else 0)
+
+
+if __name__ == "__main__":
+    main()
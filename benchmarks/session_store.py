@@ -0,0 +1,196 @@
+"""
+Checks the session store backends and compares appending turns with rewriting the whole history.
+
+For the memory, SQLite and Redis backends (Redis through the stand-in in mock_redis.py, or a real
+server with --redis-url), a conversation is saved turn by turn, reopened as after a restart, and
+deleted; a save from a stale turn count must be refused. Two SessionManagers on one store then
+play replicas that both add turns to a stale copy of one session: no turn may be lost. Then the
+time to save one turn is measured at several history lengths, once as a batched append of the new
+turns and once as a write of the whole history. Finally, a SessionManager with a
+short idle time shows idle sessions leaving memory and coming back lazily. Prints JSON and exits
+with status 1 if a check fails.
+
+Usage:
+    python benchmarks/session_store.py [--lengths 10 100 1000] [--repeat 20] [--redis-url redis://...]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import ChatSession, SessionConflictError  # noqa: E402
+from chat_engine.session_store import (  # noqa: E402
+    MemorySessionStore,
+    RedisSessionStore,
+    SessionManager,
+    SQLiteSessionStore,
+    new_session_id,
+)
+
+from history_rerun import make_history  # noqa: E402
+from mock_redis import start_mock_redis  # noqa: E402
+
+
+def history_pairs(length):
+    return [(message["role"], message["parts"][0]["text"]) for message in make_history(length)]
+
+
+def check_roundtrip(open_store):
+    """Saves a conversation in batches, reopens the store and reads it back; returns a list of failures."""
+    failures = []
+    turns = history_pairs(6) + [("user", "নমস্কার, আমার জ্বর হয়েছে।")]
+    session_id = new_session_id()
+    store = open_store()
+    store.save(session_id, {"selected_language": None}, 0, turns[:1])
+    store.save(session_id, {"selected_language": "Bengali"}, 1, turns[1:5])
+    store.save(session_id, {"selected_language": "Bengali"}, 5, turns[5:])
+    store.close()
+
+    store = open_store()  # as after a restart, or on another replica
+    loaded = store.load(session_id)
+    if loaded is None:
+        failures.append("saved session not found after reopening")
+    else:
+        state, loaded_turns = loaded
+        if state != {"selected_language": "Bengali"}:
+            failures.append(f"state mismatch: {state}")
+        if [tuple(turn) for turn in loaded_turns] != turns:
+            failures.append("turns mismatch")
+    try:
+        store.save(session_id, {}, 3, [("user", "rewritten")])  # as from a replica that saw only 3 turns
+        failures.append("save from a stale turn count was not refused")
+    except SessionConflictError:
+        pass
+    if [tuple(turn) for turn in store.load(session_id)[1]] != turns:
+        failures.append("refused save changed the stored turns")
+    store.delete(session_id)
+    if store.load(session_id) is not None:
+        failures.append("deleted session still loads")
+    if store.load(new_session_id()) is not None:
+        failures.append("unknown session loads")
+    store.close()
+    return failures
+
+
+def restore_empty(state):
+    return ChatSession("system prompt", context_window=None)
+
+
+def check_replicas(open_store):
+    """Two managers (replicas) add turns to one session, each from a stale copy; returns a list of failures."""
+    failures = []
+    first, second = SessionManager(open_store()), SessionManager(open_store())
+    session = first.add(restore_empty({}))
+    session.messages.append("user", "q1")
+    session.messages.append("model", "a1")
+    first.save(session)
+    on_second = second.get(session.session_id, restore_empty)
+    on_second.messages.append("user", "q2")
+    on_second.messages.append("model", "a2")
+    second.save(on_second)
+    session.messages.append("user", "q3")  # the first replica has not seen q2/a2
+    session.messages.append("model", "a3")
+    first.save(session)
+    stored = [text for _, text in first.store.load(session.session_id)[1]]
+    if stored != ["q1", "a1", "q2", "a2", "q3", "a3"]:
+        failures.append(f"replica overwrote turns: {stored}")
+    reloaded = second.get(session.session_id, restore_empty)
+    if [turn.text for turn in reloaded.messages] != stored:
+        failures.append("stale live session was not reloaded")
+    if first.get(session.session_id, restore_empty) is not session:
+        failures.append("up-to-date live session was reloaded")
+    first.discard(session.session_id)
+    first.store.close()
+    second.store.close()
+    return failures
+
+
+def time_saves(open_store, length, repeat):
+    """Median milliseconds to save one new turn pair: batched append versus writing the whole history."""
+    store = open_store()
+    turns = history_pairs(length)
+    results = {}
+    for mode in ("append", "rewrite"):
+        session_id = new_session_id()
+        store.save(session_id, {}, 0, turns)
+        saved = list(turns)
+        samples = []
+        for i in range(repeat):
+            new = [("user", f"Follow-up question {i}?"), ("model", turns[0][1])]
+            started = time.perf_counter()
+            if mode == "append":
+                store.save(session_id, {}, len(saved), new)
+            else:
+                rewritten = new_session_id()  # turns are only ever appended, so a rewrite is a new session
+                store.save(rewritten, {}, 0, saved + new)
+            samples.append(time.perf_counter() - started)
+            if mode == "rewrite":
+                store.delete(rewritten)
+            saved += new
+        results[f"{mode}_ms"] = round(statistics.median(samples) * 1000, 3)
+        store.delete(session_id)
+    store.close()
+    return results
+
+
+def check_offload():
+    """Returns (stats, failures) for a manager whose sessions go idle immediately."""
+    failures = []
+    manager = SessionManager(MemorySessionStore(), idle_seconds=0.05)
+    session = manager.add(restore_empty({}))
+    session.messages.append("user", "Is a headache after coffee normal?")
+    manager.save(session)
+    time.sleep(0.1)
+    other = manager.add(restore_empty({}))  # adding a session unloads the idle ones
+    if manager.live_count != 1:
+        failures.append(f"idle session not unloaded ({manager.live_count} live)")
+    loaded = manager.get(session.session_id, restore_empty)
+    if loaded is None or loaded is session or [turn.text for turn in loaded.messages] != [turn.text for turn in session.messages]:
+        failures.append("unloaded session did not come back from the store")
+    if manager.get(other.session_id, restore_empty) is not other:
+        failures.append("live session was reloaded instead of reused")
+    return manager.stats, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000], help="history lengths (messages)")
+    parser.add_argument("--repeat", type=int, default=20, help="saves measured per length")
+    parser.add_argument("--redis-url", help="use this Redis server instead of the local stand-in")
+    args = parser.parse_args()
+
+    redis_server = None if args.redis_url else start_mock_redis()
+    redis_url = args.redis_url or redis_server.url
+    directory = tempfile.mkdtemp(prefix="session-store-")
+    backends = {
+        "memory": lambda store=MemorySessionStore(): store,  # one instance, as "reopening" it keeps its contents
+        "sqlite": lambda: SQLiteSessionStore(os.path.join(directory, "sessions.db")),
+        "redis": lambda: RedisSessionStore.from_url(redis_url),
+    }
+    results = []
+    failed = False
+    try:
+        for name, open_store in backends.items():
+            failures = check_roundtrip(open_store) + check_replicas(open_store)
+            failed = failed or bool(failures)
+            saves = [{"history_length": length, **time_saves(open_store, length, args.repeat)} for length in args.lengths]
+            results.append({"backend": name, "failures": failures, "save_one_turn": saves})
+        offload_stats, offload_failures = check_offload()
+        failed = failed or bool(offload_failures)
+    finally:
+        if redis_server is not None:
+            redis_server.shutdown()
+    report = {"benchmark": "session_store", "results": results,
+              "offload": {"stats": offload_stats, "failures": offload_failures}}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Measures what single-flight coalescing (see chat_engine/single_flight.py) saves when a topic trends.
+
+--sessions users open the chat and send one of --topics opening questions, arriving spread evenly over
+--window seconds, against the mock API (see mock_gemini.py) with the response caches off, so that only
+coalescing can save calls. Each scenario runs with and without coalescing and reports the API requests
+sent, the turns coalesced, the latency to the first chunk (streamed) or the answer (whole) and whether
+every user received the whole answer. A last scenario streams one question to many users and cancels
+the user whose request went upstream mid-answer: the others must still get the whole answer.
+Prints JSON.
+
+Usage:
+    python benchmarks/single_flight.py [--sessions 100] [--topics 5] [--window 1.0] [--latency 0.5]
+                                       [--chunks 10] [--chunk-delay 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import ChatEngine, CollectingErrorReporter, TurnTrace  # noqa: E402
+from chat_engine.rate_limit import RateLimiter  # noqa: E402
+from chat_engine.response_cache import ResponseCache  # noqa: E402
+from chat_engine.semantic_cache import SemanticCache  # noqa: E402
+from chat_engine.single_flight import SingleFlight  # noqa: E402
+
+from common import UNLIMITED, percentile  # noqa: E402
+from mock_gemini import make_answer, start_mock_server  # noqa: E402
+
+GREETING = "Hello! I'm your Medical Assistant Bot. How can I help you today?"
+TOPICS = [
+    "Is the new flu variant dangerous for children?",
+    "What are the symptoms of dengue fever?",
+    "How can I protect myself from the heatwave?",
+    "Should I get a booster vaccine this season?",
+    "What helps against a sore throat?",
+]
+
+
+def make_engine(base_url, coalesce):
+    return ChatEngine("benchmark", base_url=base_url, limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED),
+                      response_cache=ResponseCache(max_entries=0, db_path=None),
+                      semantic_cache=SemanticCache(threshold=float("inf"), directory=None),
+                      single_flight=SingleFlight(enabled=coalesce))
+
+
+async def user(engine, i, args, stream):
+    """One user: waits for their arrival time, then sends a trending question; returns (latency, answer, trace)."""
+    await asyncio.sleep(args.window * i / args.sessions)
+    session = engine.new_session("You are a medical assistant.", greeting=GREETING, reporter=CollectingErrorReporter())
+    trace = TurnTrace()
+    question = TOPICS[i % min(args.topics, len(TOPICS))]
+    started = time.perf_counter()
+    if not stream:
+        answer = await engine.reply(session, question, trace)
+        return time.perf_counter() - started, answer, trace
+    latency = None
+    chunks = []
+    async for chunk in engine.stream(session, question, trace):
+        if latency is None:
+            latency = time.perf_counter() - started
+        chunks.append(chunk)
+    return latency, "".join(chunks), trace
+
+
+async def run_users(base_url, args, stream, coalesce):
+    engine = make_engine(base_url, coalesce)
+    try:
+        return await asyncio.gather(*(user(engine, i, args, stream) for i in range(args.sessions)))
+    finally:
+        await engine.aclose()
+
+
+def run_scenario(args, stream, coalesce):
+    server = start_mock_server(latency=args.latency, chunks=args.chunks, chunk_delay=args.chunk_delay)
+    try:
+        results = asyncio.run(run_users(server.base_url, args, stream, coalesce))
+    finally:
+        server.shutdown()
+    latencies = [latency for latency, _, _ in results]
+    expected = make_answer(server.response_chars)
+    return {
+        "api_requests": server.stats["generate"] + server.stats["stream"],
+        "coalesced_turns": sum(trace.coalesced for _, _, trace in results),
+        ("first_chunk" if stream else "answer") + "_p50_s": round(percentile(latencies, 0.50), 3),
+        ("first_chunk" if stream else "answer") + "_p99_s": round(percentile(latencies, 0.99), 3),
+        "whole_answers": sum(answer == expected for _, answer, _ in results),
+    }
+
+
+async def leader_leaves(base_url, args):
+    """Streams one question to every user and cancels the first one, whose request is the upstream one, mid-answer."""
+    engine = make_engine(base_url, coalesce=True)
+    try:
+        sessions = [engine.new_session("You are a medical assistant.", greeting=GREETING) for _ in range(args.sessions)]
+        traces = [TurnTrace() for _ in sessions]
+
+        async def consume(session, trace):
+            return "".join([chunk async for chunk in engine.stream(session, TOPICS[0], trace)])
+
+        tasks = [asyncio.ensure_future(consume(session, trace)) for session, trace in zip(sessions, traces)]
+        await asyncio.sleep(args.latency + args.chunk_delay * args.chunks / 2)
+        tasks[0].cancel()
+        answers = await asyncio.gather(*tasks, return_exceptions=True)
+        return answers, traces, engine.single_flight.stats
+    finally:
+        await engine.aclose()
+
+
+def run_leader_leaves(args):
+    server = start_mock_server(latency=args.latency, chunks=args.chunks, chunk_delay=args.chunk_delay)
+    try:
+        answers, traces, stats = asyncio.run(leader_leaves(server.base_url, args))
+    finally:
+        server.shutdown()
+    expected = make_answer(server.response_chars)
+    return {
+        "api_requests": server.stats["stream"],
+        "flights": stats["flights"],
+        "leader_cancelled": isinstance(answers[0], asyncio.CancelledError),
+        "others_with_whole_answer": sum(answer == expected for answer in answers[1:]),
+        "others": len(answers) - 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100, help="users asking within the window")
+    parser.add_argument("--topics", type=int, default=5, help=f"distinct opening questions, at most {len(TOPICS)}")
+    parser.add_argument("--window", type=float, default=1.0, help="seconds over which the users arrive")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock API latency in seconds")
+    parser.add_argument("--chunks", type=int, default=10, help="chunks per streamed answer")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="seconds between streamed chunks")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "single_flight",
+        "sessions": args.sessions,
+        "topics": min(args.topics, len(TOPICS)),
+        "window_s": args.window,
+        "results": [
+            {"mode": mode, "without_coalescing": run_scenario(args, stream, False), "coalesced": run_scenario(args, stream, True)}
+            for mode, stream in (("stream", True), ("whole", False))
+        ],
+        "leader_leaves": run_leader_leaves(args),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
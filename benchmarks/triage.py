@@ -0,0 +1,137 @@
+"""
+Measures the accuracy and latency of the local pre-filter (chat_engine/triage.py).
+
+Classifies two labelled sets (one JSON object per line with `language`, `label` and `text`) with
+off-topic refusal turned on, and reports precision and recall of the emergency and off-topic
+verdicts, overall and per language, plus the misclassified messages:
+
+    triage_dataset.jsonl  The tuning set: the messages the lexicons were written against.
+    triage_holdout.jsonl  The held-out set: never used to pick terms, so its numbers are the real ones.
+
+Do not tune the lexicons on the held-out set. When one of its messages is misclassified, add a
+similar message to the tuning set, fix the lexicon, and write fresh held-out messages.
+
+Latency is the median time to classify one message, once with the compiled trie regexes and once
+with a plain scan over every lexicon term for comparison. Prints JSON and exits with status 1 if a
+held-out medical or emergency message would have been refused as off-topic, or if held-out
+emergency recall is below --min-emergency-recall.
+
+Usage:
+    python benchmarks/triage.py [--dataset benchmarks/triage_dataset.jsonl]
+                                [--holdout benchmarks/triage_holdout.jsonl]
+                                [--min-emergency-recall 0.55] [--repeat 7]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine.response_cache import normalize_prompt  # noqa: E402
+from chat_engine.triage import EMERGENCY, LEXICONS, OFF_TOPIC, classify, lexicon_for  # noqa: E402
+
+from common import measure  # noqa: E402
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "triage_dataset.jsonl")
+HOLDOUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "triage_holdout.jsonl")
+
+
+def load_dataset(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def precision_recall(pairs, label):
+    """Precision and recall of `label` over (expected, predicted) pairs."""
+    true_positive = sum(1 for expected, predicted in pairs if expected == label and predicted == label)
+    predicted = sum(1 for _, predicted_label in pairs if predicted_label == label)
+    expected = sum(1 for expected_label, _ in pairs if expected_label == label)
+    return {
+        "precision": round(true_positive / predicted, 3) if predicted else None,
+        "recall": round(true_positive / expected, 3) if expected else None,
+        "support": expected,
+    }
+
+
+def evaluate(rows):
+    """Accuracy report of the labelled rows, classified with off-topic refusal turned on."""
+    pairs = {}
+    errors = []
+    for row in rows:
+        verdict = classify(row["text"], row["language"], refuse_off_topic=True)
+        pairs.setdefault(row["language"], []).append((row["label"], verdict.category))
+        if verdict.category != row["label"]:
+            errors.append({**row, "predicted": verdict.category, "matches": list(verdict.matches)})
+    everything = [pair for language_pairs in pairs.values() for pair in language_pairs]
+    return {
+        "messages": len(rows),
+        "accuracy": {
+            "overall": {label: precision_recall(everything, label) for label in (EMERGENCY, OFF_TOPIC)},
+            **{language: {label: precision_recall(language_pairs, label) for label in (EMERGENCY, OFF_TOPIC)}
+               for language, language_pairs in sorted(pairs.items())},
+        },
+        "wrongly_refused": sum(1 for error in errors if error["predicted"] == OFF_TOPIC),
+        "errors": errors,
+    }
+
+
+def scan_terms(text, language):
+    """The comparison: every term of the lexicons searched for separately."""
+    text = normalize_prompt(text)
+    languages = {language, "English"} & set(LEXICONS)
+    return [term for lang in languages for terms in LEXICONS[lang].values() for term in terms if term.rstrip("*") in text]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", default=DATASET, help="tuning set")
+    parser.add_argument("--holdout", default=HOLDOUT, help="held-out set the pass/fail check runs on")
+    parser.add_argument("--min-emergency-recall", type=float, default=0.55,
+                        help="lowest acceptable emergency recall on the held-out set")
+    parser.add_argument("--repeat", type=int, default=7, help="samples per latency measurement")
+    args = parser.parse_args()
+
+    rows = load_dataset(args.dataset)
+    holdout_rows = load_dataset(args.holdout)
+    started = time.perf_counter()
+    for language in {row["language"] for row in rows + holdout_rows}:
+        lexicon_for(language)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    tuning = evaluate(rows)
+    holdout = evaluate(holdout_rows)
+    emergency_recall = holdout["accuracy"]["overall"][EMERGENCY]["recall"]
+    failures = []
+    if holdout["wrongly_refused"]:
+        failures.append("held-out medical or emergency messages refused as off-topic")
+    if emergency_recall is not None and emergency_recall < args.min_emergency_recall:
+        failures.append(f"held-out emergency recall {emergency_recall} < {args.min_emergency_recall}")
+
+    def classify_all():
+        for row in rows:
+            classify(row["text"], row["language"], refuse_off_topic=True)
+
+    def scan_all():
+        for row in rows:
+            scan_terms(row["text"], row["language"])
+
+    report = {
+        "benchmark": "triage",
+        "tuning": tuning,
+        "holdout": holdout,
+        "latency_us_per_message": {
+            "trie_regex": round(measure(classify_all, args.repeat)["median_us"] / len(rows), 2),
+            "term_scan": round(measure(scan_all, args.repeat)["median_us"] / len(rows), 2),
+        },
+        "compile_ms": round(compile_ms, 2),
+        "failures": failures,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
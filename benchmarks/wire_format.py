@@ -0,0 +1,130 @@
+"""
+Measures request body encoding and the bytes on the wire per turn at several history lengths.
+
+For English, Hindi and Bengali histories (texts taken from the locale catalogs) it reports, per length:
+- the body size with \\u escapes (plain `json.dumps`, as bodies were built before) and as UTF-8;
+- the time to encode the body from scratch with each available JSON backend (see chat_engine/encoding.py);
+- the gzipped size and the time to compress at a few zlib levels;
+- the bytes a turn actually sent and received against the mock API (see mock_gemini.py), with request
+  compression off and on; the mock gzips whole answers for clients that send Accept-Encoding: gzip.
+Prints JSON.
+
+Usage:
+    python benchmarks/wire_format.py [--lengths 10 50 200] [--repeat 7]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_engine import ChatEngine, Turn, TurnTrace  # noqa: E402
+from chat_engine.encoding import COMPRESS_LEVEL, compress_body, json_backend  # noqa: E402
+from chat_engine.http import GeminiClient  # noqa: E402
+from chat_engine.prompt_cache import inline_system_instruction  # noqa: E402
+from chat_engine.prompts import get_system_prompt  # noqa: E402
+from chat_engine.rate_limit import RateLimiter  # noqa: E402
+from chat_engine.response_cache import ResponseCache  # noqa: E402
+from chat_engine.semantic_cache import SemanticCache  # noqa: E402
+from locale_catalog import load_catalog  # noqa: E402
+
+from common import UNLIMITED, measure  # noqa: E402
+from mock_gemini import start_mock_server  # noqa: E402
+
+LANGUAGES = ("English", "Hindi", "Bengali")
+GZIP_LEVELS = (1, COMPRESS_LEVEL, 9)
+
+
+def make_history(language, length):
+    """An alternating model/user history of `length` messages in `language`, with answer-sized model turns."""
+    catalog = load_catalog(language)
+    answer = f"{catalog['greeting']} {catalog['disclaimer']} {catalog['off_topic_refusal']}"
+    return [Turn("model", f"{i}. {answer}") if i % 2 == 0 else Turn("user", f"{i}. {catalog['placeholder']}")
+            for i in range(length)]
+
+
+def escaped_body(contents, fields):
+    """The body as `json.dumps` writes it by default, with every non-ASCII character as a \\u escape."""
+    return json.dumps({"contents": [turn.to_dict() for turn in contents], **fields}).encode("ascii")
+
+
+def encoder(dumps):
+    """A from-scratch encoder for the request body, built like conversation.request_body."""
+    def encode(contents, fields):
+        body = b'{"contents":[' + b",".join(dumps(turn.to_dict()) for turn in contents) + b"]"
+        return body + b"," + dumps(fields)[1:-1] + b"}"
+    return encode
+
+
+def available_backends():
+    backends = {}
+    for name in ("json", "orjson"):
+        try:
+            backends[name] = json_backend(name)[1]
+        except ImportError:
+            pass
+    return backends
+
+
+async def wire_bytes(base_url, contents, fields, language, compress):
+    """Sends one turn with `contents`; returns its traffic as the engine counted it."""
+    engine = ChatEngine("benchmark", base_url=base_url, client=GeminiClient(compress=compress),
+                        limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED),
+                        response_cache=ResponseCache(max_entries=0, db_path=None),
+                        semantic_cache=SemanticCache(threshold=float("inf"), directory=None))
+    try:
+        session = engine.new_session(fields["systemInstruction"]["parts"][0]["text"], language=language)
+        trace = TurnTrace()
+        await engine.generate(session, contents, trace)
+        return trace.traffic
+    finally:
+        await engine.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200], help="history lengths in messages")
+    parser.add_argument("--repeat", type=int, default=7, help="samples per timing")
+    args = parser.parse_args()
+
+    backends = available_backends()
+    server = start_mock_server(response_chars=3000, compress_responses=True)
+    results = []
+    try:
+        for language in LANGUAGES:
+            fields = inline_system_instruction(get_system_prompt(load_catalog(language)["model_instruction"]))
+            for length in args.lengths:
+                contents = make_history(language, length) + [Turn("user", load_catalog(language)["placeholder"])]
+                body = encoder(backends["json"])(contents, fields)
+                assert json.loads(body) == json.loads(escaped_body(contents, fields))
+                results.append({
+                    "language": language,
+                    "messages": len(contents),
+                    "body_bytes": {"escaped": len(escaped_body(contents, fields)), "utf8": len(body)},
+                    "encode_us": {
+                        "json_escaped": measure(lambda: escaped_body(contents, fields), args.repeat)["median_us"],
+                        **{name: measure(lambda: encoder(dumps)(contents, fields), args.repeat)["median_us"]
+                           for name, dumps in backends.items()},
+                    },
+                    "gzip": {
+                        f"level_{level}": {
+                            "bytes": len(compress_body(body, level)),
+                            "us": measure(lambda: compress_body(body, level), args.repeat)["median_us"],
+                        }
+                        for level in GZIP_LEVELS
+                    },
+                    "turn_traffic": {
+                        "uncompressed": asyncio.run(wire_bytes(server.base_url, contents, fields, language, False)),
+                        "gzip": asyncio.run(wire_bytes(server.base_url, contents, fields, language, True)),
+                    },
+                })
+    finally:
+        server.shutdown()
+    print(json.dumps({"benchmark": "wire_format", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Headless, asynchronous core of the Medical Assistant Bot.
+
+The Streamlit scripts are thin front-ends over this package; it can also be driven directly from
+asyncio code, e.g. for batch evaluation or benchmarks.
+"""
+from .conversation import Conversation, Turn
+from .engine import DEFAULT_ERROR_MESSAGES, ChatEngine, ChatSession
+from .errors import CircuitOpenError, CollectingErrorReporter, ErrorReporter, SessionConflictError, StreamError
+from .metrics import Metrics, TurnTrace
+from .runner import BackgroundLoop, BackgroundTurn
+
+__all__ = [
+    "BackgroundLoop",
+    "BackgroundTurn",
+    "ChatEngine",
+    "ChatSession",
+    "CircuitOpenError",
+    "CollectingErrorReporter",
+    "Conversation",
+    "DEFAULT_ERROR_MESSAGES",
+    "ErrorReporter",
+    "Metrics",
+    "SessionConflictError",
+    "StreamError",
+    "Turn",
+    "TurnTrace",
+]
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+
+from .conversation import MODEL_ROLE, Turn
+from .encoding import dumps, loads
+from .http import extract_text
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Context window configuration ---
+CONTEXT_TOKEN_BUDGET = 6000  # estimated input tokens we are willing to send per turn
+KEEP_RECENT_TURNS = 4        # the last N user turns (and the replies to them) are always sent verbatim
+SUMMARY_TOKEN_ESTIMATE = 300  # output tokens of a summary, reserved with the rate limiter
+
+SUMMARY_PROMPT = """
+Summarize the following conversation between a user and a Medical Assistant Bot so that it can be used as context for later turns.
+Keep every medically relevant detail: symptoms and their duration, age, existing conditions, medications, allergies, and the advice already given.
+Write in English, in at most 200 words, as plain sentences without headings.
+"""
+
+
+class GeminiSummarizer:
+    """
+    Folds older conversation turns into a running summary using the Gemini API.
+
+    Args:
+        client (chat_engine.http.GeminiClient): The shared HTTP client.
+        url (str): The full `generateContent` URL, including the API key.
+        limiter (RateLimiter or None): Admission control shared with the chat requests.
+    """
+
+    def __init__(self, client, url, limiter=None):
+        self.client = client
+        self.url = url
+        self.limiter = limiter
+
+    async def __call__(self, previous_summary, messages):
+        transcript = "\n".join(
+            f"{'User' if message.role == 'user' else 'Assistant'}: {message.text}"
+            for message in messages
+        )
+        prompt = SUMMARY_PROMPT
+        if previous_summary:
+            prompt += f"\nSummary of the conversation so far:\n{previous_summary}\n"
+        prompt += f"\nNew turns to fold into the summary:\n{transcript}"
+
+        body = dumps({"contents": [{"role": "user", "parts": [{"text": prompt}]}]})
+        if self.limiter is None:
+            response = await self.client.post(self.url, body)
+        else:
+            async with self.limiter.admit(estimate_tokens(prompt) + SUMMARY_TOKEN_ESTIMATE) as admission:
+                response = await self.client.post(self.url, body, readmit=lambda delay: self.limiter.readmit(admission, delay))
+        response.raise_for_status()
+        summary = extract_text(loads(response.content))
+        if not summary:
+            raise ValueError("The summary response did not contain any text.")
+        return summary.strip()
+
+
+class ContextWindow:
+    """
+    Chooses which part of a conversation is sent to the model on each turn.
+
+    The pinned messages and the most recent `keep_recent_turns` user turns are always sent.
+    Older messages are added back while they fit into `token_budget`, after the system prompt;
+    whatever does not fit is replaced by a running summary. The summary is regenerated in a background task, and only when
+    messages have dropped out of the window that the current summary does not cover yet.
+
+    One instance is kept per conversation. `build` must be called from the engine's event loop.
+    The tokens it saved are recorded on the turn's TurnTrace and add up in Metrics.
+
+    Args:
+        summarizer (callable): `async summarizer(previous_summary, messages) -> str`.
+        token_budget (int): The estimated token budget for the whole request, system prompt included.
+        keep_recent_turns (int): How many of the latest user turns are always sent verbatim.
+    """
+
+    def __init__(self, summarizer, token_budget=CONTEXT_TOKEN_BUDGET, keep_recent_turns=KEEP_RECENT_TURNS):
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summary = None
+        self.summarized_count = 0  # history messages covered by self.summary
+        self._pending = None       # (task, history count the pending summary will cover)
+        self._summary_turn = None
+        self.stats = {"full_tokens": 0, "sent_tokens": 0, "saved_tokens": 0, "total_saved_tokens": 0, "turns": 0}
+
+    def _collect_summary(self):
+        """Adopts the result of a finished background summary, if there is one."""
+        if self._pending is None or not self._pending[0].done():
+            return
+        task, covered = self._pending
+        self._pending = None
+        try:
+            self.summary = task.result()
+            self.summarized_count = covered
+        except (Exception, asyncio.CancelledError):
+            # Keep the previous summary; the next overflow will try again
+            logger.warning("Failed to summarize older conversation turns.", exc_info=True)
+
+    def _summary_message(self):
+        # Sent as a model turn so that the user/model alternation of the request is preserved
+        if self._summary_turn is None or self._summary_turn.text != self.summary:
+            self._summary_turn = Turn(MODEL_ROLE, f"Summary of our conversation so far: {self.summary}")
+        return self._summary_turn
+
+    def build(self, pinned, history, new_turn, system_tokens=0, trace=None):
+        """
+        Builds the `contents` list for the next request.
+
+        Only the turns near the end of the history are looked at; the token estimate of the rest comes
+        from the conversation's running total.
+
+        Args:
+            pinned (list): Turns that are always sent first, unchanged (e.g. fixed instructions).
+            history (Conversation): The conversation so far, oldest first.
+            new_turn (Turn): The new user message.
+            system_tokens (int): The estimated tokens of the system prompt, which is sent separately.
+            trace (TurnTrace or None): Receives the tokens of the full history, those sent and those saved.
+
+        Returns:
+            list: The Turn objects to send.
+        """
+        self._collect_summary()
+
+        pinned_tokens = sum(turn.tokens for turn in pinned)
+        turns = len(history) + 1
+
+        def turn_at(index):
+            return new_turn if index == len(history) else history[index]
+
+        # The newest `keep_recent_turns` user turns are sent no matter what
+        start = turns
+        user_turns = 0
+        used = system_tokens + pinned_tokens
+        while start > 0 and user_turns < self.keep_recent_turns:
+            start -= 1
+            turn = turn_at(start)
+            used += turn.tokens
+            if turn.role == "user":
+                user_turns += 1
+
+        # Extend further back while the budget allows, reserving room for the summary
+        summary_tokens = self._summary_message().tokens if self.summary else 0
+        while start > 0 and used + turn_at(start - 1).tokens + summary_tokens <= self.token_budget:
+            start -= 1
+            used += turn_at(start).tokens
+
+        window = list(pinned)
+        if start > 0:
+            # Messages were dropped: start on a user turn so that the summary (a model turn) is followed by one
+            while start < turns - 1 and turn_at(start).role != "user":
+                used -= turn_at(start).tokens
+                start += 1
+            if self.summary:
+                window.append(self._summary_message())
+                used += summary_tokens
+            if start > self.summarized_count and self._pending is None:
+                # The window overflowed past what the summary covers: fold the newly dropped turns in
+                dropped = list(history[self.summarized_count:start])
+                # Summarized in a background task so that the turn never waits for an extra API call
+                task = asyncio.get_running_loop().create_task(self.summarizer(self.summary, dropped))
+                self._pending = (task, start)
+            # The turns before the window are never sent again, so their encoded JSON can go
+            history.release_encoded(start)
+        window.extend(turn_at(index) for index in range(start, turns))
+
+        full_tokens = system_tokens + pinned_tokens + history.total_tokens + new_turn.tokens
+        self.stats["full_tokens"] = full_tokens
+        self.stats["sent_tokens"] = used
+        self.stats["saved_tokens"] = full_tokens - used
+        self.stats["total_saved_tokens"] += full_tokens - used
+        self.stats["turns"] += 1
+        if trace is not None:
+            trace.record_context(full_tokens, used)
+        logger.debug("Context window: sent ~%d of ~%d tokens (saved ~%d).", used, full_tokens, full_tokens - used)
+        return window
@@ -0,0 +1,135 @@
+import sys
+
+from .encoding import dumps
+from .tokens import MESSAGE_OVERHEAD_TOKENS, estimate_tokens
+
+USER_ROLE = sys.intern("user")
+MODEL_ROLE = sys.intern("model")
+
+
+class Turn:
+    """
+    One message of a conversation.
+
+    Turns are immutable once created, so their request JSON and token estimate are computed at most
+    once and reused on every later request the turn is part of.
+
+    Attributes:
+        role (str): "user" or "model" (interned, so every turn shares the same two strings).
+        text (str): The message text.
+    """
+
+    __slots__ = ("role", "text", "_json", "_tokens")
+
+    def __init__(self, role, text):
+        self.role = sys.intern(role)
+        self.text = text
+        self._json = None
+        self._tokens = None
+
+    @property
+    def json(self):
+        """The turn encoded as a Gemini `contents` entry, `{"role": ..., "parts": [{"text": ...}]}`, in UTF-8 bytes."""
+        if self._json is None:
+            self._json = dumps({"role": self.role, "parts": [{"text": self.text}]})
+        return self._json
+
+    @property
+    def tokens(self):
+        """The estimated tokens of the turn, framing included."""
+        if self._tokens is None:
+            self._tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(self.text)
+        return self._tokens
+
+    def to_dict(self):
+        return {"role": self.role, "parts": [{"text": self.text}]}
+
+    @classmethod
+    def from_dict(cls, message):
+        return cls(message["role"], "".join(part.get("text", "") for part in message["parts"]))
+
+    def __repr__(self):
+        return f"Turn({self.role!r}, {self.text[:40]!r})"
+
+
+class Conversation:
+    """
+    The append-only history of a chat session.
+
+    Holds Turn objects instead of nested dicts and keeps a running token total, so choosing the
+    context window does not have to look at the whole history. Supports `len`, indexing, slicing
+    and iteration like a list.
+    """
+
+    __slots__ = ("_turns", "_total_tokens", "_encoded_from")
+
+    def __init__(self, turns=()):
+        self._turns = []
+        self._total_tokens = 0
+        self._encoded_from = 0  # turns before this index have had their JSON released
+        for turn in turns:
+            self._append(turn)
+
+    def _append(self, turn):
+        self._turns.append(turn)
+        self._total_tokens += turn.tokens
+
+    def append(self, role, text):
+        """Adds a message and returns its Turn."""
+        turn = Turn(role, text)
+        self._append(turn)
+        return turn
+
+    def extend(self, turns):
+        for turn in turns:
+            self._append(turn)
+
+    @property
+    def total_tokens(self):
+        """The estimated tokens of the whole history."""
+        return self._total_tokens
+
+    def release_encoded(self, stop):
+        """
+        Forgets the cached request JSON of the turns before `stop`.
+
+        Called once turns have dropped out of the context window for good, so that only the turns
+        that are still sent keep their encoded copy.
+        """
+        for turn in self._turns[self._encoded_from:stop]:
+            turn._json = None
+        self._encoded_from = max(self._encoded_from, stop)
+
+    def to_dicts(self):
+        """Returns the history in Gemini's `{"role": ..., "parts": [{"text": ...}]}` format."""
+        return [turn.to_dict() for turn in self._turns]
+
+    @classmethod
+    def from_dicts(cls, messages):
+        return cls(Turn.from_dict(message) for message in messages)
+
+    def __len__(self):
+        return len(self._turns)
+
+    def __getitem__(self, index):
+        return self._turns[index]
+
+    def __iter__(self):
+        return iter(self._turns)
+
+
+def request_body(contents, fields=None):
+    """
+    Builds a generateContent request body from turns whose JSON was encoded once and cached.
+
+    Args:
+        contents (list): The Turn objects to send.
+        fields (dict or None): Further top-level request fields (e.g. `systemInstruction`).
+
+    Returns:
+        bytes: The JSON request body, UTF-8 encoded.
+    """
+    body = b'{"contents":[' + b",".join(turn.json for turn in contents) + b"]"
+    if fields:
+        body += b"," + dumps(fields)[1:-1]
+    return body + b"}"
@@ -0,0 +1,67 @@
+import gzip
+import json
+import os
+
+# --- Wire format configuration ---
+# JSON library for request bodies and API responses: "orjson" (needs `pip install orjson`), "json", or "auto"
+# for orjson when it is installed. Either way bodies are UTF-8 without \u escapes, so a Hindi or Bengali
+# character costs 3 bytes instead of 6.
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+# Set COMPRESS_REQUESTS=1 to gzip request bodies (Content-Encoding: gzip). Not every endpoint accepts
+# compressed requests; one that answers 415 gets uncompressed bodies from then on (see GeminiClient).
+COMPRESS_REQUESTS = os.getenv("COMPRESS_REQUESTS", "") == "1"
+COMPRESS_MIN_BYTES = 1024  # smaller bodies would barely shrink
+COMPRESS_LEVEL = 6         # zlib level; see benchmarks/wire_format.py for the size/time trade-off
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_backend(name=JSON_BACKEND):
+    """
+    Returns the JSON functions of a backend.
+
+    Args:
+        name (str): "orjson", "json" or "auto".
+
+    Returns:
+        tuple: `(name, dumps, loads)`; `dumps` returns compact UTF-8 bytes, `loads` takes bytes or str.
+    """
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+        except ImportError as e:
+            if name == "orjson":
+                raise ImportError("JSON_BACKEND=orjson needs the orjson package: pip install orjson") from e
+        else:
+            return "orjson", orjson.dumps, orjson.loads
+    elif name != "json":
+        raise ValueError(f"Unknown JSON_BACKEND {name!r}; use auto, orjson or json.")
+    return "json", _stdlib_dumps, json.loads
+
+
+BACKEND, dumps, loads = json_backend()
+
+
+def compress_body(data, level=COMPRESS_LEVEL):
+    """Returns `data` gzipped, with a fixed timestamp so equal bodies compress to equal bytes."""
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def encode_request(data, compress=COMPRESS_REQUESTS):
+    """
+    Prepares a request body for the wire.
+
+    Args:
+        data (bytes or str): The serialized body.
+        compress (bool): Whether to gzip it, if it is at least COMPRESS_MIN_BYTES long.
+
+    Returns:
+        tuple: `(content, headers)`; `headers` has Content-Encoding when the body was compressed.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if compress and len(data) >= COMPRESS_MIN_BYTES:
+        return compress_body(data), {"Content-Encoding": "gzip"}
+    return data, {}
@@ -0,0 +1,429 @@
+import asyncio
+import json
+import threading
+from contextlib import aclosing, asynccontextmanager
+
+import httpx
+
+from .context_window import ContextWindow, GeminiSummarizer
+from .conversation import MODEL_ROLE, USER_ROLE, Conversation, Turn
+from .encoding import loads
+from .errors import CircuitOpenError, ErrorReporter, StreamError
+from .http import API_BASE_URL, MODEL, GeminiClient, aiter_stream_text, extract_text
+from .metrics import Metrics, TurnTrace
+from .rate_limit import ANSWER_TOKEN_ESTIMATE, RateLimiter
+from .response_cache import SEMANTIC_CACHE, ResponseCache, cache_key, is_first_turn
+from .routing import MODEL_CHAIN, ModelRouter, parse_model_chain
+from .single_flight import SingleFlight, flight_key
+from .tokens import estimate_tokens
+from .triage import classify
+
+# The user-facing answers for failures, and the canned texts of the local pre-filter (see triage.py).
+# Front-ends pass localized versions of these keys.
+DEFAULT_ERROR_MESSAGES = {
+    "api_error_response": "I'm sorry, I couldn't get a clear response from the medical assistant at this moment. Please try again.",
+    "http_error": "I'm experiencing a problem connecting to the medical assistant. Please ensure your API key is correct.",
+    "connection_error": "I couldn't connect to the internet. Please check your connection.",
+    "timeout_error": "The request took too long. Please try again.",
+    "unknown_error": "An unexpected error occurred while communicating. Please try again.",
+    "json_error": "I received an unreadable response from the medical assistant. Please try again.",
+    "api_key_missing": "Error: API Key is missing. Please configure it.",
+    "off_topic_refusal": "I'm a medical assistant, so I can only help with health and medical questions. Please ask me about symptoms, conditions, medicines or general well-being.",
+    "emergency_banner": "🚑 **This may be a medical emergency.** If you or someone near you has these symptoms, call your local emergency number (112 in India) or go to the nearest emergency department now. Do not wait for this chat's answer.",
+}
+
+
+def describe_error(error):
+    """
+    Maps an exception raised while talking to the API to a log message and an error message key.
+
+    Returns:
+        tuple: (technical message for the error reporter, key into the error messages), or None if
+               the exception is not an API communication error.
+    """
+    if isinstance(error, StreamError):
+        return f"The API reported an error mid-response: {error}", "api_error_response"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"An HTTP error occurred: {error}. Response: {error.response.text}", "http_error"
+    if isinstance(error, httpx.TimeoutException):
+        return f"The request timed out: {error}", "timeout_error"
+    if isinstance(error, httpx.NetworkError):
+        return f"A connection error occurred: {error}", "connection_error"
+    if isinstance(error, (httpx.HTTPError, CircuitOpenError)):
+        return f"An unknown request error occurred: {error}", "unknown_error"
+    if isinstance(error, json.JSONDecodeError):
+        return f"Failed to parse the response (JSON error): {error}", "json_error"
+    return None
+
+
+class ChatSession:
+    """
+    One conversation: its history plus everything the engine keeps per conversation.
+
+    Create sessions with `ChatEngine.new_session`.
+
+    Attributes:
+        messages (Conversation): The history, oldest first.
+        system_prompt (str): The system instruction for this conversation.
+        system_tokens (int): The estimated tokens of `system_prompt`.
+        language (str): The language the conversation is held in; also the system prompt cache key.
+        error_messages (dict): The user-facing error answers, see DEFAULT_ERROR_MESSAGES.
+        reporter (ErrorReporter or None): Overrides the engine's error reporter for this session.
+        context_window (ContextWindow): Chooses the part of the history sent on each turn.
+        last_trace (TurnTrace or None): Timings and token counts of the latest turn.
+        queue_position (int or None): The turn's place in the rate limiter queue while it waits, otherwise None.
+        session_id (str or None): The id under which a SessionManager stores the session.
+        state (dict): Front-end settings stored with the session (e.g. the selected language).
+        saved_turns (int): How many turns of `messages` are already in the session store.
+        save_lock (threading.Lock): Held by SessionManager.save, which runs on the UI thread and the engine's executor.
+        turns_started (int): How many turns were started; a turn only commits if no newer one started since.
+        pending_turn (BackgroundTurn or None): The latest turn started with `BackgroundLoop.start_turn`.
+    """
+
+    def __init__(self, system_prompt, context_window, language="English", greeting=None, error_messages=None, reporter=None):
+        self.system_prompt = system_prompt
+        self.system_tokens = estimate_tokens(system_prompt)
+        self.context_window = context_window
+        self.language = language
+        self.error_messages = {**DEFAULT_ERROR_MESSAGES, **(error_messages or {})}
+        self.reporter = reporter
+        self.messages = Conversation()
+        self.last_trace = None
+        self.queue_position = None
+        self.session_id = None
+        self.state = {}
+        self.saved_turns = 0
+        self.save_lock = threading.Lock()
+        self.turns_started = 0
+        self.pending_turn = None
+        if greeting:
+            self.messages.append(MODEL_ROLE, greeting)
+
+
+class ChatEngine:
+    """
+    The headless medical assistant: turns a user message into a model answer.
+
+    All I/O is asynchronous, so a single event loop can serve many conversations at once without a
+    blocked thread per request. Front-ends own the presentation; the engine owns the request path
+    (context window, caches, coalescing of identical requests, system prompt caching, rate limiting,
+    retries, hedging and failover across models) and reports failures to an ErrorReporter. Create one
+    engine per process: its rate limiter and single-flight layer then cover every session.
+
+    Every user message first goes through a local keyword pre-filter (see triage.py): clearly
+    off-topic messages are refused without an API call (with TRIAGE_REFUSE_OFF_TOPIC=1), and front-ends
+    can call `triage` themselves to warn about red-flag symptoms before the answer arrives.
+
+    Usage:
+        engine = ChatEngine(api_key)
+        session = engine.new_session(system_prompt, greeting="Hello!")
+        answer = await engine.reply(session, "How do I stay hydrated?")
+        async for chunk in engine.stream(session, "And in hot weather?"):
+            ...
+
+    Args:
+        api_key (str): The Gemini API key.
+        base_url (str): The API base URL.
+        model (str): The model to generate with.
+        models (list or None): `(model, base_url)` pairs to hedge and fail over along, in order (see
+                               ModelRouter); defaults to $GEMINI_MODELS, or just `model` at `base_url`.
+        client (GeminiClient or None): The HTTP client; one is created if omitted.
+        reporter (ErrorReporter or None): Receives the technical details of failures.
+        response_cache (ResponseCache or None): Exact-match cache for first turns.
+        semantic_cache (SemanticCache or None): Nearest-neighbour cache for first turns.
+        metrics (Metrics or None): Aggregates the timings and token counts of every turn.
+        limiter (RateLimiter or None): Admission control for API requests.
+        single_flight (SingleFlight or None): Shares one API call between identical concurrent requests.
+    """
+
+    def __init__(self, api_key, base_url=API_BASE_URL, model=MODEL, client=None, reporter=None,
+                 response_cache=None, semantic_cache=None, metrics=None, limiter=None, models=None, single_flight=None):
+        self.api_key = api_key
+        self.client = client or GeminiClient()
+        self.router = ModelRouter(self.client, api_key, models or parse_model_chain(MODEL_CHAIN, base_url, model))
+        self.api_url = self.router.primary.api_url  # used for summaries, which are not latency-critical
+        self.limiter = limiter or RateLimiter()
+        self.client.on_throttled = self.limiter.throttled  # 429s shrink the allowed rate
+        self.reporter = reporter or ErrorReporter()
+        self.response_cache = response_cache or ResponseCache()
+        self._semantic_cache = semantic_cache
+        self.metrics = metrics or Metrics()
+        self.single_flight = single_flight or SingleFlight()
+
+    @property
+    def semantic_cache(self):
+        # Created on first use: it imports numpy, which would otherwise delay the first page of a new process
+        if self._semantic_cache is None:
+            from .semantic_cache import SemanticCache
+            self._semantic_cache = SemanticCache()
+        return self._semantic_cache
+
+    @property
+    def semantic_cache_enabled(self):
+        # A cache that is off by configuration is never created, so numpy is never imported for it
+        if self._semantic_cache is None:
+            return SEMANTIC_CACHE
+        return self._semantic_cache.enabled
+
+    def new_session(self, system_prompt, language="English", greeting=None, error_messages=None, reporter=None):
+        """Starts a conversation. See ChatSession for the arguments."""
+        context_window = ContextWindow(GeminiSummarizer(self.client, self.api_url, self.limiter))
+        return ChatSession(system_prompt, context_window, language, greeting, error_messages, reporter)
+
+    def _report(self, session, message):
+        (session.reporter or self.reporter).report(message)
+
+    async def _cached_answer(self, session, contents):
+        """Returns (cache key or None, cached answer or None) for the request."""
+        if not is_first_turn(contents):
+            return None, None
+        # Opening questions repeat a lot across sessions, so first turns are answered from the caches when possible:
+        # an exact match first, then a close paraphrase
+        user_text = contents[-1].text
+        key = cache_key(session.language, session.system_prompt, user_text)
+        cached = self.response_cache.get(key)
+        if cached is None and self.semantic_cache_enabled:
+            # A nearest-neighbour search takes milliseconds at full capacity: keep it off the event loop
+            cached = await asyncio.to_thread(self.semantic_cache.get, session.language, user_text)
+        return key, cached
+
+    async def _remember_answer(self, session, key, contents, answer):
+        if key:
+            self.response_cache.put(key, answer)
+            if self.semantic_cache_enabled:
+                await asyncio.to_thread(self.semantic_cache.put, session.language, contents[-1].text, answer)
+
+    @asynccontextmanager
+    async def _admitted(self, session, contents, trace):
+        """
+        Waits for the rate limiter (publishing the queue position on the session) and settles the real token usage.
+
+        Yields the coroutine function to pass as `readmit` to the router: a request answered 429 queues again.
+        """
+        tokens = session.system_tokens + sum(turn.tokens for turn in contents) + ANSWER_TOKEN_ESTIMATE
+        async with self.limiter.admit(tokens, lambda position: setattr(session, "queue_position", position)) as admission:
+            try:
+                yield lambda delay: self.limiter.readmit(admission, delay)
+            finally:
+                trace.add("queue", admission.waited)
+            admission.tokens_used = trace.tokens.get("total")
+
+    async def _fetch(self, session, contents, trace):
+        """Sends one generateContent request; returns the parsed response."""
+        async with self._admitted(session, contents, trace) as readmit:
+            response = await self.router.post(contents, session.language, session.system_prompt, trace=trace, readmit=readmit)
+            response.raise_for_status()  # Raise an HTTPStatusError for bad responses (4xx or 5xx)
+            with trace.span("parse"):
+                result = loads(response.content)
+            trace.record_usage(result.get("usageMetadata") or {})
+            return result
+
+    async def _fetch_stream(self, session, contents, trace):
+        """Sends one streamGenerateContent request; yields the pieces of the answer."""
+        async with self._admitted(session, contents, trace) as readmit:
+            response = await self.router.post(contents, session.language, session.system_prompt, stream=True, trace=trace,
+                                              readmit=readmit)
+            try:
+                response.raise_for_status()  # Raise an HTTPStatusError for bad responses (4xx or 5xx)
+                async for chunk in aiter_stream_text(response, trace):
+                    yield chunk
+            finally:
+                await response.aclose()
+
+    async def generate(self, session, contents, trace=None):
+        """
+        Sends `contents` in one request and returns the whole answer. The session history is not changed.
+
+        Args:
+            trace (TurnTrace or None): Receives the request timings, token counts and outcome.
+
+        Returns:
+            str: The generated answer, or the session's error message for the failure.
+        """
+        trace = trace or TurnTrace()
+        if not self.api_key:
+            trace.outcome = "api_key_missing"
+            return session.error_messages["api_key_missing"]
+        key, cached = await self._cached_answer(session, contents)
+        if cached is not None:
+            trace.outcome = "cached"
+            return cached
+
+        # A request identical to one in flight (the same opening question from many sessions) waits for its answer
+        flight = flight_key(session.system_prompt, contents, stream=False)
+        try:
+            result = await self.single_flight.run(flight, lambda: self._fetch(session, contents, trace), trace)
+            answer = extract_text(result)
+        except Exception as e:
+            described = describe_error(e)
+            if described is None:
+                raise
+            self._report(session, described[0])
+            trace.outcome = described[1]
+            return session.error_messages[described[1]]
+
+        if not answer:
+            self._report(session, f"Warning: Unexpected API response structure. Full response: {json.dumps(result, indent=2)}")
+            trace.outcome = "api_error_response"
+            return session.error_messages["api_error_response"]
+        if not trace.coalesced:
+            await self._remember_answer(session, key, contents, answer)
+        trace.outcome = "answered"
+        return answer
+
+    async def generate_stream(self, session, contents, trace=None):
+        """
+        Streams the answer to `contents` as it is generated. The session history is not changed.
+
+        Args:
+            trace (TurnTrace or None): Receives the request timings, token counts and outcome.
+
+        Yields:
+            str: Pieces of the answer as they arrive. If something goes wrong, the session's error
+                 message is yielded instead (appended after any text that was already received).
+        """
+        trace = trace or TurnTrace()
+        if not self.api_key:
+            trace.outcome = "api_key_missing"
+            yield session.error_messages["api_key_missing"]
+            return
+        key, cached = await self._cached_answer(session, contents)
+        if cached is not None:
+            trace.outcome = "cached"
+            yield cached
+            return
+
+        received_chunks = []
+        error_key = None
+        # A request identical to one in flight joins its stream, from the first piece
+        flight = flight_key(session.system_prompt, contents, stream=True)
+        try:
+            async with aclosing(self.single_flight.stream(flight, lambda: self._fetch_stream(session, contents, trace), trace)) as chunks:
+                async for chunk in chunks:
+                    received_chunks.append(chunk)
+                    yield chunk
+            if received_chunks:
+                if not trace.coalesced:
+                    await self._remember_answer(session, key, contents, "".join(received_chunks))
+                trace.outcome = "answered"
+            else:
+                self._report(session, "Warning: The streamed API response did not contain any text.")
+                error_key = "api_error_response"
+        except Exception as e:
+            described = describe_error(e)
+            if described is None:
+                raise
+            self._report(session, described[0])
+            error_key = described[1]
+
+        if error_key:
+            trace.outcome = error_key
+            # Keep whatever was already shown and append the error below it
+            message = session.error_messages[error_key]
+            yield f"\n\n{message}" if received_chunks else message
+
+    def triage(self, session, text, trace=None):
+        """
+        Runs the local pre-filter on a user message. Takes microseconds, so front-ends can call it
+        before `reply` or `stream` to show an emergency banner at once.
+
+        Args:
+            trace (TurnTrace or None): Receives the triage span and verdict.
+
+        Returns:
+            Triage: The verdict; pass it on to `reply` or `stream` to avoid classifying twice.
+        """
+        trace = trace or TurnTrace()
+        with trace.span("triage"):
+            verdict = classify(text, session.language)
+        trace.triage = verdict.category
+        return verdict
+
+    def _contents_for(self, session, user_turn, trace=None):
+        # Send as much recent history as fits the token budget; older turns are replaced by a running summary
+        return session.context_window.build([], session.messages, user_turn, session.system_tokens, trace)
+
+    def _start_trace(self, session, trace):
+        """Returns (trace, whether the engine records it itself) and makes it the session's latest trace."""
+        session.last_trace = trace or TurnTrace()
+        return session.last_trace, trace is None
+
+    @staticmethod
+    def _begin_turn(session):
+        """Returns the turn's ticket for `_commit`."""
+        session.turns_started += 1
+        return session.turns_started
+
+    def _commit(self, session, ticket, user_turn, answer, trace):
+        """
+        Appends the user message and the answer to the history together, unless a newer turn was started
+        meanwhile: that turn's request was built without this one, so committing it would interleave the history.
+        """
+        if ticket != session.turns_started:
+            trace.outcome = "superseded"
+            return
+        session.messages.extend([user_turn, Turn(MODEL_ROLE, answer)])
+
+    async def reply(self, session, text, trace=None, verdict=None):
+        """
+        Answers a user message and records both in the session history, unless a newer turn of the
+        session was started meanwhile.
+
+        Args:
+            trace (TurnTrace or None): A trace to fill in. The caller then adds its render time and passes
+                                       it to `metrics.record`; without one, the engine records the turn itself.
+            verdict (Triage or None): The result of `triage` for `text`, if the caller already has it.
+
+        Returns:
+            str: The answer (or the error message shown in its place).
+        """
+        trace, owned = self._start_trace(session, trace)
+        ticket = self._begin_turn(session)
+        verdict = verdict or self.triage(session, text, trace)
+        user_turn = Turn(USER_ROLE, text)
+        if verdict.off_topic:
+            trace.outcome = "off_topic"
+            answer = session.error_messages["off_topic_refusal"]
+        else:
+            with trace.span("payload_build"):
+                contents = self._contents_for(session, user_turn, trace)
+            answer = await self.generate(session, contents, trace)
+        self._commit(session, ticket, user_turn, answer, trace)
+        if owned:
+            self.metrics.record(trace)
+        return answer
+
+    async def stream(self, session, text, trace=None, verdict=None):
+        """
+        Answers a user message chunk by chunk and records both in the session history once the answer is
+        complete, as for `reply`. If the stream is closed or cancelled early, the history is not changed.
+
+        Args:
+            trace (TurnTrace or None): As for `reply`.
+            verdict (Triage or None): As for `reply`.
+
+        Yields:
+            str: Pieces of the answer as they arrive.
+        """
+        trace, owned = self._start_trace(session, trace)
+        ticket = self._begin_turn(session)
+        verdict = verdict or self.triage(session, text, trace)
+        user_turn = Turn(USER_ROLE, text)
+        chunks = []
+        if verdict.off_topic:
+            trace.outcome = "off_topic"
+            chunks.append(session.error_messages["off_topic_refusal"])
+            yield chunks[0]
+        else:
+            with trace.span("payload_build"):
+                contents = self._contents_for(session, user_turn, trace)
+            async for chunk in self.generate_stream(session, contents, trace):
+                chunks.append(chunk)
+                yield chunk
+        self._commit(session, ticket, user_turn, "".join(chunks), trace)
+        if owned:
+            self.metrics.record(trace)
+
+    async def aclose(self):
+        """Closes the HTTP client."""
+        await self.client.aclose()
@@ -0,0 +1,49 @@
+import logging
+
+logger = logging.getLogger("chat_engine")
+
+
+# --- Exceptions ---
+
+class StreamError(Exception):
+    """Raised when the Gemini API reports an error in the middle of a streamed response."""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker considers the API to be down."""
+
+
+class SessionConflictError(Exception):
+    """Raised by a session store when turns were appended to a session since the saving copy last saw it."""
+
+
+# --- Error reporters ---
+# The engine never shows errors itself. It hands the technical details of every failure to a reporter
+# and answers the user with a friendly, localized message instead.
+
+class ErrorReporter:
+    """Receives the technical details of failures. The default implementation logs them."""
+
+    def report(self, message):
+        logger.error(message)
+
+
+class CollectingErrorReporter(ErrorReporter):
+    """
+    Keeps reported errors until they are drained.
+
+    Used by front-ends that must display errors from their own thread, such as Streamlit scripts
+    (the engine runs on a background event loop where `st.error` is not available).
+    """
+
+    def __init__(self):
+        self.errors = []
+
+    def report(self, message):
+        super().report(message)
+        self.errors.append(message)
+
+    def drain(self):
+        """Returns the errors reported since the last call and forgets them."""
+        errors, self.errors = self.errors, []
+        return errors
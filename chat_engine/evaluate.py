@@ -0,0 +1,227 @@
+"""
+Runs a batch of prompts through the chat engine, for regression-testing the system prompts.
+
+Input is a JSONL file with one conversation per line:
+
+    {"id": "hydration-en", "language": "English", "prompt": "How do I stay hydrated?"}
+    {"id": "cold-hi", "language": "Hindi", "turns": ["मुझे सर्दी है", "क्या मुझे डॉक्टर को दिखाना चाहिए?"]}
+
+`language` defaults to English and selects the system prompt from `get_system_prompt`. Results are
+appended to the output JSONL as soon as each conversation completes. Ids already present in the
+output are skipped, so an interrupted run can simply be started again. The response caches are
+bypassed unless --use-cache is given, and so is the local pre-filter (see triage.py) unless --triage
+is given, so every answer comes from the model; identical prompts are not coalesced into one request
+either. Each record lists the pre-filter's verdict per turn and whether it was applied. A conversation
+that cannot be run (e.g. a line without "prompt" or "turns") is recorded as failed and the run goes on.
+
+Usage:
+    python -m chat_engine.evaluate prompts.jsonl results.jsonl [--concurrency 8] [--rate 5]
+                                   [--api-url http://127.0.0.1:8080/v1beta] [--api-key KEY] [--use-cache]
+                                   [--triage]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from .engine import ChatEngine
+from .errors import CollectingErrorReporter
+from .http import API_BASE_URL
+from .metrics import TurnTrace
+from .prompts import get_system_prompt
+from .response_cache import ResponseCache
+from .semantic_cache import SemanticCache
+from .single_flight import SingleFlight
+from .triage import MEDICAL, Triage
+
+# Passed to the engine instead of the pre-filter's verdict when the pre-filter is bypassed
+UNFILTERED = Triage(MEDICAL, {}, ())
+
+
+class RequestPacer:
+    """
+    Spaces out request starts so that no more than `rate` start per second (0 disables the limit).
+
+    Unlike the engine's RateLimiter (see rate_limit.py), which admits requests against the API quota,
+    this only paces the evaluation run itself.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+            self._next_start = max(now, self._next_start) + self.interval
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of `values` (e.g. fraction=0.95), or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def completed_ids(output_path):
+    """
+    Returns the ids already written to `output_path`.
+
+    A partially written last line (from an interrupted run) is cut off so that new results start on a fresh line.
+    """
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    ids = set()
+    for line in data.decode("utf-8").splitlines():
+        try:
+            ids.add(str(json.loads(line)["id"]))
+        except (ValueError, KeyError):
+            continue
+    return ids
+
+
+def read_items(input_path):
+    """Yields the conversations of the input file lazily, each with its `id` as a string."""
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item["id"] = str(item.get("id", line_number))
+            yield item
+
+
+async def run_item(engine, pacer, item, apply_triage=False):
+    """Runs one conversation and returns its result record, plus the latency of each request in seconds."""
+    language = item.get("language", "English")
+    reporter = CollectingErrorReporter()
+    session = engine.new_session(get_system_prompt(language), language=language, reporter=reporter)
+    turns = item.get("turns") or [item["prompt"]]
+    answers, latencies, verdicts = [], [], []
+    for text in turns:
+        await pacer.wait()
+        trace = TurnTrace()
+        verdict = engine.triage(session, text, trace)
+        verdicts.append(verdict.category)
+        started = time.perf_counter()
+        answers.append(await engine.reply(session, text, trace, verdict if apply_triage else UNFILTERED))
+        latencies.append(time.perf_counter() - started)
+    errors = reporter.drain()
+    record = {
+        "id": item["id"],
+        "language": language,
+        "turns": turns,
+        "answers": answers,
+        "latency_ms": [round(latency * 1000, 1) for latency in latencies],
+        "triage": verdicts,
+        "triage_applied": apply_triage,
+        "errors": errors,
+        "ok": not errors,
+    }
+    return record, latencies
+
+
+async def evaluate(input_path, output_path, concurrency=8, rate=0, api_url=API_BASE_URL, api_key="", use_cache=False,
+                   apply_triage=False):
+    """
+    Runs every conversation of `input_path` not yet in `output_path`, at most `concurrency` at a time.
+
+    Args:
+        apply_triage (bool): Whether the local pre-filter may answer instead of the model (off-topic refusals, with
+            TRIAGE_REFUSE_OFF_TOPIC=1).
+
+    Returns:
+        dict: The run summary (counts, throughput and latency percentiles).
+    """
+    skip_ids = completed_ids(output_path)
+    if use_cache:
+        engine = ChatEngine(api_key, base_url=api_url)
+    else:
+        engine = ChatEngine(api_key, base_url=api_url, response_cache=ResponseCache(max_entries=0, db_path=None),
+                            semantic_cache=SemanticCache(threshold=float("inf"), directory=None),
+                            single_flight=SingleFlight(enabled=False))
+    pacer = RequestPacer(rate)
+    queue = asyncio.Queue(maxsize=concurrency * 2)  # bounded, so the input is streamed rather than loaded
+    latencies = []
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+
+    async def worker(output):
+        while (item := await queue.get()) is not None:
+            try:
+                record, item_latencies = await run_item(engine, pacer, item, apply_triage)
+            except Exception as e:
+                record = {"id": item["id"], "language": item.get("language", "English"),
+                          "errors": [f"{type(e).__name__}: {e}"], "ok": False}
+                item_latencies = []
+            latencies.extend(item_latencies)
+            counts["completed"] += 1
+            counts["failed"] += not record["ok"]
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as output:
+        workers = [asyncio.create_task(worker(output)) for _ in range(concurrency)]
+        try:
+            for item in read_items(input_path):
+                if item["id"] in skip_ids:
+                    counts["skipped"] += 1  # only ids of this input count; the output may hold others
+                    continue
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await engine.aclose()
+    elapsed = time.perf_counter() - started
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        **counts,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_p50_ms": ms(percentile(latencies, 0.50)),
+        "latency_p95_ms": ms(percentile(latencies, 0.95)),
+        "latency_p99_ms": ms(percentile(latencies, 0.99)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL batch of prompts through the medical assistant.")
+    parser.add_argument("input", help="JSONL file of conversations")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations in flight at once (default: 8)")
+    parser.add_argument("--rate", type=float, default=0, help="maximum requests started per second (default: unlimited)")
+    parser.add_argument("--api-url", default=API_BASE_URL, help="API base URL (default: $GEMINI_API_URL or Google's)")
+    parser.add_argument("--api-key", default=os.getenv("GEMINI_API_KEY", ""), help="API key (default: $GEMINI_API_KEY)")
+    parser.add_argument("--use-cache", action="store_true", help="answer repeated first turns from the response caches")
+    parser.add_argument("--triage", action="store_true",
+                        help="let the local pre-filter answer prompts (off-topic refusals need TRIAGE_REFUSE_OFF_TOPIC=1)")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(evaluate(args.input, args.output, args.concurrency, args.rate, args.api_url, args.api_key,
+                                   args.use_cache, args.triage))
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from .encoding import COMPRESS_REQUESTS, encode_request, loads
+from .errors import CircuitOpenError, StreamError
+
+logger = logging.getLogger(__name__)
+
+# --- Gemini API endpoint ---
+# Set GEMINI_API_URL to point the engine at another endpoint, e.g. a local mock server for offline runs
+API_BASE_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta")
+MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+# --- HTTP client configuration ---
+CONNECT_TIMEOUT = 5      # seconds to establish the TCP+TLS connection
+READ_TIMEOUT = 60        # seconds to wait for the next byte of the response
+POOL_SIZE = 20           # keep-alive connections kept open to the API host
+MAX_RETRIES = 3          # extra attempts after the first one for retryable failures
+BACKOFF_BASE = 0.5       # seconds; doubled on every retry
+BACKOFF_MAX = 8          # seconds; upper bound for a single backoff sleep
+MAX_RETRY_AFTER = 30     # seconds; a longer Retry-After is not worth holding the user for
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BREAKER_FAILURE_THRESHOLD = 5  # consecutive upstream failures before the circuit opens
+BREAKER_RESET_TIMEOUT = 30     # seconds the circuit stays open before a trial request is let through
+
+
+# --- Response parsing ---
+
+def extract_text(result):
+    """
+    Pulls the generated text out of a Gemini response or a single streamed chunk.
+
+    Args:
+        result (dict): A decoded `generateContent` response or `streamGenerateContent` event.
+
+    Returns:
+        str or None: The text parts of the first candidate joined together, or None if there is no text.
+    """
+    candidates = result.get("candidates") or []
+    if not candidates:
+        return None
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    texts = [part["text"] for part in parts if part.get("text")]
+    return "".join(texts) if texts else None
+
+
+def iter_sse_events(lines):
+    """
+    Parses a Server-Sent Events body into JSON objects.
+
+    Args:
+        lines (iterable): The raw lines (bytes or str) of the response body, without line terminators.
+
+    Yields:
+        dict: The decoded JSON payload of each `data:` event, as soon as the event is complete.
+    """
+    data_lines = []
+    for line in lines:
+        event = _feed_sse_line(line, data_lines)
+        if event is not None:
+            yield event
+    if data_lines:
+        yield loads("\n".join(data_lines))
+
+
+def _feed_sse_line(line, data_lines):
+    """Consumes one SSE line; returns the decoded event when the line completes one, otherwise None."""
+    if isinstance(line, bytes):
+        # Decode ourselves: text/event-stream has no charset, and a Latin-1 fallback garbles Hindi and Bengali
+        line = line.decode("utf-8")
+    line = line.rstrip("\r")
+    if not line:
+        # A blank line terminates the current event
+        if data_lines:
+            event = loads("\n".join(data_lines))
+            data_lines.clear()
+            return event
+        return None
+    if line.startswith(":"):
+        return None  # SSE comment / keep-alive
+    field, _, value = line.partition(":")
+    if field == "data":
+        data_lines.append(value[1:] if value.startswith(" ") else value)
+    return None
+
+
+async def aiter_sse_events(response, trace=None):
+    """
+    Async counterpart of `iter_sse_events` reading straight from a streamed httpx response.
+
+    Args:
+        response (httpx.Response): A response opened with `stream=True`.
+        trace (TurnTrace or None): Receives the time spent parsing as its "parse" span, and the bytes received.
+
+    Yields:
+        dict: The decoded JSON payload of each `data:` event, as soon as the event is complete.
+    """
+    buffer = b""
+    data_lines = []
+    async for chunk in response.aiter_bytes():
+        started = time.perf_counter()
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        events = [event for event in (_feed_sse_line(line, data_lines) for line in lines) if event is not None]
+        if trace is not None:
+            trace.add("parse", time.perf_counter() - started)
+        for event in events:
+            yield event
+    if buffer:
+        event = _feed_sse_line(buffer, data_lines)
+        if event is not None:
+            yield event
+    if data_lines:
+        yield loads("\n".join(data_lines))
+    if trace is not None:
+        trace.add_traffic("received", response.num_bytes_downloaded)
+
+
+async def aiter_stream_text(response, trace=None):
+    """
+    Yields the generated text of a `streamGenerateContent?alt=sse` response chunk by chunk.
+
+    Args:
+        response (httpx.Response): A response opened with `stream=True`.
+        trace (TurnTrace or None): Receives the parse time and the `usageMetadata` token counts.
+
+    Yields:
+        str: Each non-empty piece of generated text, in order.
+
+    Raises:
+        StreamError: If the API sends an error event mid-stream.
+    """
+    async for event in aiter_sse_events(response, trace):
+        if trace is not None and "usageMetadata" in event:
+            trace.record_usage(event["usageMetadata"])
+        if "error" in event:
+            error = event["error"]
+            raise StreamError(error.get("message", json.dumps(error)) if isinstance(error, dict) else str(error))
+        text = extract_text(event)
+        if text:
+            yield text
+
+
+# --- Pooled HTTP client ---
+
+class CircuitBreaker:
+    """
+    Fails fast once the upstream has failed several times in a row.
+
+    After `failure_threshold` consecutive failures the circuit opens and every request is rejected
+    for `reset_timeout` seconds. After that a single trial request is let through: if it succeeds
+    the circuit closes again, otherwise it stays open for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raises CircuitOpenError if the request must not be sent."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise CircuitOpenError("The Gemini API is failing; requests are paused for a moment.")
+            self._trial_in_flight = True  # half-open: let exactly one request probe the API
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_cancelled(self):
+        """A request was abandoned before its outcome was known (e.g. it lost a hedged race): let another trial through."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header value.
+
+    Args:
+        value (str or None): Either a number of seconds or an HTTP date.
+
+    Returns:
+        float or None: The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    """Returns a "full jitter" exponential backoff delay in seconds for the given retry attempt (0-based)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+class GeminiClient:
+    """
+    A non-blocking keep-alive HTTP client for the Gemini API, meant to be created once per process.
+
+    Connections are pooled so that consecutive turns reuse the TCP+TLS connection instead of paying
+    for a new handshake. Every request has explicit connect/read timeouts, 429/5xx responses and
+    network errors are retried with jittered exponential backoff (honoring Retry-After), and a
+    circuit breaker fails fast while the upstream is down.
+
+    Request bodies can be gzipped (see encoding.py); responses are compressed whenever the server
+    agrees, since httpx asks for gzip with Accept-Encoding and decodes transparently.
+
+    The client must only be used from one event loop.
+
+    Attributes:
+        on_throttled (callable or None): Called whenever the API answers 429, e.g. `RateLimiter.throttled`.
+        compress (bool): Whether request bodies are gzipped. Turned off for good when the API answers 415.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, breaker=None, compress=COMPRESS_REQUESTS):
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.on_throttled = None
+        self.compress = compress
+        self._aborting = set()  # requests cancelled before reaching a connection, see _send
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def post(self, url, data, stream=False, trace=None, breaker=None, max_retries=None, readmit=None):
+        """
+        Sends a POST request, retrying transient failures.
+
+        Args:
+            url (str): The full request URL.
+            data (str or bytes): The serialized request body, gzipped on the way if `compress` is set.
+            stream (bool): Whether to leave the response body unread for streaming. The caller must
+                           then close the response (`await response.aclose()`).
+            trace (TurnTrace or None): Receives the connect, time-to-first-byte and download spans of the last
+                                       attempt, and the bytes sent and received by every attempt.
+            breaker (CircuitBreaker or None): The breaker of the endpoint `url` belongs to; defaults to the client's.
+            max_retries (int or None): Overrides the client's retry count, e.g. 0 when the caller fails over instead.
+            readmit (callable or None): Called with the backoff delay instead of sleeping before a 429 is resent,
+                                        so that the caller can leave its rate limiter and queue again (see
+                                        `RateLimiter.readmit`) rather than resend past the lowered rate.
+
+        Returns:
+            httpx.Response: The final response. Non-retryable error statuses, and retryable ones once
+                            the retries are exhausted, are returned as-is with their body read, for the
+                            caller to raise.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open.
+            httpx.TransportError: If the last attempt failed with a network error or timeout.
+        """
+        breaker = breaker or self.breaker
+        max_retries = self.max_retries if max_retries is None else max_retries
+        content, headers = encode_request(data, self.compress)
+        body_bytes = len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+        attempt = 0
+        while True:
+            breaker.before_request()
+            request = self.http.build_request("POST", url, content=content, headers=headers)
+            if trace is not None:
+                trace.start_attempt()
+                trace.add_traffic("body", body_bytes)
+                trace.add_traffic("sent", len(content))
+                request.extensions["trace"] = trace.on_http_event
+            try:
+                response = await self._send(request, stream)
+            except httpx.TransportError:
+                breaker.record_failure()
+                if attempt >= max_retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            except asyncio.CancelledError:
+                breaker.record_cancelled()
+                raise
+            if trace is not None and not stream:
+                trace.add_traffic("received", response.num_bytes_downloaded)
+
+            if response.status_code == 415 and headers:
+                # Unsupported Media Type: this endpoint does not take compressed bodies (RFC 7694)
+                logger.warning("The API rejected a gzipped request body; sending uncompressed bodies from now on.")
+                self.compress = False
+                breaker.record_success()
+                await response.aclose()
+                content, headers = encode_request(data, compress=False)
+                continue
+
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                # A 429 means we are over quota, not that the API is down
+                breaker.record_success()
+                if response.status_code == 429 and self.on_throttled is not None:
+                    self.on_throttled()
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                if stream and response.status_code >= 400:
+                    await self._read_error(response, trace)  # so that the caller can show the error body
+                return response
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = backoff_delay(attempt)
+            elif delay > MAX_RETRY_AFTER:
+                if stream:
+                    await self._read_error(response, trace)
+                return response
+            await response.aclose()  # release the connection back to the pool before sleeping
+            if response.status_code == 429 and readmit is not None:
+                await readmit(delay)
+            else:
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    async def _read_error(response, trace):
+        await response.aread()
+        if trace is not None:
+            trace.add_traffic("received", response.num_bytes_downloaded)
+
+    async def _send(self, request, stream):
+        """
+        Sends a request on the pool, deferring a cancellation until the request has reached its connection.
+
+        httpcore leaks a connection it opened for a request that is cancelled before using it; once every
+        connection of the pool has leaked, all later requests wait forever. A request cancelled that early
+        is therefore left to reach its connection (or fail) in the background, and then aborted.
+        """
+        reached_connection = asyncio.Event()
+        trace = request.extensions.get("trace")
+
+        async def on_http_event(event, info):
+            reached_connection.set()  # httpcore only emits events from inside a connection
+            if trace is not None:
+                await trace(event, info)
+
+        request.extensions["trace"] = on_http_event
+        send = asyncio.ensure_future(self.http.send(request, stream=stream))
+        try:
+            return await asyncio.shield(send)
+        except asyncio.CancelledError:
+            abort = asyncio.ensure_future(self._abort(send, reached_connection))
+            self._aborting.add(abort)
+            abort.add_done_callback(self._aborting.discard)
+            raise
+
+    @staticmethod
+    async def _abort(send, reached_connection):
+        reached = asyncio.ensure_future(reached_connection.wait())
+        await asyncio.wait({send, reached}, return_when=asyncio.FIRST_COMPLETED)
+        reached.cancel()
+        send.cancel()
+        try:
+            response = await send
+        except (asyncio.CancelledError, Exception):
+            return
+        await response.aclose()
+
+    async def patch(self, url, data, breaker=None):
+        """Sends a single PATCH request (no retries)."""
+        (breaker or self.breaker).before_request()
+        return await self.http.patch(url, content=data)
+
+    async def aclose(self):
+        await self.http.aclose()
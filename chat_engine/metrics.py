@@ -0,0 +1,391 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics configuration ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))     # serve Prometheus text on this port; 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_JSONL = os.getenv("METRICS_JSONL")              # append one JSON line per turn to this file
+METRICS_JSONL_MAX_BYTES = 10 * 1024 * 1024              # rotate the JSONL file at this size...
+METRICS_JSONL_BACKUPS = 5                               # ...keeping this many old files
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+RERUN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)  # seconds; script runs are short
+
+# The stages of a turn, in order. Streamed turns download while they render, so their download span
+# overlaps parse and render.
+STAGES = ("triage", "payload_build", "queue", "serialize", "connect", "ttfb", "download", "parse", "render", "total")
+HTTP_STAGES = ("connect", "ttfb", "download")  # measured for the last HTTP attempt only
+# Bytes per turn: the serialized request bodies, what went over the wire after compression, and the
+# response bytes received (before decompression). Retried and hedged requests count too.
+TRAFFIC_KINDS = ("body", "sent", "received")
+# Estimated input tokens per turn: the whole history with the system prompt, the part the context window
+# sent, and the difference it saved (see context_window.py)
+CONTEXT_KINDS = ("full", "sent", "saved")
+USAGE_FIELDS = {
+    "promptTokenCount": "prompt",
+    "candidatesTokenCount": "candidates",
+    "cachedContentTokenCount": "cached",
+    "totalTokenCount": "total",
+}
+
+
+# --- Per-turn trace ---
+
+class TurnTrace:
+    """
+    Timing spans and token counts of one chat turn.
+
+    The engine fills in the request stages; the front-end adds the render span and hands the
+    finished trace to `Metrics.record`.
+
+    Attributes:
+        spans (dict): Seconds spent per stage (see STAGES).
+        tokens (dict): The turn's `usageMetadata` counts: prompt, candidates, cached and total.
+        attempts (int): HTTP attempts made for the answer (more than one after retries).
+        outcome (str or None): "answered", "cached", "off_topic", "superseded" or "cancelled" (the user sent a
+                               newer message or left first), or the error message key of a failed turn.
+        triage (str or None): The local pre-filter's verdict on the user message (see triage.py).
+        model (str or None): The model whose response was used (see routing.py).
+        hedges (int): Extra requests sent to other models because the first one was slow or failed.
+        coalesced (bool): Whether the answer came from an identical request of another session that was
+                          already in flight, instead of an API call of its own (see single_flight.py).
+        traffic (dict): Request and response bytes (see TRAFFIC_KINDS).
+        context_tokens (dict): The context window's token estimates (see CONTEXT_KINDS); empty if no request was built.
+    """
+
+    def __init__(self):
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.tokens = {}
+        self.attempts = 0
+        self.outcome = None
+        self.triage = None
+        self.model = None
+        self.hedges = 0
+        self.coalesced = False
+        self.traffic = dict.fromkeys(TRAFFIC_KINDS, 0)
+        self.context_tokens = {}
+        self._attempt_started = None
+        self._connect_started = None
+        self._headers_received = None
+
+    def add(self, stage, seconds):
+        """Adds `seconds` to a stage; stages entered several times per turn accumulate."""
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage):
+        """Times the `with` block as `stage`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def add_traffic(self, kind, count):
+        """Adds `count` bytes of `kind` (see TRAFFIC_KINDS)."""
+        self.traffic[kind] += count
+
+    def record_context(self, full_tokens, sent_tokens):
+        """Keeps the context window's estimate of the history's tokens and of those it sent."""
+        self.context_tokens = {"full": full_tokens, "sent": sent_tokens, "saved": full_tokens - sent_tokens}
+
+    def record_usage(self, usage):
+        """Keeps the token counts of a `usageMetadata` object."""
+        for field, kind in USAGE_FIELDS.items():
+            if field in usage:
+                self.tokens[kind] = usage[field]
+
+    def start_attempt(self):
+        """Marks the start of an HTTP attempt; connect, ttfb and download are measured for the last attempt."""
+        self.attempts += 1
+        self._attempt_started = time.perf_counter()
+        for stage in HTTP_STAGES:
+            self.spans.pop(stage, None)
+
+    async def on_http_event(self, event, info):
+        """httpx `trace` extension callback: turns connection and response events into spans."""
+        now = time.perf_counter()
+        if event.endswith("connect_tcp.started"):
+            self._connect_started = now
+        elif event.endswith(("connect_tcp.complete", "start_tls.complete")) and self._connect_started is not None:
+            self.spans["connect"] = now - self._connect_started
+        elif event.endswith("receive_response_headers.complete") and self._attempt_started is not None:
+            self._headers_received = now
+            self.spans["ttfb"] = now - self._attempt_started
+        elif event.endswith("receive_response_body.complete") and self._headers_received is not None:
+            self.spans["download"] = now - self._headers_received
+
+    def fork(self):
+        """Returns a trace for one of several concurrent requests; hand it back with `merge`."""
+        return TurnTrace()
+
+    def merge(self, attempt, won):
+        """
+        Adds the attempts, serialization time and traffic of a forked trace. The winning request's connect,
+        ttfb and download spans replace this trace's, and its later HTTP events land here as well.
+        """
+        self.attempts += attempt.attempts
+        for kind, count in attempt.traffic.items():
+            self.traffic[kind] += count
+        for stage, seconds in attempt.spans.items():
+            if stage in HTTP_STAGES:
+                if won:
+                    self.spans[stage] = seconds
+            else:
+                self.add(stage, seconds)
+        if won:
+            attempt.spans = self.spans
+            attempt.traffic = self.traffic
+
+    def time_consumer(self, iterator, stage="render"):
+        """
+        Passes the items of `iterator` through, timing how long the consumer takes with each one.
+
+        Wrap the chunks handed to `st.write_stream` with this to measure rendering separately from waiting.
+        """
+        for item in iterator:
+            started = time.perf_counter()
+            yield item
+            self.add(stage, time.perf_counter() - started)
+
+    def finish(self):
+        """Sets the total span (idempotent)."""
+        self.spans.setdefault("total", time.perf_counter() - self.started)
+
+    def as_dict(self):
+        return {
+            "timestamp": round(self.timestamp, 3),
+            "outcome": self.outcome,
+            "triage": self.triage,
+            "model": self.model,
+            "hedges": self.hedges,
+            "coalesced": self.coalesced,
+            "attempts": self.attempts,
+            "spans_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.spans.items()},
+            "tokens": dict(self.tokens),
+            "traffic": dict(self.traffic),
+            "context_tokens": dict(self.context_tokens),
+        }
+
+
+# --- Aggregation ---
+
+class Histogram:
+    """A fixed-bucket histogram, like a Prometheus one."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimates the q-quantile by interpolating inside its bucket, or returns None when empty."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    Per-process aggregate of turn traces: latency histograms per stage, token and traffic counters,
+    the tokens saved by the context window, turn outcomes, pre-filter verdicts, answering models and API calls saved by coalescing.
+    Front-ends can also record how long each Streamlit script run took (see `record_rerun`).
+
+    Finished traces can additionally be appended to a size-rotated JSONL file, and the aggregate can
+    be rendered in the Prometheus text format (see `serve_metrics`).
+
+    Args:
+        jsonl_path (str or None): File to append one JSON line per turn to.
+        max_bytes (int): Size at which the JSONL file is rotated.
+        backups (int): How many rotated files are kept.
+    """
+
+    def __init__(self, jsonl_path=METRICS_JSONL, max_bytes=METRICS_JSONL_MAX_BYTES, backups=METRICS_JSONL_BACKUPS):
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.tokens = dict.fromkeys(USAGE_FIELDS.values(), 0)
+        self.traffic = dict.fromkeys(TRAFFIC_KINDS, 0)
+        self.context_tokens = dict.fromkeys(CONTEXT_KINDS, 0)
+        self.turns = {}
+        self.triage = {}
+        self.models = {}  # model -> turns answered by it
+        self.hedged_turns = 0
+        self.coalesced_turns = 0  # each one is an upstream call saved
+        self.reruns = {}  # script -> Histogram of script execution times
+        self._lock = threading.Lock()
+        self._jsonl = None
+        if jsonl_path:
+            self._jsonl = RotatingFileHandler(jsonl_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+
+    def record(self, trace):
+        """Adds a finished turn to the aggregate (and the JSONL file)."""
+        trace.finish()
+        with self._lock:
+            for stage, seconds in trace.spans.items():
+                if stage in self.stages:
+                    self.stages[stage].observe(seconds)
+            for kind, count in trace.tokens.items():
+                self.tokens[kind] += count
+            for kind, count in trace.traffic.items():
+                self.traffic[kind] += count
+            for kind, count in trace.context_tokens.items():
+                self.context_tokens[kind] += count
+            self.turns[trace.outcome] = self.turns.get(trace.outcome, 0) + 1
+            if trace.triage is not None:
+                self.triage[trace.triage] = self.triage.get(trace.triage, 0) + 1
+            if trace.model is not None:
+                self.models[trace.model] = self.models.get(trace.model, 0) + 1
+            if trace.hedges:
+                self.hedged_turns += 1
+            if trace.coalesced:
+                self.coalesced_turns += 1
+        if self._jsonl is not None:
+            self._jsonl.handle(logging.makeLogRecord({"msg": json.dumps(trace.as_dict()), "levelno": logging.INFO}))
+
+    def record_rerun(self, script, seconds):
+        """Adds the execution time of one run of a Streamlit script."""
+        with self._lock:
+            histogram = self.reruns.get(script)
+            if histogram is None:
+                histogram = self.reruns[script] = Histogram(RERUN_BUCKETS)
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: `stages` (count and mean/p50/p95/p99 in ms per stage), `tokens`, `traffic`, `context_tokens`
+                  (see CONTEXT_KINDS), `turns` (by outcome), `triage` (turns by pre-filter verdict), `models`
+                  (turns by answering model), `hedged_turns`, `coalesced_turns` (upstream calls saved) and
+                  `reruns` (the stage statistics per script).
+        """
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+
+        def summary(histogram):
+            return {
+                "count": histogram.count,
+                "mean_ms": ms(histogram.sum / histogram.count) if histogram.count else None,
+                "p50_ms": ms(histogram.quantile(0.50)),
+                "p95_ms": ms(histogram.quantile(0.95)),
+                "p99_ms": ms(histogram.quantile(0.99)),
+            }
+
+        with self._lock:
+            return {
+                "stages": {stage: summary(histogram) for stage, histogram in self.stages.items()},
+                "tokens": dict(self.tokens),
+                "traffic": dict(self.traffic),
+                "context_tokens": dict(self.context_tokens),
+                "turns": dict(self.turns),
+                "triage": dict(self.triage),
+                "models": dict(self.models),
+                "hedged_turns": self.hedged_turns,
+                "coalesced_turns": self.coalesced_turns,
+                "reruns": {script: summary(histogram) for script, histogram in self.reruns.items()},
+            }
+
+    def prometheus_text(self):
+        """Renders the aggregate in the Prometheus text exposition format."""
+        lines = [
+            "# HELP chat_stage_seconds Time spent in each stage of a chat turn.",
+            "# TYPE chat_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in self.stages.items():
+                lines += _histogram_lines("chat_stage_seconds", f'stage="{stage}"', histogram)
+            lines += ["# HELP chat_tokens_total Tokens reported by the API in usageMetadata.", "# TYPE chat_tokens_total counter"]
+            lines += [f'chat_tokens_total{{kind="{kind}"}} {count}' for kind, count in self.tokens.items()]
+            lines += ["# HELP chat_api_bytes_total Request body, request wire and response wire bytes of API calls.",
+                      "# TYPE chat_api_bytes_total counter"]
+            lines += [f'chat_api_bytes_total{{kind="{kind}"}} {count}' for kind, count in self.traffic.items()]
+            lines += ["# HELP chat_context_tokens_total Estimated input tokens of the full history, sent by the context "
+                      "window, and saved by it.", "# TYPE chat_context_tokens_total counter"]
+            lines += [f'chat_context_tokens_total{{kind="{kind}"}} {count}' for kind, count in self.context_tokens.items()]
+            lines += ["# HELP chat_turns_total Chat turns by outcome.", "# TYPE chat_turns_total counter"]
+            lines += [f'chat_turns_total{{outcome="{outcome}"}} {count}' for outcome, count in self.turns.items()]
+            lines += ["# HELP chat_triage_total Chat turns by local pre-filter verdict.", "# TYPE chat_triage_total counter"]
+            lines += [f'chat_triage_total{{verdict="{verdict}"}} {count}' for verdict, count in self.triage.items()]
+            lines += ["# HELP chat_model_turns_total Chat turns by the model that answered.", "# TYPE chat_model_turns_total counter"]
+            lines += [f'chat_model_turns_total{{model="{model}"}} {count}' for model, count in self.models.items()]
+            lines += ["# HELP chat_hedged_turns_total Chat turns that sent a hedged or failover request.",
+                      "# TYPE chat_hedged_turns_total counter", f"chat_hedged_turns_total {self.hedged_turns}"]
+            lines += ["# HELP chat_coalesced_turns_total Chat turns answered by an identical request already in flight "
+                      "(API calls saved).", "# TYPE chat_coalesced_turns_total counter", f"chat_coalesced_turns_total {self.coalesced_turns}"]
+            lines += ["# HELP chat_rerun_seconds Execution time of the Streamlit script per run.", "# TYPE chat_rerun_seconds histogram"]
+            for script, histogram in self.reruns.items():
+                lines += _histogram_lines("chat_rerun_seconds", f'script="{script}"', histogram)
+        return "\n".join(lines) + "\n"
+
+
+# --- Prometheus endpoint ---
+
+def _histogram_lines(name, labels, histogram):
+    """Renders one labelled Prometheus histogram series: cumulative buckets, sum and count."""
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+def serve_metrics(metrics, port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serves `metrics.prometheus_text()` at `/metrics` from a daemon thread.
+
+    Streamlit cannot add routes to its own server, so the endpoint listens on a separate port.
+
+    Returns:
+        ThreadingHTTPServer or None: The server, or None if `port` is 0 or already in use.
+    """
+    if not port:
+        return None
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError:
+        logger.warning("Could not serve metrics on %s:%d.", host, port, exc_info=True)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="chat-engine-metrics", daemon=True).start()
+    return server
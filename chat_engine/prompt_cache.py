@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import logging
+import time
+
+from .conversation import request_body
+from .encoding import dumps, loads
+from .http import API_BASE_URL, MODEL
+from .tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Context caching configuration ---
+CACHE_TTL_SECONDS = 3600
+CACHE_REFRESH_MARGIN = 300  # extend the TTL when the handle has less than this many seconds left
+CACHE_RETRY_AFTER = 600     # after caching failed for a prompt, send it inline for this long before trying again
+REJECTED_HANDLE_STATUS_CODES = {400, 403, 404}  # what generateContent answers for an expired or unknown handle...
+REJECTED_HANDLE_MARKERS = ("cachedcontent", "cached content")  # ...with an error message that names the handle
+# The smallest content the API caches, in tokens; creating a smaller one always fails
+CACHE_MIN_TOKENS = {"gemini-2.0-flash": 4096, "gemini-2.5-flash": 1024, "gemini-2.5-pro": 4096}
+CACHE_MIN_TOKENS_DEFAULT = 4096
+
+
+def cache_min_tokens(model):
+    """Returns the minimum cacheable size for `model`, matching versioned names like "gemini-2.0-flash-001"."""
+    for prefix, tokens in sorted(CACHE_MIN_TOKENS.items(), key=lambda item: -len(item[0])):
+        if model.startswith(prefix):
+            return tokens
+    return CACHE_MIN_TOKENS_DEFAULT
+
+
+def names_cached_content(response):
+    """Whether an error response is about the cached content handle rather than the rest of the request."""
+    try:
+        text = response.text
+    except Exception:  # the body was not read
+        return False
+    return any(marker in text.lower() for marker in REJECTED_HANDLE_MARKERS)
+
+
+def inline_system_instruction(prompt):
+    """Returns the request fields that send the system prompt inline as `systemInstruction`."""
+    return {"systemInstruction": {"parts": [{"text": prompt}]}}
+
+
+class _CacheEntry:
+    __slots__ = ("prompt_hash", "name", "expires_at", "retry_at")
+
+    def __init__(self, prompt_hash):
+        self.prompt_hash = prompt_hash
+        self.name = None       # "cachedContents/..." once created
+        self.expires_at = 0.0  # wall-clock expiry of the handle
+        self.retry_at = 0.0    # when to try creating the handle again after a failure
+
+
+class SystemPromptCache:
+    """
+    Process-wide registry of server-side cached system prompts, one handle per language.
+
+    The first request for a language creates a `cachedContents` entry holding the system instruction;
+    later requests from every session reference it by name, so the prompt is neither re-sent nor
+    re-billed at the full input rate. Handles are refreshed before their TTL runs out. Whenever caching
+    is unavailable (creation failed, the prompt is below the model's minimum cacheable size, or the
+    handle was rejected) the prompt is sent inline as `systemInstruction` instead. Prompts below the
+    minimum (see CACHE_MIN_TOKENS) are never sent for caching at all. Creating or refreshing a handle
+    only holds up requests for the same key.
+
+    Args:
+        client (chat_engine.http.GeminiClient): The shared HTTP client.
+        api_key (str): The Gemini API key.
+        base_url (str): The API base URL.
+        model (str): The model the cached content is created for; it must match the generating model.
+        ttl (int): The lifetime of a handle, in seconds.
+        breaker (CircuitBreaker or None): The circuit breaker of this endpoint; defaults to the client's.
+    """
+
+    def __init__(self, client, api_key, base_url=API_BASE_URL, model=MODEL, ttl=CACHE_TTL_SECONDS, breaker=None):
+        self.client = client
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.ttl = ttl
+        self.breaker = breaker
+        self._entries = {}
+        self._locks = {}  # key -> asyncio.Lock, created on first use inside the engine's event loop
+
+    async def _create(self, key, prompt, entry):
+        body = {
+            "model": f"models/{self.model}",
+            "displayName": f"medical-assistant-system-prompt-{key}",
+            "systemInstruction": {"parts": [{"text": prompt}]},
+            "ttl": f"{self.ttl}s",
+        }
+        response = await self.client.post(f"{self.base_url}/cachedContents?key={self.api_key}", dumps(body),
+                                          breaker=self.breaker)
+        response.raise_for_status()
+        entry.name = loads(response.content)["name"]
+        entry.expires_at = time.time() + self.ttl
+
+    async def _extend(self, entry):
+        response = await self.client.patch(
+            f"{self.base_url}/{entry.name}?key={self.api_key}&updateMask=ttl",
+            dumps({"ttl": f"{self.ttl}s"}),
+            breaker=self.breaker,
+        )
+        response.raise_for_status()
+        entry.expires_at = time.time() + self.ttl
+
+    async def request_fields(self, key, prompt):
+        """
+        Returns the request fields that attach the system prompt for `key` to a generateContent payload.
+
+        Args:
+            key (str): The cache key, e.g. the language the prompt was generated for.
+            prompt (str): The system prompt text.
+
+        Returns:
+            dict: Either `{"cachedContent": name}` or the inline `systemInstruction` fields.
+        """
+        if estimate_tokens(prompt) < cache_min_tokens(self.model):
+            return inline_system_instruction(prompt)
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.prompt_hash != prompt_hash:
+                entry = self._entries[key] = _CacheEntry(prompt_hash)
+            now = time.time()
+            if entry.name and now < entry.expires_at - CACHE_REFRESH_MARGIN:
+                return {"cachedContent": entry.name}
+            if now < entry.retry_at:
+                return inline_system_instruction(prompt)
+            try:
+                if entry.name and now < entry.expires_at:
+                    await self._extend(entry)
+                else:
+                    await self._create(key, prompt, entry)
+            except Exception:
+                logger.warning("Context caching is unavailable for %r; sending the system prompt inline.", key, exc_info=True)
+                entry.name = None
+                entry.retry_at = now + CACHE_RETRY_AFTER
+                return inline_system_instruction(prompt)
+            return {"cachedContent": entry.name}
+
+    def invalidate(self, key):
+        """Drops the handle for `key` and sends that prompt inline for a while."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.name = None
+            entry.retry_at = time.time() + CACHE_RETRY_AFTER
+
+    async def post(self, url, contents, key, prompt, stream=False, trace=None, max_retries=None, readmit=None):
+        """
+        Sends a generateContent request with the system prompt attached.
+
+        If the API rejects the cached handle (an error status whose message names the cached content),
+        the handle is invalidated and the request is sent again once with the prompt inline. Other
+        errors are returned as they are.
+
+        Args:
+            url (str): The full request URL.
+            contents (list): The Turn objects to send.
+            key (str): The cache key for the prompt.
+            prompt (str): The system prompt text.
+            stream (bool): Whether to stream the response body.
+            trace (TurnTrace or None): Receives the serialization time and the HTTP spans.
+            max_retries (int or None): Passed on to GeminiClient.post.
+            readmit (callable or None): Passed on to GeminiClient.post.
+
+        Returns:
+            httpx.Response: The response, as returned by GeminiClient.post.
+        """
+        fields = await self.request_fields(key, prompt)
+        response = await self.client.post(url, self._serialize(contents, fields, trace), stream=stream, trace=trace,
+                                          breaker=self.breaker, max_retries=max_retries, readmit=readmit)
+        if ("cachedContent" in fields and response.status_code in REJECTED_HANDLE_STATUS_CODES
+                and names_cached_content(response)):
+            await response.aclose()
+            self.invalidate(key)
+            body = self._serialize(contents, inline_system_instruction(prompt), trace)
+            response = await self.client.post(url, body, stream=stream, trace=trace, breaker=self.breaker,
+                                              max_retries=max_retries, readmit=readmit)
+        return response
+
+    @staticmethod
+    def _serialize(contents, fields, trace):
+        started = time.perf_counter()
+        data = request_body(contents, fields)
+        if trace is not None:
+            trace.add("serialize", time.perf_counter() - started)
+        return data
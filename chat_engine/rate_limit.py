@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# --- Rate limit configuration ---
+# Set these to the project's Gemini quota. One limiter per process is shared by every session.
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "1000"))
+TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "16"))
+BURST_FRACTION = 0.1         # share of the quota that may be sent at once; the rest is spread over the minute
+THROTTLE_FACTOR = 0.5        # a 429 multiplies the allowed rate by this...
+MIN_RATE_SCALE = 0.25        # ...but not below this fraction of the quota
+THROTTLE_DEBOUNCE = 2        # seconds; 429s arriving together count as one
+RECOVERY_SECONDS = 60        # time to grow back from the lowest rate to the full quota without further 429s
+ANSWER_TOKEN_ESTIMATE = 800  # output tokens reserved per request until the real usage is known
+
+
+class TokenBucket:
+    """
+    A token bucket that never lets more than `limit` tokens through in any `window` seconds.
+
+    The bucket holds a burst of `BURST_FRACTION * limit` and refills at the rest of the limit per
+    window, so even a full burst followed by a steady stream stays within a sliding-window quota.
+
+    Args:
+        limit (float): The quota per window.
+        window (float): The quota period in seconds.
+    """
+
+    def __init__(self, limit, window=60):
+        self.limit = limit
+        self.window = window
+        self.scale = 1.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def capacity(self):
+        return max(1.0, self.limit * self.scale * BURST_FRACTION)
+
+    @property
+    def rate(self):
+        """Refill rate in tokens per second."""
+        return self.limit * self.scale * (1 - BURST_FRACTION) / self.window
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """Returns the seconds until `amount` tokens are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # an oversized request waits for a full bucket rather than forever
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Takes `amount` more tokens (or gives them back if negative), e.g. once the real usage is known."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+    def drain(self):
+        """Empties the bucket, so that nothing more is sent until it refills."""
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+    def rescale(self, scale):
+        """Changes the limit to `scale` times the configured one."""
+        self._refill()
+        self.scale = scale
+        self.level = min(self.level, self.capacity)
+
+
+class Admission:
+    """
+    One request's place in the admission queue.
+
+    Attributes:
+        tokens (int): The tokens reserved for the request.
+        tokens_used (int or None): Set by the caller once the real usage is known; the difference is settled on release.
+        waited (float): Seconds spent in the queue, in total if the request was readmitted.
+        held (bool): Whether the request currently holds an in-flight slot.
+    """
+
+    __slots__ = ("tokens", "tokens_used", "waited", "held", "position", "on_position", "future", "_queued_at")
+
+    def __init__(self, tokens, on_position):
+        self.tokens = tokens
+        self.tokens_used = None
+        self.waited = 0.0
+        self.held = False
+        self.on_position = on_position
+        self.requeue()
+
+    def requeue(self):
+        self.position = None
+        self.future = asyncio.get_running_loop().create_future()
+        self._queued_at = time.monotonic()
+
+
+class RateLimiter:
+    """
+    Process-wide admission control for API requests: requests and tokens per minute, plus a cap on concurrency.
+
+    Requests that cannot start yet wait in a FIFO queue, so a traffic spike turns into a short wait
+    instead of a burst of quota errors. Waiters are told their position in line. If the API still
+    answers 429 (e.g. because another process shares the quota), both rates are halved, down to
+    MIN_RATE_SCALE of the quota, and grow back over RECOVERY_SECONDS. A request answered 429 is not
+    resent past the shrunk rate: it gives up its slot and queues again (see `readmit`).
+
+    Must only be used from the engine's event loop.
+
+    Usage:
+        async with limiter.admit(estimated_tokens, on_position=show_position) as admission:
+            ...  # send the request
+            admission.tokens_used = actual_tokens
+
+    Args:
+        requests_per_minute (int): The request quota.
+        tokens_per_minute (int): The token quota (input plus output tokens).
+        max_in_flight (int): The most requests sent at the same time.
+        window (float): The quota period in seconds; 60 for Gemini's per-minute quotas.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_in_flight=MAX_IN_FLIGHT, window=60):
+        self.requests = TokenBucket(requests_per_minute, window)
+        self.tokens = TokenBucket(tokens_per_minute, window)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.scale = 1.0
+        self._throttled_scale = 1.0
+        self._last_throttled = None
+        self._queue = deque()
+        self._timer = None
+        self.stats = {"admitted": 0, "queued": 0, "throttled": 0, "max_queue_length": 0, "wait_seconds": 0.0}
+
+    @property
+    def queue_length(self):
+        return len(self._queue)
+
+    def _dispatch(self):
+        """Admits waiting requests from the head of the queue for as long as the limits allow."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._recover()
+        while self._queue and self.in_flight < self.max_in_flight:
+            admission = self._queue[0]
+            if admission.future.done():  # cancelled while waiting
+                self._queue.popleft()
+                continue
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(admission.tokens))
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                break
+            self._queue.popleft()
+            self.requests.take(1)
+            self.tokens.take(admission.tokens)
+            self.in_flight += 1
+            admission.held = True
+            waited = time.monotonic() - admission._queued_at
+            admission.waited += waited
+            self.stats["admitted"] += 1
+            self.stats["wait_seconds"] += waited
+            admission.future.set_result(None)
+        self._announce_positions()
+
+    def _announce_positions(self):
+        for position, admission in enumerate(self._queue, 1):
+            if admission.position != position and not admission.future.done():
+                admission.position = position
+                if admission.on_position is not None:
+                    admission.on_position(position)
+
+    async def acquire(self, tokens, on_position=None):
+        """
+        Waits until the request may be sent.
+
+        Args:
+            tokens (int): The estimated tokens of the request, input and output.
+            on_position (callable or None): Called with the 1-based queue position whenever it changes
+                                            while waiting, and with None once the request is admitted.
+
+        Returns:
+            Admission: Pass it to `release` when the request is done.
+        """
+        admission = Admission(tokens, on_position)
+        self._queue.append(admission)
+        await self._wait(admission)
+        return admission
+
+    async def readmit(self, admission, delay=0.0):
+        """
+        Gives up an admitted request's slot after the API answered 429 and waits to be admitted again.
+
+        The request goes back to the head of the queue, since it was admitted before everything in it,
+        but is only let through once the buckets shrunk by `throttled` allow it. Its release stays with
+        whoever acquired it. Requests sharing the admission (hedged duplicates) free the slot only once.
+
+        Args:
+            admission (Admission): The request's admission, from `acquire` or `admit`.
+            delay (float): Seconds to wait (e.g. the Retry-After) before queueing again.
+        """
+        if not admission.held:
+            # A hedged duplicate sharing the admission already gave up the slot: wait for the same readmission
+            await asyncio.sleep(delay)
+            await asyncio.shield(admission.future)
+            return
+        self.in_flight -= 1
+        admission.held = False
+        admission.requeue()
+        self._dispatch()
+        await asyncio.sleep(delay)
+        admission._queued_at = time.monotonic()
+        self._queue.appendleft(admission)
+        await self._wait(admission)
+
+    async def _wait(self, admission):
+        self._dispatch()
+        if not admission.future.done():
+            self.stats["queued"] += 1
+            self.stats["max_queue_length"] = max(self.stats["max_queue_length"], len(self._queue))
+        try:
+            await admission.future
+        except asyncio.CancelledError:
+            if admission.future.done() and not admission.future.cancelled():
+                self.release(admission)  # admitted just as the waiter was cancelled
+            else:
+                admission.future.cancel()
+                self._dispatch()
+            raise
+        finally:
+            if admission.on_position is not None:
+                admission.on_position(None)
+
+    def release(self, admission):
+        """Frees the request's slot and settles the difference between its estimated and real token usage."""
+        if admission.held:
+            self.in_flight -= 1
+            admission.held = False
+        if admission.tokens_used is not None:
+            self.tokens.adjust(admission.tokens_used - admission.tokens)
+            admission.tokens_used = None
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, tokens, on_position=None):
+        """Context manager form of `acquire`/`release`."""
+        admission = await self.acquire(tokens, on_position)
+        try:
+            yield admission
+        finally:
+            self.release(admission)
+
+    def throttled(self):
+        """Reports a 429 from the API: shrinks both rates and empties the buckets so that no burst follows."""
+        self.stats["throttled"] += 1
+        now = time.monotonic()
+        if self._last_throttled is not None and now - self._last_throttled < THROTTLE_DEBOUNCE:
+            return
+        self._recover()
+        self._throttled_scale = max(MIN_RATE_SCALE, self.scale * THROTTLE_FACTOR)
+        self._last_throttled = now
+        self._rescale(self._throttled_scale)
+        self.requests.drain()
+        self.tokens.drain()
+        logger.warning("The API is throttling requests; rate limit lowered to %.0f%% of the quota.", self.scale * 100)
+
+    def _recover(self):
+        """Grows the rates back linearly since the last 429."""
+        if self.scale >= 1.0:
+            return
+        recovered = (time.monotonic() - self._last_throttled) / RECOVERY_SECONDS * (1 - MIN_RATE_SCALE)
+        self._rescale(min(1.0, self._throttled_scale + recovered))
+
+    def _rescale(self, scale):
+        self.scale = scale
+        self.requests.rescale(scale)
+        self.tokens.rescale(scale)
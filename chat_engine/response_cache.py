@@ -0,0 +1,122 @@
+import hashlib
+import os
+import sqlite3
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# --- Response cache configuration ---
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_TTL_SECONDS = 24 * 3600
+# Set RESPONSE_CACHE_DB to a file path to share cached answers between worker processes
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB")
+# Set SEMANTIC_CACHE=1 to also answer close paraphrases of earlier opening questions (see semantic_cache.py). Off
+# by default: character n-grams catch rewordings and typos, not real paraphrases, so the saving is small.
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "0") == "1"
+
+
+def normalize_prompt(text):
+    """
+    Normalizes a user prompt so that trivially different spellings share a cache entry.
+
+    Applies Unicode NFC (Hindi and Bengali text can arrive with decomposed vowel signs), case folding,
+    removal of punctuation (including the danda) and whitespace collapsing.
+
+    Args:
+        text (str): The raw user prompt.
+
+    Returns:
+        str: The normalized prompt.
+    """
+    text = unicodedata.normalize("NFC", text).casefold()
+    text = "".join(" " if unicodedata.category(char).startswith("P") or char in string.punctuation else char for char in text)
+    return " ".join(text.split())
+
+
+def prompt_version(system_prompt):
+    """Returns a short fingerprint of the system prompt, so that editing the prompt invalidates cached answers."""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def cache_key(language, system_prompt, user_text):
+    """Builds the cache key for a first-turn question."""
+    raw = f"{language}\0{prompt_version(system_prompt)}\0{normalize_prompt(user_text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_first_turn(messages_history):
+    """Returns True if the last message is the only user message in the history."""
+    return sum(1 for message in messages_history if message.role == "user") == 1
+
+
+class ResponseCache:
+    """
+    Exact-match cache of model answers for first-turn questions.
+
+    Entries live in an in-memory LRU with a TTL. If `db_path` is given, entries are also written to a
+    SQLite database (in WAL mode) so that several worker processes share them; a memory miss falls
+    back to the database. Hit/miss/eviction counters are kept in `stats`.
+
+    Args:
+        max_entries (int): The maximum number of entries kept in memory.
+        ttl (float): How long an entry stays valid, in seconds.
+        db_path (str or None): Optional SQLite file for the shared backing store.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL_SECONDS, db_path=RESPONSE_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _remember(self, key, expires_at, response):
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, key):
+        """Returns the cached response for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.stats["evictions"] += 1
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, response FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, *entry)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key, response):
+        """Stores a response under `key`."""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, response)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, response, expires_at),
+                )
+                self._db.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
@@ -0,0 +1,233 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+
+import httpx
+
+from .errors import CircuitOpenError
+from .http import API_BASE_URL, MODEL, RETRY_STATUS_CODES, CircuitBreaker
+from .prompt_cache import SystemPromptCache
+
+logger = logging.getLogger(__name__)
+
+# --- Model routing configuration ---
+# Ordered, comma-separated models to answer with, e.g. "gemini-2.0-flash,gemini-2.0-flash-lite". An entry
+# can name another endpoint as "model@base_url". Empty means GEMINI_MODEL at GEMINI_API_URL alone.
+MODEL_CHAIN = os.getenv("GEMINI_MODELS", "")
+# Set HEDGE_REQUESTS=0 to only fail over on errors, never send a duplicate request for a slow one
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "1") == "1"
+HEDGE_QUANTILE = 0.95      # a request slower than this quantile of its endpoint's recent ones is hedged
+HEDGE_WINDOW = 200         # recent response times kept per endpoint
+HEDGE_MIN_SAMPLES = 20     # below this, HEDGE_INITIAL_DELAY is used instead of the quantile
+HEDGE_INITIAL_DELAY = 2.0  # seconds
+HEDGE_MIN_DELAY = 0.2      # seconds; bounds for the adaptive delay
+HEDGE_MAX_DELAY = 10.0
+
+
+def parse_model_chain(value, base_url=API_BASE_URL, model=MODEL):
+    """
+    Parses a MODEL_CHAIN value.
+
+    Returns:
+        list: `(model, base_url)` pairs in order; `[(model, base_url)]` for an empty value.
+    """
+    chain = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if entry:
+            name, _, url = entry.partition("@")
+            chain.append((name.strip(), url.strip().rstrip("/") or base_url))
+    return chain or [(model, base_url)]
+
+
+class Endpoint:
+    """
+    One model at one API base URL, with its own circuit breaker, system prompt cache (cached content
+    is tied to the model that created it) and recent response times.
+
+    Attributes:
+        model (str): The model name.
+        api_url (str): The generateContent URL.
+        stream_api_url (str): The streamGenerateContent URL.
+    """
+
+    def __init__(self, client, api_key, model, base_url):
+        self.model = model
+        self.base_url = base_url
+        self.api_url = f"{base_url}/models/{model}:generateContent?key={api_key}"
+        self.stream_api_url = f"{base_url}/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+        self.breaker = CircuitBreaker()
+        self.prompt_cache = SystemPromptCache(client, api_key, base_url=base_url, model=model, breaker=self.breaker)
+        # Seconds until the response (its headers, when streaming) arrived, for whole and streamed requests
+        self._response_times = {False: collections.deque(maxlen=HEDGE_WINDOW), True: collections.deque(maxlen=HEDGE_WINDOW)}
+
+    def __repr__(self):
+        return f"Endpoint({self.model!r}, {self.base_url!r})"
+
+    def observe(self, stream, seconds):
+        self._response_times[stream].append(seconds)
+
+    def hedge_delay(self, stream):
+        """Seconds to wait for this endpoint before hedging: the HEDGE_QUANTILE of its recent response times."""
+        samples = self._response_times[stream]
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY
+        ordered = sorted(samples)
+        delay = ordered[min(len(ordered) - 1, int(HEDGE_QUANTILE * len(ordered)))]
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, delay))
+
+
+class ModelRouter:
+    """
+    Sends generate requests along an ordered chain of model endpoints.
+
+    The request goes to the first endpoint. If it fails with a retryable status (429/5xx), a network
+    error or timeout, or an open circuit, the next endpoint is tried at once instead of retrying the
+    same one; only the last endpoint retries with backoff. If no response has arrived after the
+    endpoint's adaptive hedge delay, a duplicate goes to the next endpoint while the first keeps
+    running. The first successful response wins and the other requests are cancelled. An error
+    response (e.g. a fast 404 from a fallback that lacks the model) only wins once no other request
+    is left that could still succeed.
+
+    Hedged duplicates are not counted by the rate limiter; with the 95th percentile as the delay
+    they add about 5% requests.
+
+    Args:
+        client (GeminiClient): The shared HTTP client.
+        api_key (str): The Gemini API key.
+        chain (list): `(model, base_url)` pairs, see parse_model_chain.
+        hedge (bool): Whether slow requests are hedged (failover on errors happens regardless).
+    """
+
+    def __init__(self, client, api_key, chain, hedge=HEDGE_REQUESTS):
+        self.endpoints = [Endpoint(client, api_key, model, base_url) for model, base_url in chain]
+        self.hedge = hedge
+
+    @property
+    def primary(self):
+        return self.endpoints[0]
+
+    async def _attempt(self, endpoint, contents, key, prompt, stream, trace, last, readmit):
+        started = time.perf_counter()
+        response = await endpoint.prompt_cache.post(endpoint.stream_api_url if stream else endpoint.api_url, contents, key,
+                                                    prompt, stream=stream, trace=trace, max_retries=None if last else 0,
+                                                    readmit=readmit)
+        if response.status_code < 400:
+            endpoint.observe(stream, time.perf_counter() - started)
+        return response
+
+    async def post(self, contents, key, prompt, stream=False, trace=None, readmit=None):
+        """
+        Sends a generateContent request with the system prompt attached, hedging and failing over along the chain.
+
+        Args:
+            contents (list): The Turn objects to send.
+            key (str): The system prompt cache key.
+            prompt (str): The system prompt text.
+            stream (bool): Whether to stream the response body.
+            trace (TurnTrace or None): Receives the HTTP spans of the winning request, the answering model
+                                       and the number of extra requests.
+            readmit (callable or None): Passed on to GeminiClient.post for the last endpoint's retries.
+
+        Returns:
+            httpx.Response: The winning response. Error responses from the last endpoint to answer are
+                            returned as-is, as by GeminiClient.post.
+
+        Raises:
+            httpx.TransportError or CircuitOpenError: If every endpoint failed without a response.
+        """
+        pending = {}  # task -> (endpoint, forked trace)
+        next_index = 0
+        last_error = None
+        held = None  # (endpoint, response, forked trace): an error response kept while other requests may succeed
+
+        def launch():
+            nonlocal next_index
+            endpoint = self.endpoints[next_index]
+            next_index += 1
+            attempt_trace = trace.fork() if trace is not None else None
+            last = next_index == len(self.endpoints)
+            task = asyncio.ensure_future(self._attempt(endpoint, contents, key, prompt, stream, attempt_trace, last, readmit))
+            pending[task] = (endpoint, attempt_trace)
+            if trace is not None and next_index > 1:
+                trace.hedges += 1
+
+        launch()
+        try:
+            while pending:
+                delay = None
+                if self.hedge and next_index < len(self.endpoints):
+                    delay = self.endpoints[next_index - 1].hedge_delay(stream)
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info("No response from %s after %.2f s; hedging to %s.", self.endpoints[next_index - 1].model,
+                                delay, self.endpoints[next_index].model)
+                    launch()
+                    continue
+                for task in done:
+                    endpoint, attempt_trace = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except (httpx.TransportError, CircuitOpenError) as e:
+                        self._merge(trace, attempt_trace, won=False)
+                        last_error = e
+                        logger.info("%s failed (%r); failing over.", endpoint.model, e)
+                        continue
+                    if response.status_code in RETRY_STATUS_CODES and (pending or next_index < len(self.endpoints)):
+                        self._merge(trace, attempt_trace, won=False)
+                        await response.aclose()
+                        logger.info("%s answered %d; failing over.", endpoint.model, response.status_code)
+                        continue
+                    if response.status_code >= 400 and pending:
+                        # Another request is still running and may succeed; keep this answer in case it does not
+                        await self._drop(held, trace)
+                        held = (endpoint, response, attempt_trace)
+                        logger.info("%s answered %d; waiting for the other requests.", endpoint.model, response.status_code)
+                        continue
+                    await self._drop(held, trace)
+                    held = None
+                    return self._won(trace, endpoint, response, attempt_trace)
+                if not pending and next_index < len(self.endpoints):
+                    launch()
+            if held is not None:
+                endpoint, response, attempt_trace = held
+                held = None
+                return self._won(trace, endpoint, response, attempt_trace)
+        finally:
+            await self._drop(held, trace)
+            await self._cancel(pending, trace)
+        raise last_error
+
+    def _won(self, trace, endpoint, response, attempt_trace):
+        self._merge(trace, attempt_trace, won=True)
+        if trace is not None:
+            trace.model = endpoint.model
+        return response
+
+    async def _drop(self, held, trace):
+        """Closes a held error response that is no longer needed."""
+        if held is not None:
+            _, response, attempt_trace = held
+            await response.aclose()
+            self._merge(trace, attempt_trace, won=False)
+
+    @staticmethod
+    def _merge(trace, attempt_trace, won):
+        if trace is not None:
+            trace.merge(attempt_trace, won)
+
+    async def _cancel(self, pending, trace):
+        """Cancels the requests that lost the race and closes any response that arrived meanwhile."""
+        for task in pending:
+            task.cancel()
+        for task, (_, attempt_trace) in list(pending.items()):
+            try:
+                response = await task
+            except (asyncio.CancelledError, Exception):
+                pass
+            else:
+                await response.aclose()
+            self._merge(trace, attempt_trace, won=False)
+        pending.clear()
@@ -0,0 +1,207 @@
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WAIT_POLL_INTERVAL = 0.25  # seconds between `on_wait` calls while a result is pending
+# A background turn that no script run has followed for this long is cancelled: the user closed the page
+TURN_ABANDON_SECONDS = float(os.getenv("TURN_ABANDON_SECONDS", "20"))
+
+
+class BackgroundTurn:
+    """
+    One answer generated on a BackgroundLoop, independently of the script run that asked for it.
+
+    The generation does not stop when the script run ends, reruns or is interrupted; the next run
+    finds the turn in `ChatSession.pending_turn` and follows it from where it is. It stops when a
+    newer turn of the session starts (see `BackgroundLoop.start_turn`), when `cancel` is called, or
+    when nobody has followed it for TURN_ABANDON_SECONDS. Pieces are only added by the loop thread.
+
+    Attributes:
+        prompt (str): The user message.
+        trace (TurnTrace): The turn's trace.
+        chunks (list): The pieces of the answer received so far.
+        history_length (int): The length of the session history when the turn started; the user message
+                              and the answer are appended there once the turn completes.
+        done (bool): Whether the turn has finished, completed or not.
+        cancelled (bool): Whether the turn was cancelled before it completed.
+        error (BaseException or None): The unexpected exception the generation raised, if any.
+    """
+
+    def __init__(self, prompt, trace, history_length):
+        self.prompt = prompt
+        self.trace = trace
+        self.chunks = []
+        self.history_length = history_length
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self.followed = time.monotonic()
+        self._future = None
+        self._started = False
+        self._changed = threading.Condition()
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+    def cancel(self):
+        """Stops the generation. The history is left as it was before the turn. Safe to call from any thread."""
+        if not self.done:
+            self.cancelled = True
+            self._future.cancel()
+
+    def _publish(self, chunk=None, done=False):
+        with self._changed:
+            if chunk is not None:
+                self.chunks.append(chunk)
+            self.done = self.done or done
+            self._changed.notify_all()
+
+    def follow(self, on_wait=None):
+        """
+        Yields the pieces of the answer, from the first one, as they arrive. For script threads; stopping
+        early (e.g. because the script run was interrupted) leaves the generation running.
+
+        Args:
+            on_wait (callable or None): Called every WAIT_POLL_INTERVAL seconds while the next piece is pending.
+
+        Raises:
+            The unexpected exception the generation raised, if any.
+        """
+        sent = 0
+        while True:
+            with self._changed:
+                self.followed = time.monotonic()
+                if sent == len(self.chunks) and not self.done:
+                    self._changed.wait(WAIT_POLL_INTERVAL)
+                new, done = self.chunks[sent:], self.done
+            sent += len(new)
+            yield from new
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+            if not new and on_wait is not None:
+                on_wait()
+
+    def wait(self, on_wait=None):
+        """Blocks until the turn is done and returns the whole answer. Arguments as for `follow`."""
+        for _ in self.follow(on_wait):
+            pass
+        return self.text
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running in a daemon thread, for driving the engine from synchronous code.
+
+    Streamlit executes each script run on its own thread, while the engine's pooled HTTP client must
+    stay on a single event loop. One BackgroundLoop per process owns that loop; script threads hand
+    coroutines to it and wait for the results, so many conversations share one loop and one pool.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="chat-engine-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedules a coroutine on the loop and returns its concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None, on_wait=None):
+        """
+        Runs a coroutine on the loop and blocks the calling thread until it finishes.
+
+        Args:
+            coro: The coroutine.
+            timeout (float or None): Seconds to wait at most.
+            on_wait (callable or None): Called on the calling thread every WAIT_POLL_INTERVAL seconds
+                                        while the result is pending, e.g. to show progress.
+        """
+        future = self.submit(coro)
+        if on_wait is None:
+            return future.result(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return future.result(WAIT_POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+                on_wait()
+
+    def start_turn(self, session, prompt, answer, trace, on_done=None):
+        """
+        Starts generating an answer in the background and makes it the session's pending turn. The
+        session's previous pending turn, if still running, is cancelled: the user has moved on.
+
+        Args:
+            session (ChatSession): The conversation.
+            prompt (str): The user message.
+            answer: `engine.stream(session, prompt, trace, ...)`, or the coroutine `engine.reply(...)` for
+                    an answer in one piece. The engine commits the turn to the history when it completes.
+            trace (TurnTrace): The trace passed to the engine.
+            on_done (callable or None): Called with the turn in a worker thread once it is done, completed
+                                        or not, e.g. to record its trace and save the session.
+
+        Returns:
+            BackgroundTurn: The new turn.
+        """
+        previous = session.pending_turn
+        if previous is not None:
+            previous.cancel()
+        turn = BackgroundTurn(prompt, trace, len(session.messages))
+        turn._future = self.submit(self._run_turn(turn, answer, on_done))
+        turn._future.add_done_callback(lambda future: self._cancelled_early(future, turn, answer))
+        session.pending_turn = turn
+        return turn
+
+    @staticmethod
+    def _cancelled_early(future, turn, answer):
+        # A turn cancelled before the loop got to it never runs `_run_turn`, so it is settled here
+        if future.cancelled() and not turn.done and turn.trace.outcome is None and not turn._started:
+            turn.trace.outcome = "cancelled"
+            if inspect.iscoroutine(answer):
+                answer.close()
+            turn._publish(done=True)
+
+    async def _run_turn(self, turn, answer, on_done):
+        turn._started = True
+        generation = asyncio.ensure_future(self._generate(turn, answer))
+        try:
+            # Watch for abandonment while the answer is generated
+            while not generation.done():
+                await asyncio.wait({generation}, timeout=TURN_ABANDON_SECONDS / 2)
+                if not generation.done() and time.monotonic() - turn.followed > TURN_ABANDON_SECONDS:
+                    logger.info("Nobody followed the turn for %.0f s; cancelling it.", TURN_ABANDON_SECONDS)
+                    turn.cancelled = True
+                    generation.cancel()
+                    await asyncio.wait({generation})
+        except asyncio.CancelledError:
+            generation.cancel()
+            await asyncio.wait({generation})
+            raise
+        finally:
+            if turn.cancelled:
+                turn.trace.outcome = "cancelled"
+            elif generation.done() and not generation.cancelled() and generation.exception() is not None:
+                turn.error = generation.exception()
+            turn._publish(done=True)
+            if on_done is not None:
+                # Saving the session may block on the session store, so it stays off the loop
+                self.loop.run_in_executor(None, on_done, turn)
+
+    @staticmethod
+    async def _generate(turn, answer):
+        if inspect.iscoroutine(answer):
+            turn._publish(await answer)
+            return
+        async for chunk in answer:
+            turn._publish(chunk)
@@ -0,0 +1,331 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+from .response_cache import SEMANTIC_CACHE, normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+# --- Semantic cache configuration ---
+# SEMANTIC_CACHE (on/off) is read in response_cache.py, so that the engine can check it without importing numpy
+SEMANTIC_CACHE_FEATURES = 2 ** 12      # hashed n-gram dimensions per vector
+SEMANTIC_CACHE_NGRAMS = (2, 4)         # character n-gram sizes, inclusive
+SEMANTIC_CACHE_MAX_ENTRIES = 1000      # per language; the least recently used entry is replaced when full
+# Cosine similarity needed for a hit. Kept high on purpose: "ibuprofen with aspirin" and "ibuprofen with alcohol"
+# share most of their n-grams, and a wrong medical answer is worse than an extra API call.
+SEMANTIC_CACHE_THRESHOLD = 0.9
+SEMANTIC_CACHE_SAVE_EVERY = 50         # inserts between automatic saves when a directory is configured
+SEMANTIC_CACHE_REWEIGHT_EVERY = 100    # inserts between recomputations of the IDF weights of the whole index
+# Set SEMANTIC_CACHE_DIR to persist the index to disk and load it (memory-mapped) on start-up
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR")
+
+
+# --- Guard terms ---
+# Words that change a medical answer while barely changing the n-grams of a prompt: "500 mg" and "5000 mg",
+# a "2 year old" and a "12 year old", "can I" and "can I not". A stored answer is only served when the
+# prompt has exactly the same numbers and the same of these words (see `guard_terms`).
+UNIT_WORDS = frozenset("""
+    mg mcg µg ug g gm gms gram grams kg kgs kilo kilos ml mls l litre litres liter liters iu unit units
+    tablet tablets tab tabs pill pills capsule capsules cap caps drop drops puff puffs dose doses
+    tsp teaspoon teaspoons tbsp tablespoon tablespoons percent mmhg bpm
+    मिलीग्राम ग्राम मिली मिलीलीटर किलो लीटर गोली गोलियां गोलियाँ खुराक बूंद बूँद
+    মিলিগ্রাম গ্রাম মিলি মিলিলিটার কেজি লিটার ট্যাবলেট বড়ি ডোজ ফোঁটা
+""".split())
+AGE_WORDS = frozenset("""
+    year years yr yrs yo month months week weeks day days old age aged
+    newborn newborns infant infants baby babies toddler toddlers child children kid kids teen teens
+    teenager teenagers adolescent adult adults elderly senior seniors pregnant pregnancy breastfeeding
+    साल वर्ष महीने महीना हफ्ते सप्ताह दिन उम्र नवजात शिशु बच्चा बच्चे बच्ची बुजुर्ग गर्भवती
+    বছর মাস সপ্তাহ দিন বয়স নবজাতক শিশু বাচ্চা বয়স্ক গর্ভবতী
+""".split())
+NEGATION_WORDS = frozenset("""
+    no not never without none nor neither cannot cant dont doesnt didnt isnt arent wasnt shouldnt wont
+    avoid stop
+    नहीं नही न मत बिना
+    না নয় নেই নাই ছাড়া
+""".split())
+NUMBER_WORDS = frozenset("""
+    zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen
+    sixteen seventeen eighteen nineteen twenty thirty forty fifty sixty seventy eighty ninety hundred
+    thousand half quarter double twice once
+    एक दो तीन चार पांच पाँच छह सात आठ नौ दस बीस सौ हजार हज़ार आधा आधी दुगना
+    এক দুই তিন চার পাঁচ ছয় সাত আট নয় দশ বিশ একশ হাজার আধা অর্ধেক দ্বিগুণ
+""".split())
+GUARD_WORDS = UNIT_WORDS | AGE_WORDS | NEGATION_WORDS | NUMBER_WORDS
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def _ascii_digits(number):
+    return "".join(str(unicodedata.digit(char)) if char.isdigit() else "." for char in number)
+
+
+def guard_terms(text):
+    """
+    Returns what must be identical in two prompts for one's answer to be served for the other.
+
+    That is the numbers (in any script, so "५००" equals "500"), and the unit, age, negation and
+    number words of the prompt. Contractions count as negations ("don't" like "do not").
+
+    Args:
+        text (str): The prompt.
+
+    Returns:
+        tuple: The sorted numbers and the sorted guard words.
+    """
+    text = unicodedata.normalize("NFC", text).casefold().replace("\u2019", "'").replace("n't", " not")
+    numbers = sorted(_ascii_digits(number).rstrip(".") for number in _NUMBER.findall(text))
+    # Split digits from letters, so that "500mg" yields the unit "mg"
+    words = re.sub(r"\d+", " ", normalize_prompt(text)).split()
+    return tuple(numbers), tuple(sorted({word for word in words if word in GUARD_WORDS}))
+
+
+def vectorize(text, n_features=SEMANTIC_CACHE_FEATURES, ngram_range=SEMANTIC_CACHE_NGRAMS):
+    """
+    Turns a prompt into a hashed character n-gram term-frequency vector, locally and without any network call.
+
+    Character n-grams make the vector robust to inflections, typos and Indic scripts without a
+    language-specific tokenizer. Term frequencies are dampened as `1 + log(tf)`; the IDF weighting is
+    applied by the index, which knows the document frequencies.
+
+    Args:
+        text (str): The prompt.
+        n_features (int): The vector size.
+        ngram_range (tuple): The smallest and largest n-gram size.
+
+    Returns:
+        numpy.ndarray: A float32 vector of length `n_features`.
+    """
+    text = f" {normalize_prompt(text)} "
+    indices = [
+        zlib.crc32(text[i:i + n].encode("utf-8")) % n_features
+        for n in range(ngram_range[0], ngram_range[1] + 1)
+        for i in range(len(text) - n + 1)
+    ]
+    vector = np.zeros(n_features, dtype=np.float32)
+    if indices:
+        np.add.at(vector, np.asarray(indices), 1.0)
+        nonzero = vector > 0
+        vector[nonzero] = 1.0 + np.log(vector[nonzero])
+    return vector
+
+
+class SemanticIndex:
+    """
+    A bounded matrix index of prompt vectors and their answers for one language.
+
+    Args:
+        capacity (int): The maximum number of entries.
+        n_features (int): The vector size.
+    """
+
+    def __init__(self, capacity=SEMANTIC_CACHE_MAX_ENTRIES, n_features=SEMANTIC_CACHE_FEATURES):
+        self.capacity = capacity
+        self.vectors = np.zeros((capacity, n_features), dtype=np.float32)
+        self.doc_freq = np.zeros(n_features, dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.prompts = []
+        self.answers = []
+        self._idf = None       # the IDF weights `_weighted` was built with
+        self._weighted = None  # IDF-weighted, L2-normalized copy of the stored vectors
+        self._stale_inserts = 0
+
+    def __len__(self):
+        return len(self.answers)
+
+    def _reweight(self):
+        """Recomputes the IDF weights from the current document frequencies and reweights every entry."""
+        self._idf = np.log((1.0 + len(self)) / (1.0 + self.doc_freq)) + 1.0
+        self._weighted = np.zeros(self.vectors.shape, dtype=np.float32)
+        self._weighted[:len(self)] = self._normalize_rows(self.vectors[:len(self)] * self._idf)
+        self._stale_inserts = 0
+
+    @staticmethod
+    def _normalize_rows(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def search(self, query_vectors):
+        """
+        Finds the most similar stored entry for each query in one batched matrix product.
+
+        Args:
+            query_vectors (numpy.ndarray): A (queries x features) matrix from `vectorize`.
+
+        Returns:
+            tuple: (best entry index per query, cosine similarity per query). Both are empty-safe:
+                   with no entries, every index is -1 and every score 0.
+        """
+        if not len(self):
+            return np.full(len(query_vectors), -1), np.zeros(len(query_vectors), dtype=np.float32)
+        if self._weighted is None:
+            self._reweight()
+        scores = self._normalize_rows(query_vectors * self._idf) @ self._weighted[:len(self)].T
+        best = scores.argmax(axis=1)
+        return best, scores[np.arange(len(best)), best]
+
+    def touch(self, index):
+        self.last_used[index] = time.time()
+
+    def insert(self, prompt, answer, vector):
+        """Stores an entry, replacing the least recently used one when the index is full."""
+        if len(self) < self.capacity:
+            index = len(self)
+            self.prompts.append(prompt)
+            self.answers.append(answer)
+        else:
+            index = int(self.last_used.argmin())
+            self.doc_freq -= self.vectors[index] > 0
+            self.prompts[index] = prompt
+            self.answers[index] = answer
+        self.vectors[index] = vector
+        self.doc_freq += vector > 0
+        self.touch(index)
+        # Reweighting the whole index takes milliseconds at full capacity, so between periodic
+        # recomputations a new entry is weighted with the IDF weights of the last one
+        self._stale_inserts += 1
+        if self._weighted is None or self._stale_inserts >= SEMANTIC_CACHE_REWEIGHT_EVERY:
+            self._weighted = None
+        else:
+            self._weighted[index] = self._normalize_rows((vector * self._idf)[None, :])[0]
+
+    def save(self, directory):
+        """Writes the index to `directory` as .npy arrays plus a JSON file with the texts."""
+        os.makedirs(directory, exist_ok=True)
+        # Write to temporary files and rename them into place: a loaded index may still be memory-mapping
+        # the old files, and overwriting them in place would corrupt it.
+        for name, array in (("vectors", self.vectors), ("doc_freq", self.doc_freq), ("last_used", self.last_used)):
+            path = os.path.join(directory, f"{name}.npy")
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{path}.tmp", path)
+        path = os.path.join(directory, "entries.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"prompts": self.prompts, "answers": self.answers}, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, directory, capacity=SEMANTIC_CACHE_MAX_ENTRIES, n_features=SEMANTIC_CACHE_FEATURES):
+        """
+        Loads an index written by `save`.
+
+        The vector matrix is memory-mapped copy-on-write, so start-up does not read it into memory and
+        new inserts never modify the file until the next save.
+        """
+        index = cls(capacity=0, n_features=n_features)
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="c")
+        with open(os.path.join(directory, "entries.json"), encoding="utf-8") as f:
+            entries = json.load(f)
+        if vectors.shape != (capacity, n_features):
+            raise ValueError(f"Stored index shape {vectors.shape} does not match ({capacity}, {n_features}).")
+        index.capacity = capacity
+        index.vectors = vectors
+        index.doc_freq = np.load(os.path.join(directory, "doc_freq.npy"))
+        index.last_used = np.load(os.path.join(directory, "last_used.npy"))
+        index.prompts = entries["prompts"]
+        index.answers = entries["answers"]
+        return index
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of past answers, with one index per language.
+
+    A prompt whose cosine similarity to a stored prompt reaches `threshold` gets the stored answer
+    (which, like every model answer, ends with the disclaimer), but only if both prompts have the same
+    numbers, units, ages and negations (see `guard_terms`): "500 mg" and "5000 mg" are one character
+    apart. If `directory` is set, existing indexes are loaded from it and the cache is saved back every
+    `save_every` inserts. Lookups and inserts take up to a few milliseconds at full capacity, so callers
+    on an event loop should run them in a thread; the cache is thread-safe.
+
+    Args:
+        enabled (bool): Whether the cache answers and stores anything at all.
+        threshold (float): The minimum cosine similarity for a hit.
+        capacity (int): The maximum number of entries per language.
+        directory (str or None): Where to persist the indexes.
+        save_every (int): Inserts between automatic saves.
+    """
+
+    def __init__(self, enabled=SEMANTIC_CACHE, threshold=SEMANTIC_CACHE_THRESHOLD, capacity=SEMANTIC_CACHE_MAX_ENTRIES,
+                 directory=SEMANTIC_CACHE_DIR, save_every=SEMANTIC_CACHE_SAVE_EVERY):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.capacity = capacity
+        self.directory = directory
+        self.save_every = save_every
+        self._indexes = {}
+        self._unsaved_inserts = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "guarded": 0, "inserts": 0}
+        if enabled and directory and os.path.isdir(directory):
+            for language in os.listdir(directory):
+                try:
+                    self._indexes[language] = SemanticIndex.load(os.path.join(directory, language), capacity=capacity)
+                except (OSError, ValueError, KeyError):
+                    logger.warning("Ignoring unreadable semantic cache index for %r.", language, exc_info=True)
+
+    def _index(self, language):
+        if language not in self._indexes:
+            self._indexes[language] = SemanticIndex(capacity=self.capacity)
+        return self._indexes[language]
+
+    def lookup_many(self, language, prompts):
+        """
+        Looks up several prompts at once.
+
+        Returns:
+            list: The cached answer for each prompt, or None where there is no close enough match.
+        """
+        if not self.enabled:
+            return [None] * len(prompts)
+        queries = np.stack([vectorize(prompt) for prompt in prompts])
+        with self._lock:
+            index = self._index(language)
+            best, scores = index.search(queries)
+            answers = []
+            for prompt, entry, score in zip(prompts, best, scores):
+                if entry >= 0 and score >= self.threshold and guard_terms(prompt) == guard_terms(index.prompts[entry]):
+                    index.touch(entry)
+                    answers.append(index.answers[entry])
+                    self.stats["hits"] += 1
+                else:
+                    answers.append(None)
+                    self.stats["misses"] += 1
+                    if entry >= 0 and score >= self.threshold:
+                        self.stats["guarded"] += 1
+            return answers
+
+    def get(self, language, prompt):
+        """Returns the cached answer for a prompt similar to `prompt`, or None."""
+        return self.lookup_many(language, [prompt])[0]
+
+    def put(self, language, prompt, answer):
+        """Stores the answer to `prompt`."""
+        if not self.enabled:
+            return
+        vector = vectorize(prompt)
+        with self._lock:
+            self._index(language).insert(prompt, answer, vector)
+            self.stats["inserts"] += 1
+            self._unsaved_inserts += 1
+            if self.directory and self._unsaved_inserts >= self.save_every:
+                self._save_locked()
+
+    def save(self):
+        """Writes every index to the configured directory."""
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        if not self.directory:
+            return
+        for language, index in self._indexes.items():
+            index.save(os.path.join(self.directory, language))
+        self._unsaved_inserts = 0
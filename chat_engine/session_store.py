@@ -0,0 +1,442 @@
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from .conversation import Conversation, Turn
+from .errors import SessionConflictError
+
+logger = logging.getLogger(__name__)
+
+# --- Session store configuration ---
+# Where conversations are kept: "memory://" (this process only), "sqlite:///path/to/sessions.db" (survives
+# restarts; share the file between replicas on one host) or "redis://host:6379/0" (needs `pip install redis`).
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "memory://")
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))  # unload sessions idle this long from memory
+SESSION_RETENTION_SECONDS = int(os.getenv("SESSION_RETENTION_SECONDS", str(30 * 24 * 3600)))  # then delete them
+MEMORY_RETENTION_SECONDS = 2 * SESSION_IDLE_SECONDS  # the memory backend shares the process, so it forgets sooner
+SESSION_PURGE_EVERY = 100  # saves between sweeps for expired sessions (SQLite and memory backends)
+REDIS_KEY_PREFIX = "medical-chat:session:"
+
+
+def new_session_id():
+    """Returns a random, URL-safe session id. It is the only credential for a conversation, so it must not be guessable."""
+    return secrets.token_urlsafe(16)
+
+
+# --- Backends ---
+
+class SessionStore:
+    """
+    Storage for conversations, keyed by session id.
+
+    A stored session is a small `state` dict (front-end settings such as the selected language) and
+    the list of its turns. Turns are only ever appended: `save` writes the new turns of a session in
+    one batch rather than rewriting the whole history, and only if the store holds exactly the turns
+    the caller has seen, so that replicas sharing a session never overwrite each other's turns.
+    Sessions not saved for `retention` seconds are deleted.
+    """
+
+    def load(self, session_id):
+        """
+        Returns:
+            tuple or None: `(state, turns)` with turns as `(role, text)` pairs, or None for an unknown session.
+        """
+        raise NotImplementedError
+
+    def turn_count(self, session_id):
+        """
+        Returns:
+            int or None: How many turns of the session are stored, or None for an unknown session.
+        """
+        raise NotImplementedError
+
+    def save(self, session_id, state, start, turns):
+        """
+        Replaces the state of a session and appends turns to it, atomically.
+
+        Args:
+            session_id (str): The session.
+            state (dict): The JSON-serializable session state.
+            start (int): How many turns of the session the caller has seen stored; `turns` continue from there.
+            turns (list): The new turns, as `(role, text)` pairs.
+
+        Raises:
+            SessionConflictError: If the store holds a different number of turns than `start` (another
+                                  replica saved turns meanwhile); nothing is saved then.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Keeps sessions in this process. Nothing survives a restart; for development and single-process use."""
+
+    def __init__(self, retention=MEMORY_RETENTION_SECONDS):
+        self.retention = retention
+        self._sessions = {}  # session id -> [state, turns, saved_at]
+        self._lock = threading.Lock()
+        self._saves = 0
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[2] <= time.time() - self.retention:
+                return None
+            return dict(entry[0]), list(entry[1])
+
+    def turn_count(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[2] <= time.time() - self.retention:
+                return None
+            return len(entry[1])
+
+    def save(self, session_id, state, start, turns):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[2] <= time.time() - self.retention:
+                entry = self._sessions[session_id] = [{}, [], 0.0]
+            if len(entry[1]) != start:
+                raise SessionConflictError(f"session has {len(entry[1])} stored turns, not {start}")
+            entry[0] = dict(state)
+            entry[1].extend(turns)
+            entry[2] = time.time()
+            self._saves += 1
+            if self._saves % SESSION_PURGE_EVERY == 0:
+                cutoff = time.time() - self.retention
+                for expired in [key for key, value in self._sessions.items() if value[2] <= cutoff]:
+                    del self._sessions[expired]
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Keeps sessions in a SQLite database in WAL mode, so readers never block the writer and several
+    worker processes on one host can share the file.
+
+    Args:
+        path (str): The database file.
+        retention (float): Seconds after the last save before a session is deleted.
+    """
+
+    def __init__(self, path, retention=SESSION_RETENTION_SECONDS):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; only the last commits can be lost on power failure
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, saved_at REAL NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_turns (session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,"
+            " text TEXT NOT NULL, PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+        )
+        self._purge()
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so concurrent writers queue instead of failing mid-transaction
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        with self._transaction():
+            self._db.execute("DELETE FROM session_turns WHERE session_id IN (SELECT id FROM sessions WHERE saved_at <= ?)", (cutoff,))
+            self._db.execute("DELETE FROM sessions WHERE saved_at <= ?", (cutoff,))
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM sessions WHERE id = ? AND saved_at > ?", (session_id, time.time() - self.retention)
+            ).fetchone()
+            if row is None:
+                return None
+            turns = self._db.execute("SELECT role, text FROM session_turns WHERE session_id = ? ORDER BY seq", (session_id,)).fetchall()
+        return json.loads(row[0]), turns
+
+    def _turn_count(self, session_id):
+        """The stored turns of a session that has not expired, or None; call with the lock held."""
+        row = self._db.execute(
+            "SELECT (SELECT COALESCE(MAX(seq) + 1, 0) FROM session_turns WHERE session_id = sessions.id) FROM sessions"
+            " WHERE id = ? AND saved_at > ?", (session_id, time.time() - self.retention)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def turn_count(self, session_id):
+        with self._lock:
+            return self._turn_count(session_id)
+
+    def save(self, session_id, state, start, turns):
+        with self._lock:
+            with self._transaction():
+                stored = self._turn_count(session_id)
+                if stored is None:
+                    # New, or expired but not purged yet: start over
+                    self._db.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+                    stored = 0
+                if stored != start:
+                    raise SessionConflictError(f"session has {stored} stored turns, not {start}")
+                self._db.execute(
+                    "INSERT INTO sessions (id, state, saved_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET state = excluded.state, saved_at = excluded.saved_at",
+                    (session_id, json.dumps(state), time.time()),
+                )
+                self._db.executemany(
+                    "INSERT INTO session_turns (session_id, seq, role, text) VALUES (?, ?, ?, ?)",
+                    [(session_id, start + i, role, text) for i, (role, text) in enumerate(turns)],
+                )
+            self._saves += 1
+            if self._saves % SESSION_PURGE_EVERY == 0:
+                self._purge()
+
+    def delete(self, session_id):
+        with self._lock:
+            with self._transaction():
+                self._db.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Keeps sessions in Redis (or anything speaking its protocol), so replicas on different hosts share them.
+
+    Each session is a JSON string with its state and a list of JSON-encoded turns. Both keys expire
+    after `retention` seconds without a save, so Redis does the cleanup. Saves WATCH the turn list,
+    so a concurrent save from another replica makes one of them fail with a conflict.
+
+    Args:
+        client: A `redis.Redis` client (or one with the same interface).
+        retention (float): Seconds after the last save before a session expires.
+        prefix (str): Prepended to every key.
+    """
+
+    def __init__(self, client, retention=SESSION_RETENTION_SECONDS, prefix=REDIS_KEY_PREFIX):
+        self.client = client
+        self.retention = int(retention)
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The Redis session store needs the redis package: pip install redis") from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _keys(self, session_id):
+        return f"{self.prefix}{session_id}:state", f"{self.prefix}{session_id}:turns"
+
+    def load(self, session_id):
+        state_key, turns_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(state_key)
+        pipe.lrange(turns_key, 0, -1)
+        state, turns = pipe.execute()
+        if state is None:
+            return None
+        return json.loads(state), [tuple(json.loads(turn)) for turn in turns]
+
+    def turn_count(self, session_id):
+        state_key, turns_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(state_key)
+        pipe.llen(turns_key)
+        exists, count = pipe.execute()
+        return count if exists else None
+
+    def save(self, session_id, state, start, turns):
+        from redis.exceptions import WatchError
+
+        state_key, turns_key = self._keys(session_id)
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.watch(turns_key)
+            stored = pipe.llen(turns_key)
+            if stored != start:
+                raise SessionConflictError(f"session has {stored} stored turns, not {start}")
+            pipe.multi()
+            pipe.set(state_key, json.dumps(state), ex=self.retention)
+            if turns:
+                pipe.rpush(turns_key, *(json.dumps(turn, ensure_ascii=False) for turn in turns))
+            pipe.expire(turns_key, self.retention)
+            try:
+                pipe.execute()
+            except WatchError:
+                raise SessionConflictError("session turns were saved concurrently") from None
+
+    def delete(self, session_id):
+        self.client.delete(*self._keys(session_id))
+
+    def close(self):
+        self.client.close()
+
+
+def open_session_store(url=None):
+    """
+    Opens the session store for a URL (see SESSION_STORE_URL, the default).
+
+    Returns:
+        SessionStore: A MemorySessionStore for `memory://`, a SQLiteSessionStore for `sqlite:///path`,
+                      or a RedisSessionStore for `redis://` and `rediss://` URLs.
+    """
+    url = url or SESSION_STORE_URL
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemorySessionStore()
+    if scheme == "sqlite":
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    if scheme in ("redis", "rediss"):
+        return RedisSessionStore.from_url(url)
+    raise ValueError(f"Unsupported session store URL: {url!r}")
+
+
+# --- Live sessions ---
+
+class SessionManager:
+    """
+    Process-wide registry of the sessions in memory, backed by a SessionStore.
+
+    Sessions are loaded from the store the first time they are asked for and unloaded again once
+    nobody has used them for `idle_seconds`; the store keeps them meanwhile. Front-ends keep only
+    the session id (e.g. in the URL), so a restart or another replica can pick the conversation up.
+    Saves of one session are serialized, so turns finished on the engine's executor and saves from
+    the script thread never store a turn twice or skip one. Replicas sharing a session never overwrite
+    each other's turns: a session in memory is reloaded when the store holds turns it has not seen,
+    and a save that finds such turns keeps them and appends its own after them.
+
+    Args:
+        store (SessionStore): Where the sessions are kept.
+        idle_seconds (float): How long an unused session stays in memory.
+    """
+
+    def __init__(self, store, idle_seconds=SESSION_IDLE_SECONDS):
+        self.store = store
+        self.idle_seconds = idle_seconds
+        self._live = OrderedDict()  # session id -> (ChatSession, last used), least recently used first
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "loaded": 0, "unloaded": 0, "saves": 0, "turns_saved": 0, "conflicts": 0}
+
+    def _touch(self, session):
+        self._live[session.session_id] = (session, time.monotonic())
+        self._live.move_to_end(session.session_id)
+
+    def _unload_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._live:
+            session, last_used = next(iter(self._live.values()))
+            if last_used > cutoff:
+                break
+            del self._live[session.session_id]
+            self.stats["unloaded"] += 1
+
+    def get(self, session_id, restore):
+        """
+        Returns the session with this id, loading it from the store if it is not in memory or if
+        another replica has saved turns to it since.
+
+        Args:
+            session_id (str): The session id.
+            restore (callable): `restore(state) -> ChatSession`; creates an empty session for stored
+                                state. The stored turns are then added to it.
+
+        Returns:
+            ChatSession or None: The session, or None if the store does not know the id.
+        """
+        with self._lock:
+            self._unload_idle()
+            live = self._live.get(session_id)
+        if live is not None and self.store.turn_count(session_id) in (None, live[0].saved_turns):
+            with self._lock:
+                if self._live.get(session_id) is live:
+                    self._touch(live[0])
+            return live[0]
+        stored = self.store.load(session_id)
+        if stored is None:
+            return None
+        state, turns = stored
+        session = restore(state)
+        session.session_id = session_id
+        session.state = state
+        session.messages = Conversation(Turn(role, text) for role, text in turns)
+        session.saved_turns = len(turns)
+        with self._lock:
+            current = self._live.get(session_id)
+            if current is not None and current is not live:  # loaded concurrently by another script run
+                return current[0]
+            self._touch(session)
+            self.stats["loaded"] += 1
+        return session
+
+    def add(self, session):
+        """Registers a new session under a fresh id and stores it. Returns the session."""
+        session.session_id = new_session_id()
+        with self._lock:
+            self._unload_idle()
+            self._touch(session)
+            self.stats["created"] += 1
+        self.save(session)
+        return session
+
+    def save(self, session):
+        """
+        Stores the session's state and the turns added since the last save.
+
+        If another replica saved turns to the session meanwhile, they are loaded into `session.messages`
+        first and the new turns are stored after them.
+        """
+        conflicts = 0
+        with session.save_lock:
+            new_turns = [(turn.role, turn.text) for turn in session.messages[session.saved_turns:]]
+            while True:
+                try:
+                    self.store.save(session.session_id, session.state, session.saved_turns, new_turns)
+                    break
+                except SessionConflictError:
+                    conflicts += 1
+                    stored = self.store.load(session.session_id)
+                    stored_turns = stored[1] if stored is not None else []
+                    session.messages = Conversation(
+                        [*(Turn(role, text) for role, text in stored_turns), *session.messages[session.saved_turns:]])
+                    session.saved_turns = len(stored_turns)
+            session.saved_turns += len(new_turns)
+        if conflicts:
+            logger.info("Session %s was saved by another replica; appended this one's turns after its turns.",
+                        session.session_id)
+        with self._lock:
+            self.stats["saves"] += 1
+            self.stats["turns_saved"] += len(new_turns)
+            self.stats["conflicts"] += conflicts
+
+    def discard(self, session_id):
+        """Forgets a session, in memory and in the store."""
+        with self._lock:
+            self._live.pop(session_id, None)
+        self.store.delete(session_id)
+
+    @property
+    def live_count(self):
+        return len(self._live)
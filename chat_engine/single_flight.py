@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import os
+from contextlib import aclosing
+
+from .conversation import request_body
+
+# --- Single-flight configuration ---
+# Set SINGLE_FLIGHT=0 to send every request upstream even while an identical one is in flight
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+
+
+def flight_key(system_prompt, contents, stream):
+    """
+    Returns the coalescing key of a generate request: a hash of everything that goes into its payload.
+
+    Args:
+        system_prompt (str): The system instruction.
+        contents (list): The Turn objects to send.
+        stream (bool): Whether the answer is streamed; streamed and whole requests never share a flight.
+    """
+    digest = hashlib.sha256(b"stream\0" if stream else b"generate\0")
+    digest.update(system_prompt.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(request_body(contents))
+    return digest.hexdigest()
+
+
+async def _once(coroutine):
+    yield await coroutine
+
+
+class Flight:
+    """
+    One upstream request and everything it has produced so far, shared by its subscribers.
+
+    Attributes:
+        trace (TurnTrace): The trace of the subscriber that started it; receives the request's spans.
+        items (list): What the request produced so far: the parsed response, or the pieces of a streamed answer.
+        done (bool): Whether the request has finished.
+        error (Exception or None): What it failed with, if it did.
+        subscribers (int): Callers currently reading it.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.items = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, item):
+        self.items.append(item)
+        self._notify()
+
+    def finish(self, error=None):
+        self.error = error
+        self.done = True
+        self._notify()
+
+    async def changed(self):
+        """Waits until the next item is published or the flight finishes."""
+        await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent API requests into one upstream call.
+
+    When a topic trends, many sessions send the same opening question within seconds: same system prompt,
+    same greeting, same question, so byte-identical payloads. The first caller starts the request in a
+    task of its own; callers with the same `flight_key` that arrive while it is in flight subscribe to it
+    instead of sending their own. Streamed answers fan out: a late subscriber first gets the pieces that
+    already arrived, then the rest as they come. A subscriber that leaves does not stop the request for
+    the others; it is cancelled when the last one leaves. Finished flights are forgotten at once, so
+    this is not a cache (see ResponseCache for that).
+
+    Must be used from one event loop. Coalesced turns are marked in their TurnTrace (`coalesced`), and
+    `Metrics` counts them as upstream calls saved.
+
+    Args:
+        enabled (bool): Whether requests are coalesced at all.
+
+    Attributes:
+        stats (dict): `flights` (upstream requests started) and `joined` (requests coalesced into one of them).
+    """
+
+    def __init__(self, enabled=SINGLE_FLIGHT):
+        self.enabled = enabled
+        self.stats = {"flights": 0, "joined": 0}
+        self._flights = {}
+
+    def _join(self, key, start, trace):
+        flight = self._flights.get(key) if self.enabled else None
+        if flight is None:
+            flight = Flight(trace)
+            flight.task = asyncio.ensure_future(self._fly(key, flight, start()))
+            if self.enabled:
+                self._flights[key] = flight
+            self.stats["flights"] += 1
+        else:
+            trace.coalesced = True
+            self.stats["joined"] += 1
+        flight.subscribers += 1
+        return flight
+
+    async def _fly(self, key, flight, items):
+        error = None
+        try:
+            async for item in items:
+                flight.publish(item)
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._forget(key, flight)
+            flight.finish(error)
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _leave(self, key, flight):
+        flight.subscribers -= 1
+        if not flight.subscribers and not flight.done:
+            self._forget(key, flight)
+            flight.task.cancel()
+
+    async def stream(self, key, start, trace):
+        """
+        Subscribes to the flight for `key`, starting it if there is none.
+
+        Args:
+            key (str): See `flight_key`.
+            start (callable): Returns the async iterator that performs the request; only called to start a flight.
+            trace (TurnTrace): The caller's trace; marked `coalesced` if the caller joined another's request.
+
+        Yields:
+            The items of the request, from the first one.
+
+        Raises:
+            The exception the request failed with.
+        """
+        flight = self._join(key, start, trace)
+        sent = 0
+        try:
+            while True:
+                if sent < len(flight.items):
+                    sent += 1
+                    yield flight.items[sent - 1]
+                elif flight.done:
+                    if trace.coalesced:
+                        trace.model = flight.trace.model
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.changed()
+        finally:
+            self._leave(key, flight)
+
+    async def run(self, key, start, trace):
+        """
+        Like `stream`, for a request with a single result.
+
+        Args:
+            start (callable): Returns the coroutine that performs the request.
+
+        Returns:
+            The coroutine's result.
+        """
+        async with aclosing(self.stream(key, lambda: _once(start()), trace)) as results:
+            async for result in results:
+                return result
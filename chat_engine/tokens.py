@@ -0,0 +1,22 @@
+import math
+
+MESSAGE_OVERHEAD_TOKENS = 4  # per-message cost of the role/parts framing
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a piece of text without calling the API.
+
+    Latin text averages about four characters per token. Devanagari and Bengali script tokenize far
+    less efficiently, so every non-ASCII character is counted as half a token.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated token count.
+    """
+    if text.isascii():
+        return math.ceil(len(text) / 4)
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return math.ceil((len(text) - non_ascii) / 4 + non_ascii / 2)
@@ -0,0 +1,373 @@
+import functools
+import os
+import re
+
+from .response_cache import normalize_prompt
+
+# --- Pre-filter configuration ---
+# Set TRIAGE_ENABLED=0 to send every message to the model
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "1") == "1"
+TRIAGE_EMERGENCY_THRESHOLD = 1.0  # red-flag score from which the emergency banner is shown
+# Set TRIAGE_REFUSE_OFF_TOPIC=1 to refuse clearly off-topic messages locally instead of calling the model. Off by
+# default: a keyword list cannot tell "who won the election" from "who won the Nobel prize for penicillin",
+# and a wrongly refused health question is worse than an API call spent on small talk (the system prompt
+# keeps the model on topic anyway).
+TRIAGE_REFUSE_OFF_TOPIC = os.getenv("TRIAGE_REFUSE_OFF_TOPIC", "0") == "1"
+# Weight an off-topic phrase needs to refuse a message. Off-topic weights are not summed: only one strong,
+# unambiguous phrase refuses, and any medical term vetoes the refusal.
+TRIAGE_OFF_TOPIC_THRESHOLD = 1.0
+
+# Verdicts
+EMERGENCY = "emergency"  # red-flag symptoms: answered by the model, with an emergency banner shown at once
+OFF_TOPIC = "off_topic"  # clearly not a health question: refused locally (with TRIAGE_REFUSE_OFF_TOPIC=1)
+MEDICAL = "medical"      # everything else: answered by the model
+
+# Framings. A general question about red flags ("what are the symptoms of a stroke?") only gets the
+# emergency banner for a strong term, unless it also places the symptoms on someone ("my father has").
+GENERAL = "general"
+PERSONAL = "personal"
+KINDS = (EMERGENCY, MEDICAL, OFF_TOPIC, GENERAL, PERSONAL)
+
+# --- Lexicons ---
+# Weighted terms per language and kind. A message's score per kind is the sum of the weights of the
+# distinct terms it contains, so a weak red flag (0.5) needs a second one to reach the threshold.
+# Terms are matched after normalize_prompt (case folded, punctuation replaced by spaces), so "can't"
+# is written "can t". English terms match whole words; a trailing "*" matches any word ending. Hindi
+# and Bengali terms match anywhere, as their vowel signs are not word characters for `re`.
+# English is checked in every language, since users mix it into Hindi and Bengali messages.
+LEXICONS = {
+    "English": {
+        EMERGENCY: {
+            "chest pain radiating": 1.0, "crushing chest pain": 1.0, "severe chest pain": 1.0,
+            "having a heart attack": 1.0, "having a stroke": 1.0, "having a seizure": 1.0,
+            "can t breathe": 1.0, "cannot breathe": 1.0, "not breathing": 1.0, "stopped breathing": 1.0,
+            "struggling to breathe": 1.0, "choking": 1.0, "unconscious": 1.0, "passed out": 1.0,
+            "unresponsive": 1.0, "face drooping": 1.0, "slurred speech": 1.0, "severe bleeding": 1.0,
+            "bleeding heavily": 1.0, "won t stop bleeding": 1.0, "coughing up blood": 1.0, "vomiting blood": 1.0,
+            "suicid*": 1.0, "kill myself": 1.0, "end my life": 1.0, "want to die": 1.0, "overdos*": 1.0,
+            "poisoned": 1.0, "swallowed bleach": 1.0, "convulsion*": 1.0, "anaphyla*": 1.0,
+            "throat is closing": 1.0, "throat swelling": 1.0, "blue lips": 1.0, "snake bit*": 1.0,
+            "snakebite": 1.0, "bitten by a snake": 1.0, "worst headache of my life": 1.0, "one side of my face": 1.0,
+            "chest pain": 0.5, "chest pressure": 0.5, "chest tightness": 0.5, "tightness in my chest": 0.5,
+            "pain in my chest": 0.5, "left arm": 0.5, "jaw pain": 0.5, "radiating": 0.5, "heart attack": 0.5,
+            "stroke": 0.5, "seizure": 0.5, "shortness of breath": 0.5, "short of breath": 0.5,
+            "difficulty breathing": 0.5, "trouble breathing": 0.5, "cold sweat": 0.5, "sweating": 0.5,
+            "fainted": 0.5, "fainting": 0.5, "sudden numbness": 0.5, "sudden weakness": 0.5, "stiff neck": 0.5,
+            "very high fever": 0.5, "confused": 0.5, "poison*": 0.5, "bleeding": 0.5,
+            # Swallowed poison and overdoses (see also RED_FLAG_PATTERNS)
+            "rat poison": 1.0, "pesticide*": 1.0, "insecticide*": 1.0, "weed killer": 1.0, "too many pills": 1.0,
+            "too many tablets": 1.0, "whole bottle of": 1.0, "whole strip of": 1.0, "sleeping pills": 0.5,
+            "swallowed": 0.5, "drank": 0.5, "bleach": 0.5, "kerosene": 0.5, "acid": 0.5,
+            # Unresponsive or collapsed
+            "collapsed": 1.0, "lost consciousness": 1.0, "not conscious": 1.0, "won t wake up": 1.0,
+            "can t wake": 1.0, "cannot wake": 1.0, "not waking up": 1.0, "isn t waking up": 1.0,
+            "isn t responding": 1.0, "not responding": 0.5, "lips turned blue": 1.0, "lips are blue": 1.0,
+            "lips turning blue": 1.0, "turning blue": 1.0, "turned blue": 1.0,
+            # Chest and arm pain
+            "chest hurts": 0.5, "chest is hurting": 0.5, "chest hurting": 0.5, "weight on my chest": 0.5,
+            "pressure on my chest": 0.5, "arm is numb": 0.5, "arm feels numb": 0.5, "numb arm": 0.5,
+            "numbness in my arm": 0.5, "arm numbness": 0.5,
+            "don t want to live": 1.0,
+        },
+        MEDICAL: {
+            "pain": 1.0, "painful": 1.0, "ache*": 1.0, "fever": 1.0, "cough*": 1.0, "cold": 1.0, "flu": 1.0, "headache*": 1.0,
+            "sick": 1.0, "ill": 1.0, "illness": 1.0, "disease*": 1.0, "symptom*": 1.0, "doctor*": 1.0, "medicine*": 1.0,
+            "medication*": 1.0, "medical": 1.0, "drug*": 1.0, "tablet*": 1.0, "pill*": 1.0, "dose": 1.0, "dosage": 1.0,
+            "health*": 1.0, "diet*": 1.0, "nutrition*": 1.0, "vitamin*": 1.0, "hospital*": 1.0, "blood": 1.0, "heart": 1.0,
+            "lung*": 1.0, "kidney*": 1.0, "liver": 1.0, "skin": 1.0, "rash*": 1.0, "infect*": 1.0, "virus*": 1.0, "bacteria*": 1.0,
+            "allerg*": 1.0, "diabet*": 1.0, "cancer": 1.0, "pregnan*": 1.0, "period": 1.0, "periods": 1.0, "injur*": 1.0,
+            "wound*": 1.0, "vomit*": 1.0, "nause*": 1.0, "diarrh*": 1.0, "sleep*": 1.0, "insomnia": 1.0, "stress*": 1.0,
+            "anxi*": 1.0, "depress*": 1.0, "weight": 1.0, "exercis*": 1.0, "hydrat*": 1.0, "body": 1.0, "throat": 1.0,
+            "stomach": 1.0, "tooth": 1.0, "teeth": 1.0, "eye": 1.0, "eyes": 1.0, "ear": 1.0, "ears": 1.0, "treatment*": 1.0,
+            "cure": 1.0, "therapy": 1.0, "surgery": 1.0, "vaccin*": 1.0, "covid": 1.0, "bp": 1.0, "mental": 1.0, "breath*": 1.0,
+            "pulse": 1.0, "fatigue": 1.0, "tired": 1.0, "dizz*": 1.0, "swell*": 1.0, "swollen": 1.0, "itch*": 1.0, "burn*": 1.0,
+            "sore": 1.0, "calorie*": 1.0, "protein": 1.0, "cholesterol": 1.0, "asthma": 1.0, "migraine*": 1.0, "bone*": 1.0,
+            "muscle*": 1.0, "joint*": 1.0, "back": 1.0, "fracture*": 1.0, "sprain*": 1.0, "nurse": 1.0, "clinic": 1.0,
+            "paracetamol": 1.0, "ibuprofen": 1.0, "antibiotic*": 1.0, "metformin": 1.0, "insulin": 1.0, "smok*": 1.0,
+            "alcohol": 1.0, "sugar": 1.0, "pressure": 1.0, "baby": 1.0, "child s": 1.0, "constipat*": 1.0, "acidity": 1.0,
+            # Conditions, care and records
+            "arrhythmi*": 1.0, "hypertensi*": 1.0, "hypotensi*": 1.0, "chemo*": 1.0, "radiotherapy": 1.0, "dialysis": 1.0,
+            "thyroid": 1.0, "arthritis": 1.0, "epilep*": 1.0, "tuberculosis": 1.0, "tb": 1.0, "malaria": 1.0, "dengue": 1.0,
+            "typhoid": 1.0, "jaundice": 1.0, "hepatitis": 1.0, "hiv": 1.0, "anemi*": 1.0, "anaemi*": 1.0, "pcos": 1.0,
+            "pcod": 1.0, "ulcer*": 1.0, "acne": 1.0, "eczema": 1.0, "psoriasis": 1.0, "obes*": 1.0, "adhd": 1.0,
+            "autis*": 1.0, "dementia": 1.0, "alzheimer*": 1.0, "parkinson*": 1.0, "bipolar": 1.0, "tumou*": 1.0,
+            "tumor*": 1.0, "disorder*": 1.0, "syndrome": 1.0, "chronic": 1.0, "pacemaker": 1.0, "operation": 1.0,
+            "diagnos*": 1.0, "prescri*": 1.0, "pharmac*": 1.0, "chemist": 1.0, "icd": 1.0, "patient*": 1.0,
+            "dentist*": 1.0, "dental": 1.0, "physiotherap*": 1.0, "pediatric*": 1.0, "paediatric*": 1.0, "cardiac": 1.0,
+            "x ray": 1.0, "mri": 1.0, "ecg": 1.0, "ultrasound": 1.0, "first aid": 1.0, "ambulance": 1.0, "cpr": 1.0,
+            "bmi": 1.0, "menopaus*": 1.0, "menstrua*": 1.0, "contracepti*": 1.0, "breastfeed*": 1.0, "side effect*": 1.0,
+            # Medicines
+            "aspirin": 1.0, "antacid*": 1.0, "antihistamine*": 1.0, "cetirizine": 1.0, "amoxicillin": 1.0,
+            "azithromycin": 1.0, "omeprazole": 1.0, "pantoprazole": 1.0, "statin*": 1.0, "steroid*": 1.0,
+            "inhaler*": 1.0, "ors": 1.0, "syrup*": 1.0, "ointment*": 1.0, "capsule*": 1.0, "injection*": 1.0,
+            "antidepressant*": 1.0, "painkiller*": 1.0, "penicillin": 1.0, "cramp*": 1.0, "melatonin": 1.0,
+            # Populations
+            "newborn*": 1.0, "infant*": 1.0, "toddler*": 1.0, "babies": 1.0, "child": 1.0, "children": 1.0, "kids": 1.0,
+            "elderly": 1.0, "senior citizen*": 1.0, "old age": 1.0,
+        },
+        # Only requests that cannot be about health: topics ("election", "football match") can be
+        OFF_TOPIC: {
+            "write a poem": 1.0, "write me a poem": 1.0, "write a story": 1.0, "write an essay": 1.0,
+            "write code": 1.0, "python code": 1.0, "javascript": 1.0, "stock price": 1.0, "stock market": 1.0,
+            "share price": 1.0, "bitcoin": 1.0, "cryptocurrenc*": 1.0, "cricket score": 1.0, "rules of cricket": 1.0,
+            "movie recommendation*": 1.0, "recommend a movie": 1.0, "song lyrics": 1.0, "tell me a joke": 1.0,
+            "horoscope": 1.0, "solve this equation": 1.0, "cheap flights": 1.0,
+        },
+        GENERAL: {
+            "symptoms of": 1.0, "symptom of": 1.0, "signs of": 1.0, "sign of": 1.0, "warning signs": 1.0,
+            "causes of": 1.0, "cause of": 1.0, "what causes": 1.0, "risk of": 1.0, "risk factors": 1.0,
+            "how to prevent": 1.0, "prevention of": 1.0, "difference between": 1.0, "what is a": 1.0,
+            "what is the": 1.0, "what are the": 1.0, "how do you know": 1.0, "how to recognise": 1.0,
+            "how to recognize": 1.0, "first aid for": 1.0, "explain": 1.0,
+        },
+        PERSONAL: {
+            "i have": 1.0, "i ve": 1.0, "i m": 1.0, "i am": 1.0, "i feel": 1.0, "i felt": 1.0, "i just": 1.0,
+            "my": 1.0, "he has": 1.0, "she has": 1.0, "he is": 1.0, "she is": 1.0, "he s": 1.0, "she s": 1.0,
+            "right now": 1.0, "suddenly": 1.0,
+        },
+    },
+    "Hindi": {
+        EMERGENCY: {
+            "सीने में तेज दर्द": 1.0, "सीने में तेज़ दर्द": 1.0, "दिल का दौरा पड़": 1.0, "दिल का दौरा": 0.5, "सांस नहीं ले पा": 1.0,
+            "साँस नहीं ले पा": 1.0, "सांस नहीं आ रही": 1.0, "साँस नहीं आ रही": 1.0, "बेहोश": 1.0, "लकवा": 1.0,
+            "आत्महत्या": 1.0, "खुद को मार": 1.0, "मरना चाहता": 1.0, "मरना चाहती": 1.0, "ज़हर खा": 1.0,
+            "जहर खा": 1.0, "दौरा पड़": 1.0, "खून की उल्टी": 1.0, "बहुत खून बह": 1.0, "खून नहीं रुक": 1.0,
+            "सांप ने काट": 1.0, "साँप ने काट": 1.0, "मुंह टेढ़ा": 1.0,
+            "सीने में दर्द": 0.5, "छाती में दर्द": 0.5, "बाएं हाथ": 0.5, "बाएँ हाथ": 0.5, "बाईं बांह": 0.5,
+            "सांस लेने में तकलीफ": 0.5, "साँस लेने में तकलीफ": 0.5, "सांस फूल": 0.5, "साँस फूल": 0.5,
+            "पसीना": 0.5, "जबड़े में दर्द": 0.5,
+            "कीटनाशक": 1.0, "चूहे मारने": 1.0, "ज़हर पी": 1.0, "जहर पी": 1.0, "तेजाब पी": 1.0, "तेज़ाब पी": 1.0,
+            "सारी गोलियां खा": 1.0, "सारी गोलियाँ खा": 1.0, "ज़्यादा गोलियां खा": 1.0, "ज्यादा गोलियां खा": 1.0,
+            "नींद की गोलियां": 0.5, "नींद की गोलियाँ": 0.5, "गोलियां खा ली": 0.5, "गोलियाँ खा ली": 0.5,
+            "होश में नहीं": 1.0, "होश नहीं": 1.0, "जाग नहीं रह": 1.0, "उठ नहीं रह": 0.5, "जवाब नहीं दे रह": 0.5,
+            "गिर पड़": 0.5, "होंठ नीले": 1.0, "सीने में बहुत दर्द": 0.5, "हाथ सुन्न": 0.5, "बांह सुन्न": 0.5,
+            "जीना नहीं चाहत": 1.0,
+        },
+        MEDICAL: {
+            "दर्द": 1.0, "बुखार": 1.0, "खांसी": 1.0, "खाँसी": 1.0, "सर्दी": 1.0, "जुकाम": 1.0, "दवा": 1.0, "डॉक्टर": 1.0,
+            "बीमार": 1.0, "इलाज": 1.0, "लक्षण": 1.0, "स्वास्थ्य": 1.0, "सेहत": 1.0, "पेट": 1.0, "सिर": 1.0, "उल्टी": 1.0,
+            "दस्त": 1.0, "मधुमेह": 1.0, "शुगर": 1.0, "रक्तचाप": 1.0, "बीपी": 1.0, "खून": 1.0, "त्वचा": 1.0, "गले में": 1.0,
+            "गला": 1.0, "चोट": 1.0, "संक्रमण": 1.0, "गर्भ": 1.0, "नींद": 1.0, "तनाव": 1.0, "चिंता": 1.0, "वजन": 1.0,
+            "वज़न": 1.0, "कमजोरी": 1.0, "कमज़ोरी": 1.0, "थकान": 1.0, "एलर्जी": 1.0, "अस्पताल": 1.0, "दिल की": 1.0,
+            "दिल का": 1.0, "दिल में": 1.0, "सांस": 1.0, "साँस": 1.0, "पानी पी": 1.0, "विटामिन": 1.0, "व्यायाम": 1.0,
+            "कैंसर": 1.0, "कीमो": 1.0, "धड़कन": 1.0, "थायराइड": 1.0, "दमा": 1.0, "टीबी": 1.0, "मलेरिया": 1.0,
+            "डेंगू": 1.0, "पीलिया": 1.0, "मरीज": 1.0, "मरीज़": 1.0, "पर्चा": 1.0, "पर्चे": 1.0, "पर्ची": 1.0,
+            "इंजेक्शन": 1.0, "टीका": 1.0, "टीके": 1.0, "गोली": 1.0, "सिरप": 1.0, "ऑपरेशन": 1.0, "नवजात": 1.0,
+            "शिशु": 1.0, "बच्चे": 1.0, "बच्चा": 1.0, "बुजुर्ग": 1.0, "बुज़ुर्ग": 1.0,
+        },
+        OFF_TOPIC: {
+            "कविता लिख": 1.0, "कहानी लिख": 1.0, "निबंध लिख": 1.0, "चुटकुला": 1.0, "चुटकुले": 1.0,
+            "शेयर बाजार": 1.0, "शेयर बाज़ार": 1.0, "क्रिकेट स्कोर": 1.0, "गाने के बोल": 1.0, "राशिफल": 1.0,
+        },
+        GENERAL: {
+            "के लक्षण": 1.0, "के संकेत": 1.0, "के कारण": 1.0, "क्या होता है": 1.0, "क्या होते हैं": 1.0,
+            "से बचाव": 1.0, "कैसे बचें": 1.0, "में अंतर": 1.0, "में फर्क": 1.0, "में फ़र्क": 1.0,
+        },
+        PERSONAL: {
+            "मुझे": 1.0, "मेरे": 1.0, "मेरा": 1.0, "मेरी": 1.0, "मैं": 1.0, "उन्हें": 1.0, "उसे": 1.0, "अभी": 1.0,
+            "अचानक": 1.0,
+        },
+    },
+    "Bengali": {
+        EMERGENCY: {
+            "হার্ট অ্যাটাক হয়েছে": 1.0, "হার্ট অ্যাটাক হচ্ছে": 1.0, "শ্বাস নিতে পারছি না": 1.0, "শ্বাস নিতে পারছে না": 1.0, "অজ্ঞান": 1.0,
+            "আত্মহত্যা": 1.0, "মরে যেতে চাই": 1.0, "বিষ খে": 1.0, "স্ট্রোক হয়েছে": 1.0, "খিঁচুনি": 1.0,
+            "রক্ত বমি": 1.0, "প্রচুর রক্তপাত": 1.0, "রক্ত বন্ধ হচ্ছে না": 1.0, "সাপে কামড়": 1.0,
+            "বুকে তীব্র ব্যথা": 1.0, "মুখ বেঁকে": 1.0,
+            "বুকে ব্যথা": 0.5, "বুকে চাপ": 0.5, "বাম হাতে": 0.5, "বাঁ হাতে": 0.5, "শ্বাসকষ্ট": 0.5,
+            "শ্বাস নিতে কষ্ট": 0.5, "ঘাম": 0.5, "চোয়ালে ব্যথা": 0.5, "স্ট্রোক": 0.5, "হার্ট অ্যাটাক": 0.5,
+            "ইঁদুর মারার বিষ": 1.0, "কীটনাশক": 1.0, "অনেক ওষুধ খে": 1.0, "অনেকগুলো ওষুধ": 1.0, "ঘুমের ওষুধ": 0.5,
+            "খেয়ে ফেলেছ": 0.5, "সাড়া দিচ্ছে না": 1.0, "সাড়া দিচ্ছেন না": 1.0, "জ্ঞান হারিয়ে": 1.0,
+            "জ্ঞান ফিরছে না": 1.0, "ঘুম ভাঙছে না": 1.0, "পড়ে গেছ": 0.5, "ঠোঁট নীল": 1.0, "বুকে প্রচণ্ড ব্যথা": 1.0,
+            "হাত অবশ": 0.5, "বাঁচতে চাই না": 1.0,
+        },
+        MEDICAL: {
+            "ব্যথা": 1.0, "জ্বর": 1.0, "কাশি": 1.0, "সর্দি": 1.0, "ওষুধ": 1.0, "ডাক্তার": 1.0, "অসুখ": 1.0, "অসুস্থ": 1.0,
+            "রোগ": 1.0, "চিকিৎসা": 1.0, "লক্ষণ": 1.0, "উপসর্গ": 1.0, "স্বাস্থ্য": 1.0, "পেট": 1.0, "মাথা": 1.0, "বমি": 1.0,
+            "ডায়রিয়া": 1.0, "পাতলা পায়খানা": 1.0, "ডায়াবেটিস": 1.0, "সুগার": 1.0, "রক্তচাপ": 1.0, "প্রেসার": 1.0,
+            "রক্ত": 1.0, "ত্বক": 1.0, "গলা": 1.0, "আঘাত": 1.0, "সংক্রমণ": 1.0, "গর্ভ": 1.0, "ঘুম": 1.0, "মানসিক চাপ": 1.0,
+            "দুশ্চিন্তা": 1.0, "ওজন": 1.0, "দুর্বল": 1.0, "ক্লান্ত": 1.0, "অ্যালার্জি": 1.0, "হাসপাতাল": 1.0, "হৃদ": 1.0,
+            "শ্বাস": 1.0, "জল খা": 1.0, "পানি খা": 1.0, "ভিটামিন": 1.0, "ব্যায়াম": 1.0,
+            "ক্যান্সার": 1.0, "কেমো": 1.0, "হার্ট": 1.0, "থাইরয়েড": 1.0, "হাঁপানি": 1.0, "যক্ষ্মা": 1.0,
+            "ম্যালেরিয়া": 1.0, "ডেঙ্গু": 1.0, "জন্ডিস": 1.0, "রোগী": 1.0, "প্রেসক্রিপশন": 1.0, "ইনজেকশন": 1.0,
+            "টিকা": 1.0, "ট্যাবলেট": 1.0, "সিরাপ": 1.0, "অপারেশন": 1.0, "নবজাতক": 1.0, "শিশু": 1.0,
+            "বাচ্চা": 1.0, "বয়স্ক": 1.0,
+        },
+        OFF_TOPIC: {
+            "কবিতা লিখ": 1.0, "গল্প লিখ": 1.0, "রচনা লিখ": 1.0, "কৌতুক": 1.0, "জোকস": 1.0,
+            "শেয়ার বাজার": 1.0, "ক্রিকেট স্কোর": 1.0, "গানের কথা": 1.0, "রাশিফল": 1.0,
+        },
+        GENERAL: {
+            "লক্ষণ কী": 1.0, "লক্ষণগুলো": 1.0, "এর লক্ষণ": 1.0, "কারণ কী": 1.0, "প্রতিরোধ": 1.0, "কীভাবে বুঝব": 1.0,
+            "পার্থক্য": 1.0,
+        },
+        PERSONAL: {
+            "আমার": 1.0, "আমি": 1.0, "আমাকে": 1.0, "ওর": 1.0, "ওনার": 1.0, "এখন": 1.0, "হঠাৎ": 1.0,
+        },
+    },
+}
+
+# Red flags a term list cannot express, as regexes over the normalized message: many pills taken at once
+# ("I took 30 sleeping pills"). A match counts as a strong emergency term.
+RED_FLAG_PATTERNS = {
+    "English": (
+        r"(?<!\w)(?:took|taken|swallowed|ate|popped)(?: \w+)?? (?:\d{2,}|a lot of|lots of|a bunch of|a handful of"
+        r"|all of|all (?:my|his|her|their|the)) (?:\w+ ){0,3}?(?:pills|tablets|capsules|meds)(?!\w)",
+    ),
+    "Hindi": (r"(?:\d{2,}|[०-९]{2,}) (?:\S+ ){0,3}?(?:गोलियां|गोलियाँ|गोली|टैबलेट) (?:\S+ )?खा",),
+    "Bengali": (r"(?:\d{2,}|[০-৯]{2,})\S* (?:\S+ ){0,3}?(?:ওষুধ|ট্যাবলেট|বড়ি)\S* খে",),
+}
+
+# Lexicon languages whose terms match whole words only
+WORD_LANGUAGES = {"English"}
+
+
+# --- Compiled tries ---
+
+def _trie_regex(terms):
+    """
+    Compiles terms into one regex shaped like their character trie, so that shared prefixes are
+    tested once and the alternation does not grow with the number of terms that start alike.
+
+    A term ending in "*" accepts any word characters after it. Where a term is also the prefix of
+    a longer one, the longer one is tried first.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term.rstrip("*"):
+            node = node.setdefault(char, {})
+        node["*" if term.endswith("*") else ""] = {}  # marks the end of a term
+
+    def render(node):
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char not in ("", "*")]
+        if "*" in node:
+            branches.append(r"\w*")
+        if "" in node:
+            branches.append("")
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    return render(trie)
+
+
+class Lexicon:
+    """
+    The compiled terms of one session language (its own lexicon plus the English one).
+
+    Attributes:
+        pattern (re.Pattern): Finds every term, longest first, in one pass over a normalized message.
+        red_flags (list): The compiled RED_FLAG_PATTERNS of the languages.
+        weights (dict): Exact term -> (kind, weight).
+        stems (dict): Stem of a "*" term -> (kind, weight).
+    """
+
+    def __init__(self, languages):
+        self.weights = {}
+        self.stems = {}
+        word_terms, plain_terms = [], []
+        for language in languages:
+            for kind, terms in LEXICONS[language].items():
+                for term, weight in terms.items():
+                    stem = term.endswith("*")
+                    normalized = normalize_prompt(term.rstrip("*"))
+                    (self.stems if stem else self.weights)[normalized] = (kind, weight)
+                    (word_terms if language in WORD_LANGUAGES else plain_terms).append(normalized + ("*" if stem else ""))
+        alternatives = []
+        if word_terms:
+            alternatives.append(r"(?<!\w)" + _trie_regex(word_terms) + r"(?!\w)")
+        if plain_terms:
+            alternatives.append(_trie_regex(plain_terms))
+        self.pattern = re.compile("|".join(alternatives))
+        self.red_flags = [re.compile(pattern) for language in languages for pattern in RED_FLAG_PATTERNS.get(language, ())]
+        self._stem_lengths = sorted({len(stem) for stem in self.stems}, reverse=True)
+
+    def lookup(self, match):
+        """Returns (kind, weight) for a matched text."""
+        found = self.weights.get(match)
+        if found is None:
+            for length in self._stem_lengths:
+                found = self.stems.get(match[:length])
+                if found is not None:
+                    break
+        return found
+
+
+@functools.cache
+def lexicon_for(language):
+    """Returns the Lexicon of a session language, compiled on first use; unknown languages get the English one."""
+    languages = ["English"] if language not in LEXICONS or language == "English" else [language, "English"]
+    return Lexicon(languages)
+
+
+# --- Classification ---
+
+class Triage:
+    """
+    The pre-filter's verdict on one user message.
+
+    Attributes:
+        category (str): EMERGENCY, OFF_TOPIC or MEDICAL.
+        scores (dict): Summed term weights per kind (see KINDS).
+        matches (tuple): The distinct terms found, for logging and tuning.
+    """
+
+    __slots__ = ("category", "scores", "matches")
+
+    def __init__(self, category, scores, matches):
+        self.category = category
+        self.scores = scores
+        self.matches = matches
+
+    @property
+    def emergency(self):
+        return self.category == EMERGENCY
+
+    @property
+    def off_topic(self):
+        return self.category == OFF_TOPIC
+
+    def __repr__(self):
+        return f"Triage({self.category!r}, {self.scores!r}, {self.matches!r})"
+
+
+def classify(text, language="English", refuse_off_topic=TRIAGE_REFUSE_OFF_TOPIC):
+    """
+    Sorts a user message into EMERGENCY, OFF_TOPIC or MEDICAL with the keyword lexicons, locally.
+
+    Args:
+        text (str): The user message.
+        language (str): The session language; selects the lexicon used next to the English one.
+        refuse_off_topic (bool): Whether OFF_TOPIC may be returned; otherwise such messages are MEDICAL.
+
+    Returns:
+        Triage: The verdict.
+    """
+    scores = dict.fromkeys(KINDS, 0.0)
+    if not TRIAGE_ENABLED:
+        return Triage(MEDICAL, scores, ())
+    lexicon = lexicon_for(language)
+    normalized = normalize_prompt(text)
+    matches = {}
+    for match in lexicon.pattern.finditer(normalized):
+        term = match.group()
+        if term not in matches:
+            matches[term] = lexicon.lookup(term)
+    for red_flag in lexicon.red_flags:
+        match = red_flag.search(normalized)
+        if match is not None:
+            matches[match.group()] = (EMERGENCY, 1.0)
+    strongest = dict.fromkeys(KINDS, 0.0)
+    for kind, weight in matches.values():
+        scores[kind] += weight
+        strongest[kind] = max(strongest[kind], weight)
+    general_question = scores[GENERAL] and not scores[PERSONAL]
+    if (strongest if general_question else scores)[EMERGENCY] >= TRIAGE_EMERGENCY_THRESHOLD:
+        category = EMERGENCY
+    elif (refuse_off_topic and strongest[OFF_TOPIC] >= TRIAGE_OFF_TOPIC_THRESHOLD
+          and not scores[MEDICAL] and not scores[EMERGENCY]):
+        category = OFF_TOPIC
+    else:
+        category = MEDICAL
+    return Triage(category, scores, tuple(matches))
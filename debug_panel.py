@@ -0,0 +1,101 @@
+import logging
+import os
+import time
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# --- Performance debug panel ---
+# Set SHOW_DEBUG_PANEL=1 to show per-turn timings and token counts in the sidebar
+SHOW_DEBUG_PANEL = os.getenv("SHOW_DEBUG_PANEL", "") == "1"
+# Set RERUN_PROFILE=1 to print the execution time of every script run
+RERUN_PROFILE = os.getenv("RERUN_PROFILE", "") == "1"
+
+if RERUN_PROFILE:
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+
+
+# --- Rerun profiler ---
+
+class RerunTimer:
+    """
+    Measures one run of a Streamlit script, from its creation to `finish`.
+
+    Streamlit re-executes the whole script on every interaction, so this time is paid on every click.
+    Runs that end early (e.g. through `st.rerun`) are not recorded.
+
+    Usage:
+        rerun_timer = RerunTimer("medical_chat_bot_ui.py")  # right after the imports
+        ...
+        rerun_timer.finish(engine.metrics)                 # last statement of the script
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.started = time.perf_counter()
+
+    def finish(self, metrics):
+        """Records the run in `metrics` (and prints it with RERUN_PROFILE=1)."""
+        seconds = time.perf_counter() - self.started
+        metrics.record_rerun(self.script, seconds)
+        st.session_state.last_rerun_seconds = seconds
+        if RERUN_PROFILE:
+            logger.info("%s ran in %.2f ms.", self.script, seconds * 1000)
+
+
+# --- Debug panel ---
+
+
+def render_debug_panel(metrics, trace):
+    """
+    Draws the latest turn's stage timings and token counts, and the process-wide percentiles, in the sidebar.
+
+    Args:
+        metrics (Metrics): The engine's aggregate metrics.
+        trace (TurnTrace or None): The session's latest turn.
+    """
+    if not SHOW_DEBUG_PANEL:
+        return
+    with st.sidebar.expander("Performance", expanded=True):
+        if trace is not None:
+            shared = ", shared an identical request in flight" if trace.coalesced else ""
+            st.caption(f"Last turn: {trace.outcome}, {trace.attempts} HTTP attempt(s){shared}")
+            st.dataframe(
+                {"stage": list(trace.spans), "ms": [round(seconds * 1000, 1) for seconds in trace.spans.values()]},
+                hide_index=True,
+            )
+            if trace.tokens:
+                st.caption("Tokens: " + ", ".join(f"{kind} {count}" for kind, count in trace.tokens.items()))
+            if trace.traffic["sent"]:
+                st.caption("Bytes: " + ", ".join(f"{kind} {count}" for kind, count in trace.traffic.items()))
+            if trace.context_tokens:
+                context = trace.context_tokens
+                st.caption(f"Context: sent ~{context['sent']} of ~{context['full']} tokens (saved ~{context['saved']})")
+        snapshot = metrics.snapshot()
+        stages = {stage: values for stage, values in snapshot["stages"].items() if values["count"]}
+        if stages:
+            st.caption("This process")
+            st.dataframe(
+                {
+                    "stage": list(stages),
+                    "count": [values["count"] for values in stages.values()],
+                    "p50 ms": [values["p50_ms"] for values in stages.values()],
+                    "p95 ms": [values["p95_ms"] for values in stages.values()],
+                    "p99 ms": [values["p99_ms"] for values in stages.values()],
+                },
+                hide_index=True,
+            )
+            st.caption("Tokens used: " + ", ".join(f"{kind} {count}" for kind, count in snapshot["tokens"].items()))
+            st.caption("Bytes: " + ", ".join(f"{kind} {count}" for kind, count in snapshot["traffic"].items()))
+            if snapshot["context_tokens"]["saved"]:
+                st.caption(f"Input tokens saved by the context window: ~{snapshot['context_tokens']['saved']}")
+            if snapshot["coalesced_turns"]:
+                st.caption(f"API calls saved by coalescing identical requests: {snapshot['coalesced_turns']}")
+        if "last_rerun_seconds" in st.session_state:
+            reruns = snapshot["reruns"]
+            st.caption(
+                f"Previous script run: {st.session_state.last_rerun_seconds * 1000:.2f} ms"
+                + "".join(f"; {script} p50 {values['p50_ms']} ms, p95 {values['p95_ms']} ms" for script, values in reruns.items())
+            )
@@ -0,0 +1,65 @@
+import streamlit as st
+
+# --- Chat history rendering ---
+HISTORY_PAGE_SIZE = 20  # messages shown by default; older ones are revealed a page at a time
+
+
+def _display_entries(messages, key):
+    """
+    Returns `(role_for_display, markdown)` for every message, prepared once per message.
+
+    Entries are memoized in the session per conversation and by message position (the history is
+    append-only), so a rerun only prepares the messages that were added since the previous one.
+    The last memoized Turn must still be the one at its position: a history reloaded from the
+    session store holds new Turn objects and starts over.
+
+    Args:
+        messages (Conversation): The chat history.
+        key (str or None): Identifies the conversation, e.g. its session id.
+    """
+    cache = st.session_state.get("history_display_cache")
+    if (cache is None or cache["key"] != key or len(cache["entries"]) > len(messages)
+            or (cache["entries"] and messages[len(cache["entries"]) - 1] is not cache["last"])):
+        # Another conversation, or the history was replaced (e.g. after a language change): start over
+        cache = st.session_state.history_display_cache = {"key": key, "entries": [], "last": None}
+    entries = cache["entries"]
+    for message in messages[len(entries):]:
+        # Streamlit's chat_message supports 'user' and 'assistant' roles
+        # We map 'model' role from Gemini to 'assistant' for display
+        entries.append(("assistant" if message.role == "model" else message.role, message.text))
+    if entries:
+        cache["last"] = messages[len(entries) - 1]
+    return entries
+
+
+def render_messages(messages, start=0, stop=None, key=None):
+    """Draws `messages[start:stop]` as chat bubbles; `key` identifies the conversation (see `_display_entries`)."""
+    for role_for_display, text in _display_entries(messages, key)[start:stop]:
+        with st.chat_message(role_for_display):
+            st.markdown(text)
+
+
+def render_history_page(messages, stop, older_label="Show older messages", page_size=None, key=None):
+    """
+    Draws the most recent messages of `messages[:stop]`, with a pager button for older ones.
+
+    Args:
+        messages (Conversation): The chat history.
+        stop (int): How many messages of the history to consider.
+        older_label (str): The pager button label.
+        page_size (int): Messages per page; defaults to HISTORY_PAGE_SIZE.
+        key (str or None): Identifies the conversation, e.g. its session id.
+    """
+    page_size = page_size or HISTORY_PAGE_SIZE
+    visible = st.session_state.get("history_visible_messages", page_size)
+    start = max(0, stop - visible)
+    if start > 0 and st.button(f"{older_label} ({start})", key="show_older_messages"):
+        st.session_state.history_visible_messages = visible + page_size
+        st.rerun()
+    render_messages(messages, start, stop, key)
+
+
+def reset_history_view():
+    """Forgets the pager position and memoized entries, e.g. when the chat is cleared."""
+    st.session_state.pop("history_visible_messages", None)
+    st.session_state.pop("history_display_cache", None)
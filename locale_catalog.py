@@ -0,0 +1,150 @@
+"""
+The UI strings of the multilingual bot, one JSON catalog per language in `locales/`.
+
+Catalogs are read when a session first needs their language and kept in a process-wide LRU, so
+startup time and memory do not grow with the number of languages shipped. To add a language, add
+`locales/<Language>.json` with every key of the reference catalog (English) and check it with:
+
+    python locale_catalog.py [--locales-dir DIR]
+
+Missing keys fall back to the reference catalog at runtime; the checker reports them (and unknown
+keys, empty strings and mismatched `{placeholders}`) and exits with status 1.
+"""
+import argparse
+import functools
+import json
+import os
+import string
+import sys
+from types import MappingProxyType
+
+# --- Configuration ---
+LOCALES_DIR = os.getenv("LOCALES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales"))
+# Languages whose catalogs stay loaded; sessions in other languages reread their file (about 0.1 ms)
+LOCALE_CACHE_SIZE = int(os.getenv("LOCALE_CACHE_SIZE", "8"))
+# The catalog every other one is checked against, and falls back to
+REFERENCE_LANGUAGE = "English"
+CATALOG_SUFFIX = ".json"
+
+
+# --- Catalogs ---
+
+@functools.cache
+def available_languages(locales_dir=None):
+    """
+    Lists the languages with a catalog, the reference language first, without reading the catalogs.
+
+    Returns:
+        tuple: Language names, as used in the catalog file names.
+    """
+    names = sorted(
+        entry.name[:-len(CATALOG_SUFFIX)]
+        for entry in os.scandir(locales_dir or LOCALES_DIR)
+        if entry.name.endswith(CATALOG_SUFFIX) and entry.is_file()
+    )
+    if REFERENCE_LANGUAGE in names:
+        names.remove(REFERENCE_LANGUAGE)
+        names.insert(0, REFERENCE_LANGUAGE)
+    return tuple(names)
+
+
+def read_catalog(language, locales_dir=None):
+    """
+    Reads one catalog file as it is, without caching or fallback.
+
+    Raises:
+        FileNotFoundError: If there is no catalog for `language`.
+        ValueError: If the file is not a JSON object of strings.
+    """
+    path = os.path.join(locales_dir or LOCALES_DIR, language + CATALOG_SUFFIX)
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    if not isinstance(catalog, dict) or not all(isinstance(value, str) for value in catalog.values()):
+        raise ValueError(f"{path}: a catalog must be a JSON object of strings")
+    return catalog
+
+
+@functools.lru_cache(maxsize=LOCALE_CACHE_SIZE)
+def load_catalog(language, locales_dir=None):
+    """
+    Returns the UI strings of `language`, loading its catalog on first use.
+
+    Keys missing from the catalog take the reference language's string. The result is shared by
+    every session of the process and therefore read-only.
+
+    Args:
+        language (str): A name from `available_languages()`.
+        locales_dir (str): Directory of the catalogs; defaults to LOCALES_DIR.
+
+    Returns:
+        Mapping: Key -> string.
+    """
+    catalog = read_catalog(language, locales_dir)
+    if language != REFERENCE_LANGUAGE:
+        catalog = {**load_catalog(REFERENCE_LANGUAGE, locales_dir), **catalog}
+    return MappingProxyType(catalog)
+
+
+# --- Validation ---
+
+def _placeholders(text):
+    return {field for _, field, _, _ in string.Formatter().parse(text) if field is not None}
+
+
+def validate_catalog(catalog, reference):
+    """
+    Compares a catalog with the reference catalog.
+
+    Returns:
+        list: Problems found, as human-readable strings; empty if the catalog is complete.
+    """
+    problems = [f"missing key {key!r}" for key in reference if key not in catalog]
+    problems += [f"unknown key {key!r}" for key in catalog if key not in reference]
+    for key, text in catalog.items():
+        if not text.strip():
+            problems.append(f"empty string for {key!r}")
+        elif key in reference:
+            try:
+                if _placeholders(text) != _placeholders(reference[key]):
+                    problems.append(f"placeholders of {key!r} differ from {REFERENCE_LANGUAGE}: "
+                                    f"{sorted(_placeholders(text))} != {sorted(_placeholders(reference[key]))}")
+            except ValueError as e:
+                problems.append(f"malformed placeholder in {key!r}: {e}")
+    return problems
+
+
+def validate_all(locales_dir=None):
+    """
+    Validates every catalog in `locales_dir` against the reference catalog.
+
+    Returns:
+        dict: Language -> list of problems, for the languages that have any.
+    """
+    reference = read_catalog(REFERENCE_LANGUAGE, locales_dir)
+    report = {}
+    for language in available_languages.__wrapped__(locales_dir):  # always rescan the directory
+        try:
+            problems = validate_catalog(read_catalog(language, locales_dir), reference)
+        except ValueError as e:  # includes JSONDecodeError
+            problems = [str(e)]
+        if problems:
+            report[language] = problems
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the locale catalogs for missing or inconsistent keys.")
+    parser.add_argument("--locales-dir", default=LOCALES_DIR)
+    args = parser.parse_args(argv)
+
+    report = validate_all(args.locales_dir)
+    for language, problems in report.items():
+        for problem in problems:
+            print(f"{language}: {problem}")
+    checked = len(available_languages.__wrapped__(args.locales_dir))
+    print(f"{checked} catalog(s) checked, {len(report)} with problems.")
+    return 1 if report else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,16 @@
+import functools
+
 import streamlit as st
-import requests
-import json
-import os
+
+from app_config import API_KEY_MISSING_MESSAGE, resolve_api_key
+from chat_engine import BackgroundLoop, ChatEngine, CollectingErrorReporter, TurnTrace
+from chat_engine.metrics import serve_metrics
+from chat_engine.session_store import SessionManager, open_session_store
+from chat_engine.triage import EMERGENCY
+from debug_panel import SHOW_DEBUG_PANEL, RerunTimer, render_debug_panel
+from history_view import HISTORY_PAGE_SIZE, render_history_page, render_messages
+
+rerun_timer = RerunTimer("medical_chat_bot_1.py")  # see RERUN_PROFILE in debug_panel.py
 
 #### TO EXECUTE streamlit run medical_chat_bot_1.py ######
 # --- Configuration ---
@@ -14,78 +23,42 @@ import os
 # export GEMINI_API_KEY="YOUR_ACTUAL_GEMINI_API_KEY" (Linux/macOS)
 # set GEMINI_API_KEY=YOUR_ACTUAL_GEMINI_API_KEY (Windows cmd)
 
-# Try to get API key from Streamlit secrets, then environment variable, then fallback
-if "GEMINI_API_KEY" in st.secrets:
-    # THIS IS THE CORRECTED LINE: Access by the key NAME "GEMINI_API_KEY"
-    API_KEY = st.secrets["GEMINI_API_KEY"]
-elif os.getenv("GEMINI_API_KEY"):
-    API_KEY = os.getenv("GEMINI_API_KEY")
-else:
-    API_KEY = "" # Fallback for local dev if not set via env var or secrets; will likely cause 403 error without a key.
-    st.error("API Key not found. Please set GEMINI_API_KEY in .streamlit/secrets.toml or as an environment variable.")
+# Try to get API key from Streamlit secrets, then environment variable, then fallback (resolved once per process).
+# Without a key the API answers 403.
+API_KEY = resolve_api_key()
+if not API_KEY:
+    st.error(API_KEY_MISSING_MESSAGE)
 
-API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key="
+# Render answers token-by-token as they are generated instead of waiting for the full response
+STREAM_RESPONSES = True
+# Shown while a turn waits for the process-wide rate limiter
+QUEUE_POSITION_MESSAGE = "Many people are asking questions right now. You are number {position} in line; your answer will start shortly."
 
-# --- Chatbot Logic (adapted for Streamlit) ---
 
-def call_gemini_api(messages_history):
-    """
-    Calls the Gemini API with the given chat history.
+@st.cache_resource
+def get_background_loop():
+    """Starts the event loop that runs the chat engine, once per server process."""
+    return BackgroundLoop()
 
-    Args:
-        messages_history (list): A list of messages in the format
-                                 [{'role': 'user', 'parts': [{text: '...'}]},
-                                  {'role': 'model', 'parts': [{text: '...'}]}]
-                                 This list should already contain the system prompt.
 
-    Returns:
-        str: The generated response from the Gemini model, or an error message.
-    """
-    if not API_KEY:
-        return "Error: API Key is missing. Please configure it."
-
-    payload = {
-        "contents": messages_history
-    }
-
-    try:
-        response = requests.post(
-            f"{API_URL}{API_KEY}",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(payload)
-        )
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-        result = response.json()
-
-        if result.get("candidates") and result["candidates"][0].get("content") and \
-           result["candidates"][0]["content"].get("parts") and \
-           result["candidates"][0]["content"]["parts"][0].get("text"):
-            return result["candidates"][0]["content"]["parts"][0]["text"]
-        else:
-            # More detailed error logging for debugging
-            st.error(f"Warning: Unexpected API response structure. Full response: {json.dumps(result, indent=2)}")
-            return "I'm sorry, I couldn't get a clear response from the medical assistant at this moment. Please try again."
-
-    except requests.exceptions.HTTPError as e:
-        error_msg = f"An HTTP error occurred: {e}. Response: {e.response.text}"
-        st.error(error_msg)
-        return "I'm experiencing a problem connecting to the medical assistant. Please ensure your API key is correct."
-    except requests.exceptions.ConnectionError as e:
-        error_msg = f"A connection error occurred: {e}. Please check your internet connection."
-        st.error(error_msg)
-        return "I couldn't connect to the internet. Please check your connection."
-    except requests.exceptions.Timeout as e:
-        error_msg = f"The request timed out: {e}. The medical assistant might be busy."
-        st.error(error_msg)
-        return "The request took too long. Please try again."
-    except requests.exceptions.RequestException as e:
-        error_msg = f"An unknown request error occurred: {e}."
-        st.error(error_msg)
-        return "An unexpected error occurred while communicating. Please try again."
-    except json.JSONDecodeError as e:
-        error_msg = f"Failed to parse the medical assistant's response (JSON error): {e}. Raw response: {response.text if 'response' in locals() else 'No response'}"
-        st.error(error_msg)
-        return "I received an unreadable response from the medical assistant. Please try again."
+@st.cache_resource
+def get_chat_engine():
+    """Creates the chat engine, with its pooled HTTP client and caches, once per server process."""
+    engine = ChatEngine(API_KEY)
+    serve_metrics(engine.metrics)  # Prometheus text at :$METRICS_PORT/metrics, if configured
+    return engine
+
+
+@st.cache_resource
+def get_session_manager():
+    """Opens the session store ($SESSION_STORE_URL), once per server process."""
+    return SessionManager(open_session_store())
+
+
+# Looked up once per script run; every lookup of a cached resource costs a hash of the function and its arguments
+engine = get_chat_engine()
+session_manager = get_session_manager()
+
 
 # --- Streamlit UI ---
 
@@ -123,43 +96,111 @@ You operate in two modes:
 * **Knowledge Boundaries**: Never Response if the question is not related to medical or health.
 """
 
-# Initialize chat history in Streamlit's session state
-# This is crucial for maintaining conversation across reruns of the script
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-    # Add the system prompt as the first message from the "user" role for the model's context
-    # followed by an initial message from the "model" for the user.
-    st.session_state.messages.append({"role": "user", "parts": [{"text": SYSTEM_PROMPT}]})
-    st.session_state.messages.append({"role": "model", "parts": [{"text": "Hello! I'm your Medical Assistant Bot. How can I help you today?"}]})
-
-
-# Display chat messages from history on app rerun
-# We skip the very first message (the system prompt) when displaying to the user
-for message in st.session_state.messages[1:]: # Start from index 1 to skip the initial system prompt
-    # Streamlit's chat_message supports 'user' and 'assistant' roles
-    # We map 'model' role from Gemini to 'assistant' for display
-    role_for_display = "assistant" if message["role"] == "model" else message["role"]
-    with st.chat_message(role_for_display):
-        st.markdown(message["parts"][0]["text"])
-
-# Accept user input
-if prompt := st.chat_input("Ask your medical question here..."):
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "parts": [{"text": prompt}]})
+def restore_chat_session(state):
+    """Creates an empty engine session for a stored conversation; the session manager adds its turns."""
+    return engine.new_session(SYSTEM_PROMPT, reporter=CollectingErrorReporter())
+
+
+def current_chat_session():
+    """
+    Returns the conversation named in the page URL, starting a new one if there is none.
+
+    Conversations live in the session store rather than in Streamlit's session state, so a reload,
+    a server restart or another replica continues the same chat, and idle chats leave memory.
+    """
+    session_id = st.query_params.get("session")
+    chat_session = session_manager.get(session_id, restore_chat_session) if session_id else None
+    if chat_session is None:
+        # The engine session holds the history, starting with an initial message from the "model" for the user.
+        # The system prompt is not part of the history; the engine sends it as systemInstruction.
+        chat_session = session_manager.add(engine.new_session(
+            SYSTEM_PROMPT,
+            greeting="Hello! I'm your Medical Assistant Bot. How can I help you today?",
+            reporter=CollectingErrorReporter(),
+        ))
+        st.query_params["session"] = chat_session.session_id
+    return chat_session
+
+
+chat_session = current_chat_session()
+
+
+# Display chat messages from history on app rerun.
+# Only the latest page is drawn; turns sent after this full run are drawn by the chat_turn fragment
+# below, so sending a message reruns just the fragment instead of re-emitting the whole transcript.
+st.session_state.history_rendered_upto = len(chat_session.messages)
+render_history_page(chat_session.messages, st.session_state.history_rendered_upto, key=chat_session.session_id)
+render_debug_panel(engine.metrics, chat_session.last_trace)
+
+
+def finish_turn(chat_session, turn):
+    """Runs in a worker thread once a background turn is done, even if the page was closed meanwhile."""
+    engine.metrics.record(turn.trace)
+    session_manager.save(chat_session)  # appends the new turns to the stored conversation
+
+
+@st.fragment
+def chat_turn():
+    """Draws the turns sent since the last full rerun and the answer being generated, and handles the next one."""
+    # Accept user input. The answer is generated on the background loop, so it goes on if this script run is
+    # interrupted; a new message cancels the answer still being generated for the previous one.
+    started = None
+    if prompt := st.chat_input("Ask your medical question here..."):
+        # The local pre-filter runs first: red-flag symptoms get emergency guidance now, not after the answer
+        trace = TurnTrace()
+        verdict = engine.triage(chat_session, prompt, trace)
+        if STREAM_RESPONSES:
+            answer = engine.stream(chat_session, prompt, trace, verdict)
+        else:
+            answer = engine.reply(chat_session, prompt, trace, verdict)
+        started = get_background_loop().start_turn(chat_session, prompt, answer, trace,
+                                                   on_done=functools.partial(finish_turn, chat_session))
+
+    # Follow the pending turn: the one just sent, or one still being generated when this run began
+    turn = chat_session.pending_turn
+    if turn is not None and turn.done and turn is not started:
+        turn = None
+    render_messages(chat_session.messages, st.session_state.history_rendered_upto, turn.history_length if turn is not None else None,
+                    key=chat_session.session_id)
+    if turn is None:
+        return
+
     # Display user message in chat message container
     with st.chat_message("user"):
-        st.markdown(prompt)
+        st.markdown(turn.prompt)
 
-    # Get bot response
+    # The engine adds both messages to the chat history once the answer is complete
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            # Pass the full conversation history to the API call
-            full_conversation_for_api = [
-                {"role": msg["role"], "parts": msg["parts"]}
-                for msg in st.session_state.messages
-            ]
-            bot_response = call_gemini_api(full_conversation_for_api)
-            st.markdown(bot_response)
-
-    # Add bot response to chat history
-    st.session_state.messages.append({"role": "model", "parts": [{"text": bot_response}]})
+        if turn.trace.triage == EMERGENCY:
+            st.error(chat_session.error_messages["emergency_banner"])
+        # Under load the turn may wait in the process-wide request queue; show its place in line meanwhile
+        queue_notice = st.empty()
+
+        def show_queue_position():
+            if chat_session.queue_position:
+                queue_notice.info(QUEUE_POSITION_MESSAGE.format(position=chat_session.queue_position))
+            else:
+                queue_notice.empty()
+
+        if STREAM_RESPONSES:
+            # write_stream renders chunks as they arrive; the time spent drawing them is the render span
+            st.write_stream(turn.trace.time_consumer(turn.follow(show_queue_position)))
+        else:
+            with st.spinner("Thinking..."):
+                bot_response = turn.wait(show_queue_position)
+                with turn.trace.span("render"):
+                    st.markdown(bot_response)
+        queue_notice.empty()
+        # The engine reports failures from its event loop; show them here, on the script thread
+        for error in chat_session.reporter.drain():
+            st.error(error)
+
+    # Fold the turns drawn by the fragment into the paged history once there are too many of them.
+    # The debug panel lives in the sidebar, outside the fragment, so it needs a full rerun to update.
+    if SHOW_DEBUG_PANEL or len(chat_session.messages) - st.session_state.history_rendered_upto > HISTORY_PAGE_SIZE:
+        st.rerun()
+
+
+chat_turn()
+
+rerun_timer.finish(engine.metrics)
@@ -1,161 +1,110 @@
+import functools
+
 import streamlit as st
-import requests
-import json
-import os
+
+from app_config import API_KEY_MISSING_MESSAGE, resolve_api_key
+from chat_engine import BackgroundLoop, ChatEngine, CollectingErrorReporter, TurnTrace
+from chat_engine.metrics import serve_metrics
+from chat_engine.prompts import get_system_prompt
+from chat_engine.session_store import SessionManager, open_session_store
+from chat_engine.triage import EMERGENCY
+from debug_panel import SHOW_DEBUG_PANEL, RerunTimer, render_debug_panel
+from history_view import HISTORY_PAGE_SIZE, render_history_page, render_messages, reset_history_view
+from locale_catalog import available_languages, load_catalog
+
+rerun_timer = RerunTimer("medical_chat_bot_ui_multilingual.py")  # see RERUN_PROFILE in debug_panel.py
 
 # --- Configuration ---
 # Your API key will be provided by the Canvas environment if left as an empty string.
 # IMPORTANT: For Streamlit Cloud, remember to set this as a secret in your app settings.
 # For local testing, ensure GEMINI_API_KEY is set in .streamlit/secrets.toml or as an environment variable.
-if "GEMINI_API_KEY" in st.secrets:
-    API_KEY = st.secrets["GEMINI_API_KEY"]
-elif os.getenv("GEMINI_API_KEY"):
-    API_KEY = os.getenv("GEMINI_API_KEY")
-else:
-    API_KEY = "" # Fallback for local dev if not set via env var or secrets; will cause 403 error without a key.
-    st.error("API Key not found. Please set GEMINI_API_KEY in .streamlit/secrets.toml or as an environment variable.")
-
-API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key="
-
-# --- Language Definitions ---
-LANGUAGE_MAP = {
-    "English": {
-        "model_instruction": "English",
-        "greeting": "Hello! I'm your online Doctor. How can I help you today?",
-        "disclaimer": "🚨 **Disclaimer:** I am an AI and cannot provide medical diagnoses, prescriptions, or professional medical advice. Always consult a qualified healthcare professional for any medical concerns.",
-        "placeholder": "Ask your medical question here...",
-        "thinking": "Thinking...",
-        "api_error_response": "I'm sorry, I couldn't get a clear response from the medical assistant at this moment. Please try again.",
-        "http_error": "I'm experiencing a problem connecting to the medical assistant. Please ensure your API key is correct.",
-        "connection_error": "I couldn't connect to the internet. Please check your connection.",
-        "timeout_error": "The request took too long. Please try again.",
-        "unknown_error": "An unexpected error occurred while communicating. Please try again.",
-        "json_error": "I received an unreadable response from the medical assistant. Please try again.",
-        "api_key_missing": "Error: API Key is missing. Please configure it."
-    },
-    "Hindi": {
-        "model_instruction": "Hindi",       
-        "greeting": "नमस्ते! मैं आपका मेडिकल असिस्टेंट बॉट हूँ। मैं आज आपकी कैसे मदद कर सकता हूँ?",
-        "disclaimer": "🚨: मैं एक AI हूँ और चिकित्सीय निदान, नुस्खे या पेशेवर चिकित्सीय सलाह प्रदान नहीं कर सकता। किसी भी चिकित्सीय चिंता के लिए हमेशा एक योग्य स्वास्थ्य पेशेवर से परामर्श करें।",
-        "placeholder": "यहां अपना चिकित्सीय प्रश्न पूछें...",
-        "thinking": "सोच रहा हूँ...",
-        "api_error_response": "क्षमा करें, मुझे इस समय मेडिकल असिस्टेंट से स्पष्ट प्रतिक्रिया नहीं मिल पाई। कृपया पुनः प्रयास करें।",
-        "http_error": "मुझे मेडिकल असिस्टेंट से कनेक्ट करने में समस्या आ रही है। कृपया सुनिश्चित करें कि आपकी API कुंजी सही है।",
-        "connection_error": "मैं इंटरनेट से कनेक्ट नहीं हो सका। कृपया अपना इंटरनेट कनेक्शन जांचें।",
-        "timeout_error": "अनुरोध में बहुत अधिक समय लगा। कृपया पुनः प्रयास करें।",
-        "unknown_error": "संचार करते समय एक अप्रत्याशित त्रुटि हुई। कृपया पुनः प्रयास करें।",
-        "json_error": "मुझे मेडिकल असिस्टेंट से एक अपठनीय प्रतिक्रिया मिली। कृपया पुनः प्रयास करें।",
-        "api_key_missing": "त्रुटि: API कुंजी गुम है। कृपया इसे कॉन्फ़िगर करें।"
-    },
-    "Bengali": {
-        "model_instruction": "Bengali",
-        "greeting": "নমস্কার! আমি আপনার মেডিকেল অ্যাসিস্ট্যান্ট বট। আমি আজ আপনাকে কীভাবে সাহায্য করতে পারি?",
-        "disclaimer": "🚨: আমি একটি AI এবং চিকিৎসার নির্ণয়, প্রেসক্রিপশন, বা পেশাদার চিকিৎসা পরামর্শ প্রদান করতে পারি না। যেকোনো চিকিৎসার জন্য সর্বদা একজন যোগ্য স্বাস্থ্যসেবা পেশাদারের সাথে পরামর্শ করুন।",
-        "placeholder": "এখানে আপনার চিকিৎসা প্রশ্ন জিজ্ঞাসা করুন...",
-        "thinking": "ভাবছি...",
-        "api_error_response": "দুঃখিত, এই মুহূর্তে আমি মেডিকেল অ্যাসিস্ট্যান্টের কাছ থেকে স্পষ্ট প্রতিক্রিয়া পেতে পারিনি। অনুগ্রহ করে আবার চেষ্টা করুন।",
-        "http_error": "মেডিকেল অ্যাসিস্ট্যান্টের সাথে সংযোগ করতে সমস্যা হচ্ছে। অনুগ্রহ করে নিশ্চিত করুন আপনার API কী সঠিক।",
-        "connection_error": "আমি ইন্টারনেটের সাথে সংযোগ করতে পারিনি। অনুগ্রহ করে আপনার ইন্টারনেট সংযোগ পরীক্ষা করুন।",
-        "timeout_error": "অনুরোধটি সম্পূর্ণ হতে অনেক বেশি সময় লেগেছে। অনুগ্রহ করে আবার চেষ্টা করুন।",
-        "unknown_error": "যোগাযোগ করার সময় একটি অপ্রত্যাশিত ত্রুটি ঘটেছে। অনুগ্রহ করে আবার চেষ্টা করুন।",
-        "json_error": "মেডিকেল অ্যাসিস্ট্যান্টের কাছ থেকে একটি অপাঠ্য প্রতিক্রিয়া পেয়েছি। অনুগ্রহ করে আবার চেষ্টা করুন।",
-        "api_key_missing": "ত্রুটি: API কী অনুপস্থিত। অনুগ্রহ করে এটি কনফিগার করুন।"
-    }
-}
-
-# --- System Prompt Generation ---
-def get_system_prompt(language_code):
-    """Generates the dynamic system prompt based on the selected language."""
-    # The core prompt structure remains the same, but we instruct the model
-    # to respond in the chosen language.
-    return f"""
-    You are a highly intelligent and compassionate Medical Assistant Bot. Your primary goal is to provide accurate, helpful, and context-specific medical guidance while always prioritizing user safety and advising professional consultation.
-    The user will interact with you in {language_code}, and you **MUST** respond entirely in {language_code}. Also, you should try to understand the user's prompt even if it's in {language_code}.
-
-    You operate in two modes:
-
-    1.  **General Medical Assistant**:
-        * **Purpose**: To address common health concerns, provide general well-being advice, offer preliminary information about mild symptoms, and answer simple health-related inquiries.
-        * **Tone**: Friendly, informative, and reassuring.
-        * **Examples**: "What are good ways to stay hydrated?", "I have a common cold, what can I do?", "What's the recommended daily intake of Vitamin C?"
-
-    2.  **Specialist Medical Advisor**:
-        * **Purpose**: To handle advanced, complex, or highly specific medical queries requiring in-depth knowledge in a particular medical field (e.g., cardiology, neurology, oncology, pharmacology). This mode is triggered by detailed symptom descriptions, questions about specific diseases, drug interactions, or when the user explicitly asks for specialist advice.
-        * **Tone**: Professional, precise, and highly detailed.
-        * **Examples**: "I have persistent chest pain radiating to my left arm and shortness of breath, what could be the possible causes?", "Tell me about the latest non-surgical treatments for spinal stenosis.", "What are the contraindications for patients with kidney disease taking Metformin?", "Can you explain the mechanism of action of SSRIs?"
-
-    **Instructions for Dynamic Role Switching:**
-
-    * **Default Mode**: Begin every conversation implicitly as a **General Medical Assistant**.
-    * **Switching to Specialist**: Analyze the user's query for keywords, detail, and complexity. If the query is detailed, highly specific, involves complex medical terminology, discusses severe symptoms, asks about specific diseases, drug interactions, or requests in-depth medical analysis, **switch to Specialist Medical Advisor mode for that response.**
-    * **Acknowledging Specialist Mode**: When you switch to and respond as a **Specialist Medical Advisor**, explicitly state it at the beginning of your response. For example: "As a Specialist Medical Advisor, based on your description,..." or "In my capacity as a Specialist Medical Advisor, I can explain that..."
-    * **Always Disclaim**: Regardless of the mode, **ALWAYS** include a disclaimer at the end of every response reminding the user that you are an AI and cannot provide professional medical diagnosis or treatment. **Strongly advise them to consult a qualified healthcare professional for any medical concerns.**
-    * **Maintain Context**: Use the chat history to understand the ongoing conversation and provide relevant follow-up.
-    * **Clarity and Brevity**: Provide clear, concise, and easy-to-understand information. Avoid medical jargon where simpler terms suffice, but use precise terminology when acting as a specialist.
-    * **Ethical Boundaries**: Never give a definitive diagnosis, prescribe medication, or tell the user to stop taking medication. Never encourage self-treatment for serious conditions.
-    """
+# The key is resolved once per process; without one the API answers 403.
+API_KEY = resolve_api_key()
+if not API_KEY:
+    st.error(API_KEY_MISSING_MESSAGE)
 
-# --- Chatbot Logic (adapted for Streamlit) ---
+# Render answers token-by-token as they are generated instead of waiting for the full response
+STREAM_RESPONSES = True
+
+
+@st.cache_resource
+def get_background_loop():
+    """Starts the event loop that runs the chat engine, once per server process."""
+    return BackgroundLoop()
+
+
+@st.cache_resource
+def get_chat_engine():
+    """Creates the chat engine, with its pooled HTTP client and caches, once per server process."""
+    engine = ChatEngine(API_KEY)
+    serve_metrics(engine.metrics)  # Prometheus text at :$METRICS_PORT/metrics, if configured
+    return engine
+
+
+@st.cache_resource
+def get_session_manager():
+    """Opens the session store ($SESSION_STORE_URL), once per server process."""
+    return SessionManager(open_session_store())
 
-def call_gemini_api(messages_history, current_language_settings):
-    """
-    Calls the Gemini API with the given chat history.
 
-    Args:
-        messages_history (list): A list of messages for the Gemini API.
-        current_language_settings (dict): Language-specific settings for error messages.
+# Looked up once per script run; every lookup of a cached resource costs a hash of the function and its arguments
+engine = get_chat_engine()
+session_manager = get_session_manager()
 
-    Returns:
-        str: The generated response from the Gemini model, or an error message.
+
+# --- Conversation storage ---
+# Conversations live in the session store rather than in Streamlit's session state, keyed by the id in
+# the page URL, so a reload, a server restart or another replica continues the same chat in the same
+# language, and idle chats leave memory.
+
+def restore_chat_session(state):
+    """
+    Creates an empty engine session for a stored conversation; the session manager adds its turns.
+
+    A conversation stored without a language gets the default one here, and the language picker is shown for it.
     """
-    if not API_KEY:
-        return current_language_settings["api_key_missing"]
-
-    payload = {
-        "contents": messages_history
-    }
-
-    try:
-        response = requests.post(
-            f"{API_URL}{API_KEY}",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(payload)
-        )
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-        result = response.json()
-
-        if result.get("candidates") and result["candidates"][0].get("content") and \
-           result["candidates"][0]["content"].get("parts") and \
-           result["candidates"][0]["content"]["parts"][0].get("text"):
-            return result["candidates"][0]["content"]["parts"][0]["text"]
-        else:
-            st.error(f"Warning: Unexpected API response structure. Full response: {json.dumps(result, indent=2)}")
-            return current_language_settings["api_error_response"]
-
-    except requests.exceptions.HTTPError as e:
-        st.error(f"An HTTP error occurred: {e}. Response: {e.response.text}")
-        return current_language_settings["http_error"]
-    except requests.exceptions.ConnectionError as e:
-        st.error(f"A connection error occurred: {e}")
-        return current_language_settings["connection_error"]
-    except requests.exceptions.Timeout as e:
-        st.error(f"The request timed out: {e}")
-        return current_language_settings["timeout_error"]
-    except requests.exceptions.RequestException as e:
-        st.error(f"An unknown request error occurred: {e}")
-        return current_language_settings["unknown_error"]
-    except json.JSONDecodeError as e:
-        st.error(f"Failed to parse the response (JSON error): {e}. Raw response: {response.text if 'response' in locals() else 'No response'}")
-        return current_language_settings["json_error"]
+    language_settings = load_catalog(state.get("selected_language") or available_languages()[0])
+    return engine.new_session(
+        get_system_prompt(language_settings["model_instruction"]),
+        language=language_settings["model_instruction"],
+        error_messages=language_settings,
+        reporter=CollectingErrorReporter(),
+    )
+
+
+def start_chat_session(language):
+    """Starts and stores a conversation in `language` and puts its id in the page URL."""
+    language_settings = load_catalog(language)
+    # Start the conversation with language-specific content: the engine session holds the history,
+    # starting with the initial greeting from the model. The system prompt is not part of the
+    # history; the engine sends it as systemInstruction.
+    chat_session = engine.new_session(
+        get_system_prompt(language_settings["model_instruction"]),
+        language=language_settings["model_instruction"],
+        greeting=language_settings["greeting"] + "\n\n" + language_settings["disclaimer"],
+        error_messages=language_settings,
+        reporter=CollectingErrorReporter(),
+    )
+    chat_session.state["selected_language"] = language
+    session_manager.add(chat_session)
+    st.query_params["session"] = chat_session.session_id
+    return chat_session
+
+
+def stored_chat_session():
+    """Returns the conversation named in the page URL, or None."""
+    session_id = st.query_params.get("session")
+    return session_manager.get(session_id, restore_chat_session) if session_id else None
 
 
 # --- Streamlit UI ---
 
 # st.set_page_config(page_header="Online Doctor", page_icon="🩺", layout="centered")
 
-# Initialize selected_language in session state
+# Initialize selected_language in session state, from the stored conversation if the URL names one
 if "selected_language" not in st.session_state:
-    st.session_state.selected_language = None
+    stored = stored_chat_session()
+    st.session_state.selected_language = stored.state.get("selected_language") if stored else None
 
 # Show language selection if not already selected
 if st.session_state.selected_language is None:
@@ -165,23 +114,18 @@ if st.session_state.selected_language is None:
     # Using radio buttons for language selection
     selected_lang_display = st.radio(
         "Choose Language",
-        list(LANGUAGE_MAP.keys()),
+        available_languages(),  # from the catalog file names; catalogs are loaded per selected language
         index=0, # Default to English
         horizontal=True
     )
 
     if st.button("Start Chat"):
         st.session_state.selected_language = selected_lang_display
-        # Initialize chat history with language-specific content
-        st.session_state.messages = []
-        # Add the system prompt first
-        st.session_state.messages.append({"role": "user", "parts": [{"text": get_system_prompt(LANGUAGE_MAP[st.session_state.selected_language]["model_instruction"])}]})
-        # Add the initial greeting from the model
-        st.session_state.messages.append({"role": "model", "parts": [{"text": LANGUAGE_MAP[st.session_state.selected_language]["greeting"] + "\n\n" + LANGUAGE_MAP[st.session_state.selected_language]["disclaimer"]}]})
+        start_chat_session(selected_lang_display)
         st.rerun() # Rerun the app to show the chat interface
 else:
     # Language is selected, display the chat interface
-    current_lang_settings = LANGUAGE_MAP[st.session_state.selected_language]
+    current_lang_settings = load_catalog(st.session_state.selected_language)
 
     col1, col2 = st.columns([0.8, 0.2])
     with col1:
@@ -189,37 +133,92 @@ else:
     with col2:
         if st.button("Change Language", key="change_lang_button"):
             st.session_state.selected_language = None
-            st.session_state.messages = [] # Clear messages on language change
+            # Clear the conversation on language change, stopping an answer still being generated for it
+            stored = stored_chat_session()
+            if stored is not None and stored.pending_turn is not None:
+                stored.pending_turn.cancel()
+            session_manager.discard(st.query_params["session"])
+            del st.query_params["session"]
+            reset_history_view()
             st.rerun()
 
     st.write(current_lang_settings["disclaimer"])
 
-    # Display chat messages from history on app rerun
-    # We skip the very first message (the system prompt) when displaying to the user
-    for message in st.session_state.messages[1:]: # Start from index 1 to skip the initial system prompt
-        role_for_display = "assistant" if message["role"] == "model" else message["role"]
-        with st.chat_message(role_for_display):
-            st.markdown(message["parts"][0]["text"])
-
-    # Accept user input
-    if prompt := st.chat_input(current_lang_settings["placeholder"]):
-        # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "parts": [{"text": prompt}]})
+    # Display chat messages from history on app rerun.
+    # Only the latest page is drawn; turns sent after this full run are drawn by the chat_turn fragment
+    # below, so sending a message reruns just the fragment instead of re-emitting the whole transcript.
+    # A conversation that expired from the store while the page was open starts over
+    chat_session = stored_chat_session() or start_chat_session(st.session_state.selected_language)
+    st.session_state.history_rendered_upto = len(chat_session.messages)
+    render_history_page(chat_session.messages, st.session_state.history_rendered_upto,
+                        older_label=current_lang_settings["show_older_messages"], key=chat_session.session_id)
+    render_debug_panel(engine.metrics, chat_session.last_trace)
+
+    def finish_turn(chat_session, turn):
+        """Runs in a worker thread once a background turn is done, even if the page was closed meanwhile."""
+        engine.metrics.record(turn.trace)
+        session_manager.save(chat_session)  # appends the new turns to the stored conversation
+
+    @st.fragment
+    def chat_turn():
+        """Draws the turns sent since the last full rerun and the answer being generated, and handles the next one."""
+        # Accept user input. The answer is generated on the background loop, so it goes on if this script run is
+        # interrupted; a new message cancels the answer still being generated for the previous one.
+        started = None
+        if prompt := st.chat_input(current_lang_settings["placeholder"]):
+            # The local pre-filter runs first: red-flag symptoms get emergency guidance now, not after the answer
+            trace = TurnTrace()
+            verdict = engine.triage(chat_session, prompt, trace)
+            if STREAM_RESPONSES:
+                answer = engine.stream(chat_session, prompt, trace, verdict)
+            else:
+                answer = engine.reply(chat_session, prompt, trace, verdict)
+            started = get_background_loop().start_turn(chat_session, prompt, answer, trace,
+                                                       on_done=functools.partial(finish_turn, chat_session))
+
+        # Follow the pending turn: the one just sent, or one still being generated when this run began
+        turn = chat_session.pending_turn
+        if turn is not None and turn.done and turn is not started:
+            turn = None
+        render_messages(chat_session.messages, st.session_state.history_rendered_upto, turn.history_length if turn is not None else None,
+                        key=chat_session.session_id)
+        if turn is None:
+            return
+
         # Display user message in chat message container
         with st.chat_message("user"):
-            st.markdown(prompt)
+            st.markdown(turn.prompt)
 
-        # Get bot response
+        # The engine adds both messages to the chat history once the answer is complete
         with st.chat_message("assistant"):
-            with st.spinner(current_lang_settings["thinking"]):
-                # Pass the full conversation history to the API call
-                full_conversation_for_api = [
-                    {"role": msg["role"], "parts": msg["parts"]}
-                    for msg in st.session_state.messages
-                ]
-                bot_response = call_gemini_api(full_conversation_for_api, current_lang_settings)
-                st.markdown(bot_response)
-
-        # Add bot response to chat history
-        st.session_state.messages.append({"role": "model", "parts": [{"text": bot_response}]})
+            if turn.trace.triage == EMERGENCY:
+                st.error(chat_session.error_messages["emergency_banner"])
+            # Under load the turn may wait in the process-wide request queue; show its place in line meanwhile
+            queue_notice = st.empty()
+
+            def show_queue_position():
+                if chat_session.queue_position:
+                    queue_notice.info(current_lang_settings["queue_position"].format(position=chat_session.queue_position))
+                else:
+                    queue_notice.empty()
+
+            if STREAM_RESPONSES:
+                # write_stream renders chunks as they arrive; the time spent drawing them is the render span
+                st.write_stream(turn.trace.time_consumer(turn.follow(show_queue_position)))
+            else:
+                with st.spinner(current_lang_settings["thinking"]):
+                    bot_response = turn.wait(show_queue_position)
+                    with turn.trace.span("render"):
+                        st.markdown(bot_response)
+            queue_notice.empty()
+            # The engine reports failures from its event loop; show them here, on the script thread
+            for error in chat_session.reporter.drain():
+                st.error(error)
+
+        # Fold the turns drawn by the fragment into the paged history once there are too many of them.
+        # The debug panel lives in the sidebar, outside the fragment, so it needs a full rerun to update.
+        if SHOW_DEBUG_PANEL or len(chat_session.messages) - st.session_state.history_rendered_upto > HISTORY_PAGE_SIZE:
+            st.rerun()
+    chat_turn()
 
+rerun_timer.finish(engine.metrics)